@@ -0,0 +1,165 @@
+"""Checked-in screenshot corpus for the offline benchmarks.
+
+The PNGs in benchmarks/corpus/ are rendered by this module with a 5x7 bitmap
+font and only the standard library, so they can be regenerated anywhere:
+
+    python -m benchmarks.corpus
+
+manifest.json records the text drawn on every image, which the fake Vision
+client returns as canned annotations, and the detection mode 'auto' must pick
+for it: screenshots are sparse text, the page is a dense document.
+"""
+import json
+import os
+import struct
+import zlib
+from typing import Dict, List, Tuple
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+MANIFEST_PATH = os.path.join(CORPUS_DIR, 'manifest.json')
+
+# Classic 5x7 font: five column bytes per glyph, least significant bit at the top
+FONT = {
+    ' ': (0x00, 0x00, 0x00, 0x00, 0x00), '-': (0x08, 0x08, 0x08, 0x08, 0x08),
+    '.': (0x00, 0x60, 0x60, 0x00, 0x00), ':': (0x00, 0x36, 0x36, 0x00, 0x00),
+    '0': (0x3E, 0x51, 0x49, 0x45, 0x3E), '1': (0x00, 0x42, 0x7F, 0x40, 0x00),
+    '2': (0x42, 0x61, 0x51, 0x49, 0x46), '3': (0x21, 0x41, 0x45, 0x4B, 0x31),
+    '4': (0x18, 0x14, 0x12, 0x7F, 0x10), '5': (0x27, 0x45, 0x45, 0x45, 0x39),
+    '6': (0x3C, 0x4A, 0x49, 0x49, 0x30), '7': (0x01, 0x71, 0x09, 0x05, 0x03),
+    '8': (0x36, 0x49, 0x49, 0x49, 0x36), '9': (0x06, 0x49, 0x49, 0x29, 0x1E),
+    'A': (0x7C, 0x12, 0x11, 0x12, 0x7C), 'B': (0x7F, 0x49, 0x49, 0x49, 0x36),
+    'C': (0x3E, 0x41, 0x41, 0x41, 0x22), 'D': (0x7F, 0x41, 0x41, 0x22, 0x1C),
+    'E': (0x7F, 0x49, 0x49, 0x49, 0x41), 'F': (0x7F, 0x09, 0x09, 0x09, 0x01),
+    'G': (0x3E, 0x41, 0x49, 0x49, 0x7A), 'H': (0x7F, 0x08, 0x08, 0x08, 0x7F),
+    'I': (0x00, 0x41, 0x7F, 0x41, 0x00), 'J': (0x20, 0x40, 0x41, 0x3F, 0x01),
+    'K': (0x7F, 0x08, 0x14, 0x22, 0x41), 'L': (0x7F, 0x40, 0x40, 0x40, 0x40),
+    'M': (0x7F, 0x02, 0x0C, 0x02, 0x7F), 'N': (0x7F, 0x04, 0x08, 0x10, 0x7F),
+    'O': (0x3E, 0x41, 0x41, 0x41, 0x3E), 'P': (0x7F, 0x09, 0x09, 0x09, 0x06),
+    'Q': (0x3E, 0x41, 0x51, 0x21, 0x5E), 'R': (0x7F, 0x09, 0x19, 0x29, 0x46),
+    'S': (0x46, 0x49, 0x49, 0x49, 0x31), 'T': (0x01, 0x01, 0x7F, 0x01, 0x01),
+    'U': (0x3F, 0x40, 0x40, 0x40, 0x3F), 'V': (0x1F, 0x20, 0x40, 0x20, 0x1F),
+    'W': (0x3F, 0x40, 0x38, 0x40, 0x3F), 'X': (0x63, 0x14, 0x08, 0x14, 0x63),
+    'Y': (0x07, 0x08, 0x70, 0x08, 0x07), 'Z': (0x61, 0x51, 0x49, 0x45, 0x43),
+}
+
+# (file name, width, height, lines of text)
+SCREENSHOTS = [
+    ('loja_1280x720.png', 1280, 720,
+     ["LOJA DE ITENS", "APOIE-UM-CRIADOR: VASCURADO", "V-BUCKS 1.500", "ATUALIZA EM 12:34:56"]),
+    ('loja_1920x1080.png', 1920, 1080,
+     ["ITEM SHOP", "SUPPORT-A-CREATOR: VASCURADO", "V-BUCKS 2.800", "REFRESHES IN 08:15:42"]),
+    ('loja_1080x2340.png', 1080, 2340,
+     ["LOJA DE ITENS", "APOIE-UM-CRIADOR: OUTROCRIADOR", "V-BUCKS 950"]),
+    ('loja_2560x1440.png', 2560, 1440,
+     ["LOJA DE ITENS", "APOIE-UM-CRIADOR:", "V-BUCKS 13.500", "ATUALIZA EM 00:59:01"]),
+]
+
+# (file name, width, height, paragraph): dark text on white, wrapped to the page width
+PAGES = [
+    ('documento_1240x1754.png', 1240, 1754,
+     "O CODIGO DE APOIADOR E UMA FORMA DE APOIAR CRIADORES DE CONTEUDO. CADA COMPRA FEITA NA LOJA COM "
+     "O CODIGO ATIVO REPASSA PARTE DO VALOR PARA O CRIADOR ESCOLHIDO. PARA ATIVAR, ABRA A LOJA DE ITENS, "
+     "SELECIONE APOIE-UM-CRIADOR E DIGITE O CODIGO. O CODIGO FICA ATIVO POR 14 DIAS E PODE SER TROCADO "
+     "A QUALQUER MOMENTO. COMPRAS DE V-BUCKS, PASSES E PACOTES CONTAM PARA O CRIADOR. "),
+]
+
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def render_png(width: int, height: int, lines: List[str]) -> bytes:
+    """8-bit grayscale PNG: horizontal gradient background with white text lines."""
+    scale = max(1, height // 180)
+    background = bytes(30 + (90 * x) // max(1, width - 1) for x in range(width))
+
+    # Pixel rows covered by each text line, as (top, left, text)
+    placements = [(int((120 + i * 110) * height / 720), int(40 * height / 720), text.upper())
+                  for i, text in enumerate(lines)]
+    return _encode(width, height, background, placements, scale, 0xFF)
+
+
+def render_page(width: int, height: int, text: str) -> Tuple[bytes, List[str]]:
+    """8-bit grayscale PNG of a printed page: `text` repeated in black lines over white, and the lines."""
+    scale, margin = 2, 60
+    columns = (width - 2 * margin) // (6 * scale)
+    words = text.split()
+    lines, i = [], 0
+    # Fills every line down to the bottom margin, starting the paragraph over as needed
+    while margin + (len(lines) + 1) * 12 * scale < height - margin:
+        line = words[i % len(words)]
+        i += 1
+        while len(line) + 1 + len(words[i % len(words)]) <= columns:
+            line += ' ' + words[i % len(words)]
+            i += 1
+        lines.append(line)
+
+    placements = [(margin + n * 12 * scale, margin, line) for n, line in enumerate(lines)]
+    return _encode(width, height, b'\xff' * width, placements, scale, 0x00), lines
+
+
+def _encode(width: int, height: int, background: bytes, placements: List[Tuple[int, int, str]],
+            scale: int, ink: int) -> bytes:
+    raw = bytearray()
+    for y in range(height):
+        row = bytearray(background)
+        for top, left, text in placements:
+            glyph_row = (y - top) // scale
+            if not 0 <= glyph_row < 7:
+                continue
+            for i, char in enumerate(text):
+                columns = FONT.get(char, FONT[' '])
+                x0 = left + i * 6 * scale
+                for column, bits in enumerate(columns):
+                    if bits >> glyph_row & 1:
+                        start = x0 + column * scale
+                        end = min(width, start + scale)
+                        if start < width:
+                            row[start:end] = bytes([ink]) * (end - start)
+
+        # Sub filter: the gradient becomes a run of tiny deltas that deflate well
+        filtered = bytearray(row)
+        for x in range(width - 1, 0, -1):
+            filtered[x] = (row[x] - row[x - 1]) & 0xFF
+        raw += b'\x01' + filtered
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + _chunk(b'IHDR', header) +
+            _chunk(b'IDAT', zlib.compress(bytes(raw), 9)) + _chunk(b'IEND', b''))
+
+
+def load_corpus() -> Dict[str, dict]:
+    """Returns {file name: {'bytes', 'text', 'width', 'height'}} for the checked-in corpus."""
+    with open(MANIFEST_PATH, encoding='utf-8') as manifest_file:
+        manifest = json.load(manifest_file)
+
+    corpus = {}
+    for name, entry in manifest.items():
+        with open(os.path.join(CORPUS_DIR, name), 'rb') as image_file:
+            corpus[name] = dict(entry, bytes=image_file.read())
+    return corpus
+
+
+def main():
+    os.makedirs(CORPUS_DIR, exist_ok=True)
+    manifest = {}
+    for name, width, height, lines in SCREENSHOTS:
+        with open(os.path.join(CORPUS_DIR, name), 'wb') as image_file:
+            image_file.write(render_png(width, height, lines))
+        manifest[name] = {'width': width, 'height': height, 'text': "\n".join(lines), 'mode': 'text'}
+        print(f"{name}: {width}x{height}")
+
+    for name, width, height, paragraph in PAGES:
+        data, lines = render_page(width, height, paragraph)
+        with open(os.path.join(CORPUS_DIR, name), 'wb') as image_file:
+            image_file.write(data)
+        manifest[name] = {'width': width, 'height': height, 'text': "\n".join(lines), 'mode': 'document'}
+        print(f"{name}: {width}x{height}")
+
+    with open(MANIFEST_PATH, 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, ensure_ascii=False)
+        manifest_file.write('\n')
+
+
+if __name__ == '__main__':
+    main()
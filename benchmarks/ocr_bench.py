@@ -0,0 +1,352 @@
+"""Offline microbenchmarks for the OCR hot path.
+
+Every stage is timed on its own, with no network access or credentials: a fake
+ImageAnnotatorClient answers with canned annotations and a local HTTP server
+stands in for the Discord CDN. The corpus is the checked-in screenshots in
+benchmarks/corpus/ plus synthetic screenshots at common resolutions.
+
+    python -m benchmarks.ocr_bench
+    python -m benchmarks.ocr_bench --json resultados.json --check
+    python -m benchmarks.ocr_bench --baseline resultados_anteriores.json
+
+--check compares each median with the ceilings in benchmarks/thresholds.json,
+checks that fast preprocessing is no slower than full on any image and checks
+the detection mode 'auto' picks for every image whose mode is known
+(benchmarks/corpus/manifest.json, synthetic screenshots); --baseline compares
+with a previous --json run. Either exits with status 1 on a regression.
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import string
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+import aiohttp
+import cv2
+from google.cloud import vision
+
+from benchmarks.corpus import load_corpus
+from benchmarks.preprocess_bench import SCREENSHOT_SIZES, SYNTHETIC_LINES, synthetic_screenshot
+from controllers.matcher import CodeMatcher
+from controllers.ocr import GoogleOCR
+from controllers.preprocess import PreprocessPool, estimate_density, preprocess_image
+from controllers.resilience import CircuitBreaker
+from controllers.result import OCRResult
+
+THRESHOLDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'thresholds.json')
+# Timer noise allowed when checking that fast preprocessing keeps up with full: at 1280x720
+# neither profile resizes, so both do the same work
+FAST_PATH_SLACK = 0.1
+
+TARGET_CODE = 'Vascurado'
+# Registered codes per guild the matcher is sized for
+MATCHER_CODES = 5000
+
+
+class FakeVisionClient:
+    """Stands in for vision.ImageAnnotatorClient, answering from canned text keyed by image hash."""
+
+    def __init__(self, canned: Dict[str, str], latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self._responses = {digest: self._response(text) for digest, text in canned.items()}
+        self._default = self._response("\n".join(SYNTHETIC_LINES))
+
+    @staticmethod
+    def _response(text: str) -> vision.AnnotateImageResponse:
+        annotations = [vision.EntityAnnotation(description=text, locale='pt')]
+        for i, word in enumerate(text.split()):
+            x, y = 40 + (i % 4) * 120, 120 + (i // 4) * 110
+            vertices = [vision.Vertex(x=x, y=y), vision.Vertex(x=x + 100, y=y),
+                        vision.Vertex(x=x + 100, y=y + 30), vision.Vertex(x=x, y=y + 30)]
+            annotations.append(vision.EntityAnnotation(description=word,
+                                                       bounding_poly=vision.BoundingPoly(vertices=vertices)))
+        return vision.AnnotateImageResponse(text_annotations=annotations)
+
+    def _lookup(self, content: bytes) -> vision.AnnotateImageResponse:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._responses.get(hashlib.sha256(content).hexdigest(), self._default)
+
+    def text_detection(self, image: vision.Image, **kwargs) -> vision.AnnotateImageResponse:
+        return self._lookup(image.content)
+
+    document_text_detection = text_detection
+
+    def batch_annotate_images(self, requests: List[vision.AnnotateImageRequest], **kwargs):
+        return vision.BatchAnnotateImagesResponse(responses=[self._lookup(request.image.content) for request in requests])
+
+
+class FakeCDN:
+    """Serves the corpus over HTTP on localhost, like cdn.discordapp.com would."""
+
+    def __init__(self, images: Dict[str, bytes]):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                body = images.get(self.path.lstrip('/'))
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png' if self.path.endswith('.png') else 'image/jpeg')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+
+    def url(self, name: str) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}/{name}"
+
+    def __enter__(self) -> 'FakeCDN':
+        threading.Thread(target=self.server.serve_forever, name='fake-cdn', daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def build_corpus(corpus_dir: Optional[str] = None, synthetic: bool = True) -> List[dict]:
+    """Checked-in images, optional extra directory and synthetic screenshots, as {'name', 'bytes', 'text', 'mode'}."""
+    corpus = [{'name': name, 'bytes': entry['bytes'], 'text': entry['text'], 'mode': entry.get('mode')}
+              for name, entry in load_corpus().items()]
+
+    if corpus_dir:
+        for name in sorted(os.listdir(corpus_dir)):
+            if os.path.splitext(name)[1].lower() in ('.png', '.jpg', '.jpeg', '.webp', '.bmp'):
+                with open(os.path.join(corpus_dir, name), 'rb') as image_file:
+                    corpus.append({'name': name, 'bytes': image_file.read(), 'text': None, 'mode': None})
+
+    if synthetic:
+        for width, height in SCREENSHOT_SIZES:
+            is_success, buffer = cv2.imencode('.jpg', synthetic_screenshot(width, height), [cv2.IMWRITE_JPEG_QUALITY, 90])
+            if is_success:
+                corpus.append({'name': f"synthetic_{width}x{height}.jpg", 'bytes': buffer.tobytes(),
+                               'text': "\n".join(SYNTHETIC_LINES), 'mode': 'text'})
+    return corpus
+
+
+def summarize(timings: List[float]) -> Dict[str, float]:
+    timings = sorted(timings)
+    return {
+        'median_ms': statistics.median(timings) * 1000,
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+        'runs': len(timings),
+    }
+
+
+def measure(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    fn()  # warm-up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return summarize(timings)
+
+
+async def measure_async(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    await fn()  # warm-up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        timings.append(time.perf_counter() - start)
+    return summarize(timings)
+
+
+def build_matcher(count: int = MATCHER_CODES, seed: int = 0) -> CodeMatcher:
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits
+    codes = [''.join(rng.choices(alphabet, k=rng.randint(4, 16))) for _ in range(count - 1)]
+    return CodeMatcher(codes + [TARGET_CODE])
+
+
+def run(corpus_dir: Optional[str] = None, repeat: int = 20, synthetic: bool = True) -> List[dict]:
+    # Keeps the per-call INFO records of GoogleOCR out of the timed loops
+    logging.basicConfig(level=logging.WARNING)
+    cv2.setNumThreads(1)
+
+    corpus = build_corpus(corpus_dir, synthetic)
+    canned = {hashlib.sha256(item['bytes']).hexdigest(): item['text'] for item in corpus if item['text']}
+
+    ocr = GoogleOCR(None, circuit=CircuitBreaker())
+    ocr.client = FakeVisionClient(canned)
+    matcher = build_matcher()
+    results = []
+
+    def add(benchmark: str, item: dict, stats: Dict[str, float], **extra):
+        results.append(dict({'benchmark': benchmark, 'image': item['name'], 'bytes': len(item['bytes'])}, **stats, **extra))
+
+    for item in corpus:
+        for profile in ('full', 'fast'):
+            add(f"preprocess.{profile}", item, measure(lambda: preprocess_image(item['bytes'], profile), repeat))
+        # 'auto' on both paths: estimated on the raw image (!ocr_quality), measured while preprocessing (!ocr)
+        add('density', item, measure(lambda: estimate_density(item['bytes']), repeat),
+            mode=ocr.select_mode(item['bytes']), expected_mode=item['mode'])
+        density = preprocess_image(item['bytes'], 'fast', want_density=True).density
+        add('preprocess.auto', item, measure(lambda: preprocess_image(item['bytes'], 'fast', want_density=True), repeat),
+            mode=ocr.mode_for(density), expected_mode=item['mode'])
+
+    # Same work through the process pool the pipeline uses: slot limit, timing and pickling included
+    pool = PreprocessPool(max_workers=1)
+
+    async def pool_all():
+        await pool.warm_up()
+        for item in corpus:
+            add('preprocess.pool', item, await measure_async(lambda: pool.run(item['bytes'], 'fast'), repeat))
+            add('downscale.pool', item, await measure_async(
+                lambda: pool.downscale(item['bytes'], 1_000_000, len(item['bytes'])), repeat))
+
+    try:
+        asyncio.run(pool_all())
+    finally:
+        pool.close()
+
+    with FakeCDN({item['name']: item['bytes'] for item in corpus}) as cdn:
+        for item in corpus:
+            add('download.sync', item, measure(lambda: ocr.download_image(cdn.url(item['name'])), repeat))
+
+        async def download_all():
+            async with aiohttp.ClientSession() as session:
+                for item in corpus:
+                    stats = await measure_async(lambda: ocr.download_image_async(cdn.url(item['name']), session), repeat)
+                    add('download.async', item, stats)
+
+        asyncio.run(download_all())
+
+    for item in corpus:
+        add('perform_ocr', item, measure(lambda: ocr.perform_ocr(item['bytes']), repeat))
+
+    async def perform_all():
+        for item in corpus:
+            add('perform_ocr_async', item, await measure_async(lambda: ocr.perform_ocr_async(item['bytes']), repeat))
+
+    asyncio.run(perform_all())
+
+    # Word-level stages are budgeted per screenshot; a printed page carries a hundred times the words
+    for item in (item for item in corpus if item['mode'] != 'document'):
+        texts = ocr.perform_ocr(item['bytes'])
+        add('result.build', item, measure(lambda: OCRResult.from_annotations(texts), repeat))
+        result = OCRResult.from_annotations(texts)
+        data = result.to_bytes()
+        add('result.codec', item, measure(lambda: OCRResult.from_bytes(result.to_bytes()), repeat),
+            encoded_bytes=len(data), proto_bytes=len(vision.AnnotateImageResponse.serialize(
+                vision.AnnotateImageResponse(text_annotations=list(texts)))))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            add('process_results', item, measure(lambda: ocr.process_results(result), repeat))
+
+        words = list(result.words)
+        match = matcher.match(words)
+        add('matcher', item, measure(lambda: matcher.match(words), repeat * 10),
+            code=match.code if match else None, confidence=match.confidence if match else 0.0)
+
+    ocr.close()
+    return results
+
+
+def check_thresholds(results: List[dict], thresholds: Dict[str, float]) -> List[str]:
+    failures = []
+    for row in results:
+        ceiling = thresholds.get(row['benchmark'])
+        if ceiling is not None and row['median_ms'] > ceiling:
+            failures.append(f"{row['benchmark']} [{row['image']}]: {row['median_ms']:.2f} ms > {ceiling} ms")
+    return failures
+
+
+def check_fast_path(results: List[dict], slack: float = FAST_PATH_SLACK) -> List[str]:
+    """Images for which the fast preprocessing profile is slower than the full one."""
+    full = {row['image']: row['median_ms'] for row in results if row['benchmark'] == 'preprocess.full'}
+    return [f"preprocess.fast [{row['image']}]: {row['median_ms']:.2f} ms > full {full[row['image']]:.2f} ms"
+            for row in results
+            if row['benchmark'] == 'preprocess.fast' and row['image'] in full
+            and row['median_ms'] > full[row['image']] * (1 + slack)]
+
+
+def check_modes(results: List[dict]) -> List[str]:
+    """Images for which 'auto' picked a different detection mode than the corpus expects."""
+    return [f"{row['benchmark']} [{row['image']}]: picked {row['mode']}, expected {row['expected_mode']}"
+            for row in results if row.get('expected_mode') and row['mode'] != row['expected_mode']]
+
+
+def compare(results: List[dict], baseline: List[dict], tolerance: float) -> List[str]:
+    previous = {(row['benchmark'], row['image']): row['median_ms'] for row in baseline}
+    failures = []
+    for row in results:
+        before = previous.get((row['benchmark'], row['image']))
+        # Sub-50µs stages are dominated by timer noise
+        if before and row['median_ms'] > max(before * (1 + tolerance), before + 0.05):
+            failures.append(f"{row['benchmark']} [{row['image']}]: {before:.2f} -> {row['median_ms']:.2f} ms")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', help="Extra directory with real screenshots")
+    parser.add_argument('--no-synthetic', action='store_true', help="Only use the checked-in corpus (and --corpus)")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--json', metavar='PATH', help="Write results as JSON ('-' for stdout)")
+    parser.add_argument('--check', action='store_true', help="Fail when a median exceeds benchmarks/thresholds.json, fast preprocessing "
+                             "is slower than full or 'auto' picks the wrong mode")
+    parser.add_argument('--thresholds', default=THRESHOLDS_PATH)
+    parser.add_argument('--baseline', metavar='PATH', help="Previous --json output to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown against --baseline")
+    args = parser.parse_args()
+
+    results = run(args.corpus, args.repeat, not args.no_synthetic)
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'opencv': cv2.__version__,
+        'results': results,
+    }
+
+    if args.json == '-':
+        print(json.dumps(report, indent=2))
+    else:
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as output:
+                json.dump(report, output, indent=2)
+        print(f"{'benchmark':<20}{'image':<28}{'median ms':>11}{'p95 ms':>10}")
+        for row in results:
+            print(f"{row['benchmark']:<20}{row['image']:<28}{row['median_ms']:>11.3f}{row['p95_ms']:>10.3f}")
+
+    failures = []
+    if args.check:
+        with open(args.thresholds, encoding='utf-8') as thresholds_file:
+            failures += check_thresholds(results, json.load(thresholds_file))
+        failures += check_fast_path(results) + check_modes(results)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            failures += compare(results, json.load(baseline_file)['results'], args.tolerance)
+
+    if failures:
+        print("\nRegressions:", file=sys.stderr)
+        for failure in failures:
+            print(f"  {failure}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
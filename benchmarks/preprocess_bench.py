@@ -0,0 +1,124 @@
+"""Compares the 'full' and 'fast' preprocessing profiles.
+
+Measures median latency and peak traced memory per image, on synthetic
+screenshots at common phone/desktop resolutions or on a directory of real
+screenshots:
+
+    python -m benchmarks.preprocess_bench
+    python -m benchmarks.preprocess_bench --corpus caminho/para/screenshots --json
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+import tracemalloc
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+from controllers.preprocess import preprocess_image
+
+# (width, height) of screenshots we commonly receive
+SCREENSHOT_SIZES = [
+    (1280, 720),
+    (1920, 1080),
+    (1080, 2340),
+    (1170, 2532),
+    (2560, 1440),
+    (3840, 2160),
+]
+
+PROFILES = ('full', 'fast')
+
+SYNTHETIC_LINES = ["LOJA DE ITENS", "APOIE-UM-CRIADOR: Vascurado", "V-BUCKS 1.500", "Atualiza em 12:34:56"]
+
+
+def synthetic_screenshot(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """Noisy game-like background with a few lines of text, including a creator code."""
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(30, 120, width, dtype=np.float32)
+    background = np.tile(gradient, (height, 1))
+    noise = rng.normal(0, 12, (height, width)).astype(np.float32)
+    image = np.clip(background + noise, 0, 255).astype(np.uint8)
+    image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+    scale = height / 720
+    for i, line in enumerate(SYNTHETIC_LINES):
+        origin = (int(40 * scale), int((120 + i * 110) * scale))
+        cv2.putText(image, line, origin, cv2.FONT_HERSHEY_SIMPLEX, 1.4 * scale, (255, 255, 255),
+                    max(1, int(3 * scale)), cv2.LINE_AA)
+    return image
+
+
+def build_corpus(corpus_dir: str = None) -> List[Tuple[str, bytes]]:
+    if corpus_dir:
+        corpus = []
+        for name in sorted(os.listdir(corpus_dir)):
+            path = os.path.join(corpus_dir, name)
+            if os.path.splitext(name)[1].lower() in ('.png', '.jpg', '.jpeg', '.webp', '.bmp'):
+                with open(path, 'rb') as image_file:
+                    corpus.append((name, image_file.read()))
+        return corpus
+
+    corpus = []
+    for width, height in SCREENSHOT_SIZES:
+        image = synthetic_screenshot(width, height)
+        for ext, params in (('.png', []), ('.jpg', [cv2.IMWRITE_JPEG_QUALITY, 90])):
+            is_success, buffer = cv2.imencode(ext, image, params)
+            if is_success:
+                corpus.append((f"{width}x{height}{ext}", buffer.tobytes()))
+    return corpus
+
+
+def measure(image_bytes: bytes, profile: str, repeat: int) -> Dict[str, float]:
+    preprocess_image(image_bytes, profile)  # warm-up
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        preprocess_image(image_bytes, profile)
+        timings.append(time.perf_counter() - start)
+
+    # NumPy (and therefore OpenCV's Python outputs) report allocations to tracemalloc
+    tracemalloc.start()
+    preprocess_image(image_bytes, profile)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'median_ms': statistics.median(timings) * 1000, 'peak_mb': peak / (1024 * 1024)}
+
+
+def run(corpus_dir: str = None, repeat: int = 10) -> List[dict]:
+    cv2.setNumThreads(1)
+    results = []
+    for name, image_bytes in build_corpus(corpus_dir):
+        row = {'image': name, 'bytes': len(image_bytes)}
+        for profile in PROFILES:
+            row[profile] = measure(image_bytes, profile, repeat)
+        row['speedup'] = row['full']['median_ms'] / row['fast']['median_ms']
+        results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', help="Directory with real screenshots (default: synthetic corpus)")
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.corpus, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'image':<16}{'full ms':>10}{'fast ms':>10}{'speedup':>9}{'full MB':>10}{'fast MB':>10}")
+    for row in results:
+        print(f"{row['image']:<16}{row['full']['median_ms']:>10.1f}{row['fast']['median_ms']:>10.1f}"
+              f"{row['speedup']:>8.1f}x{row['full']['peak_mb']:>10.1f}{row['fast']['peak_mb']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Checks the import time of the bot's entry points and that the OCR stack stays out of it.
+
+Each target is imported in a fresh interpreter with `-X importtime`. OpenCV,
+NumPy, the Vision client and `requests` must not be loaded at startup: the bot
+imports them on the first OCR command or in the warm-up after on_ready.
+
+    python -m benchmarks.startup_bench
+    python -m benchmarks.startup_bench --check     # fails over the budgets in benchmarks/thresholds.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+THRESHOLDS_PATH = os.path.join(ROOT, 'benchmarks', 'thresholds.json')
+
+# Benchmark name -> module imported at startup
+TARGETS = {
+    'startup.bot': 'controllers.bot',
+    'startup.main': 'main',
+}
+
+# Imported lazily; finding one of these in a startup profile is a regression
+LAZY_MODULES = ('cv2', 'numpy', 'google.cloud.vision', 'grpc', 'requests')
+
+
+def import_profile(module: str) -> List[Tuple[str, int, int]]:
+    """(module, self µs, cumulative µs) for every import made by `import module`, in import order."""
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr.strip().splitlines()[-1]}")
+
+    profile = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # header
+        profile.append((fields[2].rstrip(), int(fields[0]), int(fields[1])))
+    return profile
+
+
+def measure(module: str, repeat: int) -> dict:
+    # The first run also compiles .pyc files, so it is not counted
+    import_profile(module)
+    runs = [import_profile(module) for _ in range(repeat)]
+
+    totals = []
+    for profile in runs:
+        total = next(cumulative for name, _, cumulative in reversed(profile) if name.strip() == module)
+        totals.append(total / 1000)
+
+    profile = runs[-1]
+    loaded = {name.strip() for name, _, _ in profile}
+    slowest = sorted(profile, key=lambda entry: entry[1], reverse=True)[:10]
+    return {
+        'module': module,
+        'median_ms': statistics.median(totals),
+        'max_ms': max(totals),
+        'lazy_loaded': [name for name in LAZY_MODULES if name in loaded],
+        'slowest': [(name.strip(), self_us / 1000) for name, self_us, _ in slowest],
+    }
+
+
+def check(results: Dict[str, dict], thresholds: Dict[str, float]) -> List[str]:
+    failures = []
+    for benchmark, result in results.items():
+        if result['lazy_loaded']:
+            failures.append(f"{benchmark}: {result['module']} imports {', '.join(result['lazy_loaded'])} at startup")
+        ceiling = thresholds.get(benchmark)
+        if ceiling is not None and result['median_ms'] > ceiling:
+            failures.append(f"{benchmark}: {result['median_ms']:.1f} ms > {ceiling} ms")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', metavar='PATH', help="Write results as JSON ('-' for stdout)")
+    parser.add_argument('--check', action='store_true', help="Fail over the budgets in benchmarks/thresholds.json")
+    parser.add_argument('--thresholds', default=THRESHOLDS_PATH)
+    args = parser.parse_args()
+
+    results = {benchmark: measure(module, args.repeat) for benchmark, module in TARGETS.items()}
+
+    if args.json == '-':
+        print(json.dumps(results, indent=2))
+    else:
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as output:
+                json.dump(results, output, indent=2)
+        for benchmark, result in results.items():
+            print(f"{benchmark:<16}{result['module']:<20}{result['median_ms']:>9.1f} ms (max {result['max_ms']:.1f} ms)")
+            for name, self_ms in result['slowest']:
+                print(f"    {name:<40}{self_ms:>8.1f} ms")
+
+    if args.check:
+        with open(args.thresholds, encoding='utf-8') as thresholds_file:
+            failures = check(results, json.load(thresholds_file))
+        if failures:
+            print("\nRegressions:", file=sys.stderr)
+            for failure in failures:
+                print(f"  {failure}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
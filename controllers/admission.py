@@ -0,0 +1,78 @@
+from typing import Optional
+
+from controllers.imageinfo import ImageInfo, sniff, sniff_format
+from controllers.metrics import IMAGE_ADMISSION
+
+# Vision API rejects images larger than 20 MB, and only reads text on images up to 75 megapixels
+VISION_MAX_IMAGE_BYTES = 20 * 1024 * 1024
+VISION_MAX_PIXELS = 75_000_000
+
+# Bytes of the download inspected before the rest is fetched; enough for the
+# dimensions of PNG, GIF, BMP, WebP and most JPEGs
+HEADER_BYTES = 16 * 1024
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
+
+
+class ImageRejected(ValueError):
+    """The image was refused before being downloaded or decoded; the message is shown to the user."""
+
+
+class ImageAdmission:
+    """Decides from metadata and header bytes whether an image enters the pipeline.
+
+    Runs before the full download and before any decode: non-images and
+    images over `max_pixels` (decompression bombs) are rejected, and images
+    over Vision's limits are marked for downscaling instead of failing later.
+    """
+
+    def __init__(self, max_bytes: int, max_pixels: int = 100_000_000,
+                 vision_max_bytes: int = VISION_MAX_IMAGE_BYTES, vision_max_pixels: int = VISION_MAX_PIXELS):
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.vision_max_bytes = vision_max_bytes
+        self.vision_max_pixels = vision_max_pixels
+        self.stats = {'rejected': 0, 'downscaled': 0}
+
+    def _reject(self, outcome: str, reason: str):
+        self.stats['rejected'] += 1
+        IMAGE_ADMISSION.labels(outcome=outcome).inc()
+        raise ImageRejected(reason)
+
+    def _check_pixels(self, width: Optional[int], height: Optional[int]):
+        if width is None or height is None:
+            return
+        if not width or not height:
+            self._reject('invalid', "Imagem sem dimensões válidas")
+        if width * height > self.max_pixels:
+            self._reject('pixels', f"Imagem grande demais ({width}x{height}, "
+                         f"{width * height / 1e6:.0f} MP). Limite: {self.max_pixels / 1e6:.0f} MP")
+
+    def check_metadata(self, size: Optional[int] = None, width: Optional[int] = None,
+                       height: Optional[int] = None, content_type: Optional[str] = None):
+        """Checks what Discord reports about an attachment, before anything is downloaded."""
+        if content_type and not content_type.lower().startswith('image/'):
+            self._reject('type', f"O arquivo não é uma imagem ({content_type})")
+        if size is not None and size > self.max_bytes:
+            self._reject('bytes', f"Imagem muito grande ({size / (1024 * 1024):.1f} MB). "
+                         f"Limite: {self.max_bytes / (1024 * 1024):.0f} MB")
+        self._check_pixels(width, height)
+
+    def check_header(self, header: bytes) -> Optional[ImageInfo]:
+        """Checks the first bytes of an image; returns its format and size when the header has them."""
+        if sniff_format(header) is None:
+            self._reject('type', "O arquivo não é uma imagem suportada (PNG, JPG, GIF, BMP ou WEBP)")
+        info = sniff(header)
+        if info is None:
+            # Known format whose dimensions are further in (e.g. a JPEG with a large EXIF block)
+            return None
+        self._check_pixels(info.width, info.height)
+        return info
+
+    def needs_downscale(self, size: int, info: Optional[ImageInfo]) -> bool:
+        """Whether Vision would refuse the image as it is."""
+        oversized = size > self.vision_max_bytes or bool(info and info.width * info.height > self.vision_max_pixels)
+        if oversized:
+            self.stats['downscaled'] += 1
+            IMAGE_ADMISSION.labels(outcome='downscaled').inc()
+        return oversized
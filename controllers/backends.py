@@ -0,0 +1,87 @@
+import logging
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Optional
+
+from controllers.result import OCRResult
+
+logger = logging.getLogger(__name__)
+
+
+class OCRBackend(ABC):
+    """Common interface of the OCR engines.
+
+    `recognize` returns an OCRResult, or None when nothing was detected.
+    """
+
+    name = 'ocr'
+
+    @abstractmethod
+    async def recognize(self, image_bytes: bytes) -> Optional[OCRResult]:
+        ...
+
+    def close(self):
+        pass
+
+
+def confidence(result: Optional[OCRResult]) -> float:
+    return result.confidence if result else 0.0
+
+
+class OCRRouter:
+    """Chooses between a free local engine and the paid remote backend.
+
+    With `local_first` the local engine answers and the request is only
+    escalated to the remote backend when its confidence is below
+    `min_confidence`. Otherwise the remote backend answers and the local
+    engine is the fallback when it fails or is not configured. `escalate`
+    replaces the remote call, e.g. to go through the cache and the scheduler.
+    """
+
+    def __init__(self, local: Optional[OCRBackend] = None, remote: Optional[OCRBackend] = None,
+                 min_confidence: float = 0.8):
+        self.local = local
+        self.remote = remote
+        self.min_confidence = min_confidence
+        self.stats = {'local': 0, 'escalated': 0, 'remote': 0, 'fallback': 0}
+
+    async def _local(self, image_bytes: bytes) -> Optional[OCRResult]:
+        try:
+            return await self.local.recognize(image_bytes)
+        except Exception as e:
+            logger.warning("Local OCR engine failed: %s", e)
+            return None
+
+    async def recognize(self, image_bytes: bytes, local_first: bool = True,
+                        escalate: Optional[Callable[[], Awaitable[Optional[OCRResult]]]] = None) -> Optional[OCRResult]:
+        if escalate is None and self.remote:
+            escalate = lambda: self.remote.recognize(image_bytes)
+
+        if not escalate:
+            if not self.local:
+                raise RuntimeError("No OCR engine configured.")
+            self.stats['local'] += 1
+            return await self.local.recognize(image_bytes)
+
+        result = None
+        if self.local and local_first:
+            result = await self._local(image_bytes)
+            score = confidence(result)
+            if result and score >= self.min_confidence:
+                self.stats['local'] += 1
+                return result
+            logger.info("Local OCR confidence %.2f below %.2f, escalating", score, self.min_confidence,
+                        extra={'confidence': score, 'sample': True})
+            self.stats['escalated'] += 1
+        else:
+            self.stats['remote'] += 1
+
+        try:
+            return await escalate()
+        except Exception as e:
+            if not self.local:
+                raise
+            logger.warning("Remote OCR failed (%s), using the local engine", e)
+            self.stats['fallback'] += 1
+            if result is None and not local_first:
+                result = await self.local.recognize(image_bytes)
+            return result
@@ -0,0 +1,302 @@
+"""Offline OCR of many images: directories, globs, URL lists or JSONL, streamed to a JSONL file.
+
+    python main.py batch screenshots/ -o results.jsonl
+    python main.py batch "archive/**/*.png" urls.txt -o results.jsonl --concurrency 64
+
+Downloads, preprocessing and OCR run concurrently through the same pipeline as
+the bot, so Vision calls are batched and cached; the cache is a file of its own
+(--cache), so a large run does not evict the entries the live bot relies on.
+The output file doubles as the checkpoint: a rerun with the same -o skips every
+source already written to it. With --retry-failed the new record of a source
+replaces its error line once the run ends; readers should let the last record
+of a source win if they look at the file mid-run.
+The OCR stack is imported by `run`, so `main.py --help` and the bot stay light.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import time
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Set
+
+import aiohttp
+from dotenv import load_dotenv
+
+from controllers.admission import IMAGE_EXTENSIONS
+from controllers.logs import request_context, setup_logging
+from controllers.metrics import stage_summary
+from controllers.scheduler import VisionScheduler
+
+if TYPE_CHECKING:
+    from controllers.pipeline import OCRPipeline
+
+
+def _is_url(spec: str) -> bool:
+    return spec.startswith(('http://', 'https://'))
+
+
+def _is_image_path(path: str) -> bool:
+    return path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def _list_entries(path: str) -> Iterator[str]:
+    """Sources in a list file: one URL or path per line, or JSONL objects with a "url" or "path"."""
+    with open(path, encoding='utf-8') as entries:
+        for line in entries:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                entry = json.loads(line)
+                source = entry.get('url') or entry.get('path')
+                if source:
+                    yield source
+            else:
+                yield line
+
+
+def iter_sources(inputs: Iterable[str]) -> Iterator[str]:
+    """Expands each input (URL, image file, directory, list file or glob) into image sources."""
+    for spec in inputs:
+        if _is_url(spec):
+            yield spec
+        elif os.path.isdir(spec):
+            for root, dirs, files in os.walk(spec):
+                dirs.sort()
+                for name in sorted(files):
+                    if _is_image_path(name):
+                        yield os.path.join(root, name)
+        elif os.path.isfile(spec):
+            if _is_image_path(spec):
+                yield spec
+            else:
+                yield from _list_entries(spec)
+        else:
+            for path in sorted(glob.iglob(spec, recursive=True)):
+                if os.path.isfile(path) and _is_image_path(path):
+                    yield path
+
+
+def load_checkpoint(output_path: str, retry_failed: bool = False) -> Set[str]:
+    """Sources already in the output file; with `retry_failed`, only those that succeeded.
+
+    A line cut short by an interrupted run is truncated away so appending stays valid JSONL.
+    """
+    if not os.path.exists(output_path):
+        return set()
+
+    done = set()
+    with open(output_path, 'rb+') as output:
+        data = output.read()
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            output.truncate(end)
+
+    for line in data[:end].splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if not (retry_failed and 'error' in record):
+            done.add(record['source'])
+    return done
+
+
+def compact_output(output_path: str) -> int:
+    """Rewrites the output keeping only the last record of each source; returns the lines dropped.
+
+    Retried sources are appended again, after the error line of the previous run.
+    """
+    if not os.path.exists(output_path):
+        return 0
+
+    with open(output_path, encoding='utf-8') as output:
+        lines = output.readlines()
+    last = {}
+    for index, line in enumerate(lines):
+        try:
+            last[json.loads(line)['source']] = index
+        except (ValueError, KeyError, TypeError):
+            continue
+    keep = sorted(last.values())
+    if len(keep) == len(lines):
+        return 0
+
+    # Written aside and swapped in, so an interruption never leaves a half-written checkpoint
+    temporary = f"{output_path}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as output:
+        output.writelines(lines[index] for index in keep)
+    os.replace(temporary, output_path)
+    return len(lines) - len(keep)
+
+
+class BatchRunner:
+    """Runs the OCR pipeline over a list of sources with at most `concurrency` images in flight."""
+
+    def __init__(self, pipeline: 'OCRPipeline', output_path: str, concurrency: int = 32,
+                 mode: str = 'auto', raw: bool = False, report_interval: float = 10.0):
+        self.pipeline = pipeline
+        self.output_path = output_path
+        self.concurrency = concurrency
+        self.mode = mode
+        self.raw = raw
+        self.report_interval = report_interval
+        self.stats = {'done': 0, 'failed': 0, 'bytes': 0}
+
+    async def _read(self, source: str, session: aiohttp.ClientSession) -> bytes:
+        if _is_url(source):
+            return await self.pipeline.download(source, session)
+
+        def read():
+            with open(source, 'rb') as image_file:
+                return image_file.read()
+
+        return await self.pipeline.fit(await asyncio.get_running_loop().run_in_executor(None, read))
+
+    async def _process(self, source: str, session: aiohttp.ClientSession, admit) -> dict:
+        try:
+            with request_context(source):
+                image_data = await self._read(source, session)
+                self.stats['bytes'] += len(image_data)
+                if self.raw:
+                    result = await self.pipeline.ocr_quality(image_data, admit, self.mode)
+                else:
+                    result = await self.pipeline.ocr_image(image_data, admit, self.mode)
+        except Exception as e:
+            self.stats['failed'] += 1
+            return {'source': source, 'error': f"{type(e).__name__}: {e}"}
+
+        self.stats['done'] += 1
+        record = {'source': source, 'text': '', 'word_count': 0, 'confidence': 0.0}
+        if result:
+            record.update(result.to_dict())
+        return record
+
+    async def run(self, sources: List[str]) -> dict:
+        """Processes `sources`, appending one JSON line per image as soon as it finishes."""
+        queue: asyncio.Queue = asyncio.Queue()
+        for source in sources:
+            queue.put_nowait(source)
+        admit = self.pipeline.admission(None, 0, 'batch')
+        started = time.perf_counter()
+
+        async def work(session, output):
+            while True:
+                try:
+                    source = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                record = await self._process(source, session, admit)
+                output.write(json.dumps(record, ensure_ascii=False) + '\n')
+                output.flush()
+
+        async def report():
+            while True:
+                await asyncio.sleep(self.report_interval)
+                self._report(len(sources), time.perf_counter() - started)
+
+        reporter = asyncio.ensure_future(report())
+        try:
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+                with open(self.output_path, 'a', encoding='utf-8') as output:
+                    await asyncio.gather(*[work(session, output) for _ in range(min(self.concurrency, len(sources)))])
+        finally:
+            reporter.cancel()
+
+        elapsed = time.perf_counter() - started
+        self._report(len(sources), elapsed)
+        return dict(self.stats, total=len(sources), seconds=elapsed)
+
+    def _report(self, total: int, elapsed: float):
+        processed = self.stats['done'] + self.stats['failed']
+        rate = processed / elapsed if elapsed else 0.0
+        megabytes = self.stats['bytes'] / elapsed / 1e6 if elapsed else 0.0
+        eta = (total - processed) / rate if rate else 0.0
+        print(f"{processed}/{total} images, {rate:.1f} img/s, {megabytes:.1f} MB/s, "
+              f"{self.stats['failed']} failed, ETA {eta:.0f}s", file=sys.stderr)
+
+
+def batch_scheduler(quota_share: float, concurrency: int) -> VisionScheduler:
+    """Scheduler for a batch run: a single tenant, so only the project quota applies."""
+    qps = float(os.getenv('VISION_QPS', '10')) * quota_share
+    qpm = float(os.getenv('VISION_QPM', '1800')) * quota_share
+    return VisionScheduler(qps=qps, qpm=qpm, guild_per_minute=qpm, guild_burst=qps,
+                           user_per_minute=qpm, user_burst=qps, max_queue=max(concurrency, 1) * 2)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('inputs', nargs='+',
+                        help="Image files, directories, globs, URLs, or files listing URLs/paths (one per line or JSONL)")
+    parser.add_argument('-o', '--output', required=True, help="JSONL output; a rerun with the same file resumes from it")
+    parser.add_argument('--concurrency', type=int, default=32, help="Images in flight at once")
+    parser.add_argument('--mode', default='auto', help="auto, text or document")
+    parser.add_argument('--raw', action='store_true', help="Skip preprocessing, like !ocr_quality")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="Process again the sources recorded with an error, replacing their error lines")
+    parser.add_argument('--cache', default=os.getenv('OCR_BATCH_CACHE_PATH', 'ocr_batch_cache.sqlite3'),
+                        help="OCR result cache for batch runs, kept apart from the bot's OCR_CACHE_PATH")
+    parser.add_argument('--quota-share', type=float, default=1.0,
+                        help="Fraction of VISION_QPS/VISION_QPM to use, e.g. 0.5 while the bot is running")
+    parser.add_argument('--report-interval', type=float, default=10.0, help="Seconds between progress lines")
+
+
+def run(args: argparse.Namespace) -> int:
+    from controllers.ocr import DETECTION_MODES
+    from controllers.pipeline import OCRPipeline
+
+    load_dotenv(dotenv_path="./config/.env")
+    setup_logging()
+    if args.mode not in DETECTION_MODES:
+        print(f"Unknown mode {args.mode!r}, expected one of {', '.join(DETECTION_MODES)}", file=sys.stderr)
+        return 2
+
+    # Deduplicated, in input order; everything already in the output file is skipped
+    sources = list(dict.fromkeys(iter_sources(args.inputs)))
+    done = load_checkpoint(args.output, args.retry_failed)
+    pending = [source for source in sources if source not in done]
+    print(f"{len(sources)} sources, {len(sources) - len(pending)} already in {args.output}, {len(pending)} to process",
+          file=sys.stderr)
+    if not pending:
+        return 0
+
+    # The pipeline reads its cache path from the environment, like every other setting
+    os.environ['OCR_CACHE_PATH'] = args.cache
+    pipeline = OCRPipeline.from_env(args.quota_share)
+    if pipeline is None:
+        print("No OCR engine configured (GOOGLE_CREDENTIALS_PATH or Tesseract)", file=sys.stderr)
+        return 1
+    pipeline.scheduler = batch_scheduler(args.quota_share, args.concurrency)
+
+    runner = BatchRunner(pipeline, args.output, concurrency=args.concurrency, mode=args.mode,
+                         raw=args.raw, report_interval=args.report_interval)
+    try:
+        stats = asyncio.run(runner.run(pending))
+    except KeyboardInterrupt:
+        print(f"Interrupted; rerun the same command to resume from {args.output}", file=sys.stderr)
+        return 130
+    finally:
+        pipeline.close()
+        if args.retry_failed:
+            dropped = compact_output(args.output)
+            if dropped:
+                print(f"Replaced {dropped} error lines in {args.output}", file=sys.stderr)
+
+    print(f"Processed {stats['total']} images in {stats['seconds']:.1f}s "
+          f"({stats['total'] / stats['seconds'] if stats['seconds'] else 0:.1f} img/s), {stats['failed']} failed",
+          file=sys.stderr)
+    for stage, (count, (p50, p95, p99)) in sorted(stage_summary().items()):
+        print(f"  {stage:<16} p50 {p50 * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms  p99 {p99 * 1000:7.1f} ms  ({count})",
+              file=sys.stderr)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    sys.exit(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
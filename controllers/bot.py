@@ -1,23 +1,59 @@
 import discord
 from discord.ext import commands
 import asyncio
+import importlib.util
+import logging
 import random
 import os
 import aiohttp
 import io
-import cv2
-import numpy as np
+import time
 from dotenv import load_dotenv
 
-try:
-    from controllers.ocr import GoogleOCR
-    OCR_AVAILABLE = True
-except ImportError:
+from controllers.admission import IMAGE_EXTENSIONS
+from controllers.jobs import FAILED, JobError, JobQueue, decode_outcome
+from controllers.logs import REQUEST_ID, setup_logging
+from controllers.metrics import COMMAND_SECONDS, COMMANDS_INFLIGHT, stage_errors, stage_summary, start_http_server, timed
+from controllers.responder import ResponseRenderer
+
+
+def _installed(module: str) -> bool:
+    try:
+        return importlib.util.find_spec(module) is not None
+    except ImportError:
+        return False
+
+
+# O OCR (OpenCV, NumPy, Google Vision) só é importado no primeiro uso ou no aquecimento após o on_ready
+OCR_AVAILABLE = all(_installed(module) for module in ('cv2', 'numpy', 'google.cloud.vision'))
+if not OCR_AVAILABLE:
     print("⚠️ GoogleOCR não disponível. Comandos de OCR serão desabilitados.")
-    OCR_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
 
 class ApoiadorBot:
-    def __init__(self):
+    # Modos de detecção aceitos por !ocr e !ocr_quality
+    DETECTION_MODES = {
+        'auto': 'auto',
+        'texto': 'text', 'text': 'text',
+        'documento': 'document', 'document': 'document', 'doc': 'document',
+    }
+
+    # Acima disso o !ocr_status mostra a Vision como lenta ou instável
+    VISION_SLOW_P95 = 2.0
+    VISION_MAX_ERROR_RATE = 0.05
+
+    # Tentativas de entregar o resultado de um job antes de desistir dele
+    DELIVERY_ATTEMPTS = 5
+    # Espera antes de reiniciar um worker que terminou
+    WORKER_RESTART_DELAY = 5.0
+
+    def __init__(self, sharded=False, shard_count=None, shard_ids=None, spawn_workers=True):
+        """
+        sharded: usa AutoShardedBot (shard_count=None deixa o Discord recomendar a quantidade)
+        shard_ids: shards deste processo quando o bot roda dividido em vários processos
+        spawn_workers: inicia os workers de OCR_WORKERS; o launcher desativa para iniciá-los uma vez só
+        """
 
         env_path = "./config/.env"
         load_dotenv(dotenv_path=env_path)
@@ -28,34 +64,183 @@ class ApoiadorBot:
         intents.members = True
         
         # Criar o bot
-        self.bot = commands.Bot(command_prefix='!', intents=intents)
+        if sharded or shard_ids:
+            self.bot = commands.AutoShardedBot(command_prefix='!', intents=intents,
+                                               shard_count=shard_count, shard_ids=shard_ids)
+        else:
+            self.bot = commands.Bot(command_prefix='!', intents=intents)
+        
+        # Com vários processos, cada um usa a fração da cota da Vision correspondente aos seus shards
+        self.quota_share = len(shard_ids) / shard_count if shard_ids else 1.0
+        # Identifica na fila os pedidos cujas respostas este processo entrega
+        self.job_owner = f"shards-{min(shard_ids)}-{max(shard_ids)}" if shard_ids else None
+        self.spawn_workers = spawn_workers
         
-        # Inicializar OCR se disponível
+        # O OCR é carregado sob demanda (_load_ocr); até lá estes atributos ficam vazios
+        self.pipeline = None
         self.ocr = None
+        self.codes = None
+        self.scheduler = None
+        self.local_ocr = None
+        self.router = None
+        self._ocr_loader = None
+        self._warm_up_task = None
+        self.jobs = None
+        self.ocr_workers = 0
+        self.worker_processes = []
+        self._worker_restarts = {}
+        self._delivery_task = None
         if OCR_AVAILABLE:
-            credentials_path = os.getenv('GOOGLE_CREDENTIALS_PATH')
-            if credentials_path and os.path.exists(credentials_path):
-                try:
-                    self.ocr = GoogleOCR(credentials_path)
-                    print("✅ OCR configurado com sucesso!")
-                except Exception as e:
-                    print(f"❌ Erro ao configurar OCR: {e}")
-            else:
-                print("⚠️ Credenciais do Google Cloud não encontradas.")
+            # Com OCR_WORKERS > 0 os pedidos vão para uma fila durável atendida por processos separados
+            self.ocr_workers = int(os.getenv('OCR_WORKERS', '0'))
+            if self.ocr_workers > 0:
+                self.jobs = JobQueue(
+                    os.getenv('OCR_QUEUE_PATH', 'ocr_jobs.sqlite3'),
+                    visibility_timeout=float(os.getenv('OCR_JOB_LEASE_SECONDS', '120')),
+                    max_attempts=int(os.getenv('OCR_JOB_MAX_ATTEMPTS', '3'))
+                )
+        
+        # Respostas com o mínimo de chamadas ao Discord: o "Processando..." só aparece se o
+        # resultado demorar mais que OCR_PLACEHOLDER_MS, e o resultado sai numa única mensagem
+        self.responder = ResponseRenderer(deadline=float(os.getenv('OCR_PLACEHOLDER_MS', '400')) / 1000)
+        
+        # Sessão HTTP compartilhada, criada ao iniciar e fechada ao desligar o bot
+        self.http_session = None
+        self.metrics_server = None
+        self.bot.setup_hook = self._setup_hook
+        self._bot_close = self.bot.close
+        self.bot.close = self._close
         
         # Configurar eventos e comandos
         self.setup_events()
         self.setup_commands()
         self.setup_ocr_commands()
     
+    async def _setup_hook(self):
+        """Cria a sessão HTTP com pool de conexões usada por todos os downloads"""
+        connector = aiohttp.TCPConnector(
+            limit=int(os.getenv('HTTP_POOL_LIMIT', '100')),
+            limit_per_host=int(os.getenv('HTTP_POOL_PER_HOST', '20')),
+            ttl_dns_cache=300,
+            keepalive_timeout=60
+        )
+        self.http_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=30)
+        )
+
+        # Endpoint Prometheus local com a latência de cada etapa (METRICS_PORT=0 desativa)
+        metrics_host = os.getenv('METRICS_HOST', '127.0.0.1')
+        metrics_port = int(os.getenv('METRICS_PORT', '9108'))
+        if OCR_AVAILABLE and metrics_port > 0:
+            try:
+                self.metrics_server = start_http_server(metrics_port, metrics_host)
+                print(f"📈 Métricas disponíveis em http://{metrics_host}:{metrics_port}/metrics")
+            except OSError as e:
+                print(f"⚠️ Não foi possível iniciar o endpoint de métricas: {e}")
+
+        # Respostas dos workers, inclusive as de pedidos feitos antes de um reinício
+        if self.jobs:
+            self._delivery_task = asyncio.create_task(self._deliver_results())
+
+    async def _close(self):
+        """Fecha a sessão HTTP e o endpoint de métricas antes de desconectar o bot"""
+        for task in (self._delivery_task, self._warm_up_task):
+            if task:
+                task.cancel()
+        if self.http_session:
+            await self.http_session.close()
+        if self.metrics_server:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+        await self._bot_close()
+
+    def _create_pipeline(self):
+        # Importa OpenCV, NumPy e a Vision; roda fora do event loop
+        from controllers.pipeline import OCRPipeline
+        return OCRPipeline.from_env(self.quota_share)
+
+    async def _build_ocr(self):
+        loop = asyncio.get_running_loop()
+        try:
+            with timed('ocr_load'):
+                self.pipeline = await loop.run_in_executor(None, self._create_pipeline)
+        except Exception as e:
+            print(f"❌ Erro ao configurar OCR: {e}")
+            return
+
+        if self.pipeline is None:
+            print("⚠️ Credenciais do Google Cloud não encontradas.")
+            return
+
+        self.ocr = self.pipeline.ocr
+        self.codes = self.pipeline.codes
+        self.scheduler = self.pipeline.scheduler
+        self.local_ocr = self.pipeline.local_ocr
+        self.router = self.pipeline.router
+        if not self.vision_ready:
+            print("⚠️ Credenciais do Google Cloud não encontradas.")
+        if self.local_ocr:
+            print("✅ OCR local (Tesseract) disponível")
+        print("✅ OCR configurado com sucesso!")
+
+    async def _load_ocr(self) -> bool:
+        """Carrega o OCR na primeira vez em que é usado; pedidos simultâneos aguardam a mesma carga"""
+        if not OCR_AVAILABLE:
+            return False
+        if self._ocr_loader is None:
+            self._ocr_loader = asyncio.ensure_future(self._build_ocr())
+        await asyncio.shield(self._ocr_loader)
+        return self.pipeline is not None
+
+    async def _warm_up(self):
+        """Carrega o OCR em segundo plano depois que o bot já está online"""
+        if not await self._load_ocr():
+            return
+        # Com a fila ativa, o pré-processamento roda nos workers
+        if not self.jobs:
+            await self.pipeline.preprocess_pool.warm_up()
+        await self.ocr.warm_up()
+
+    @property
+    def vision_ready(self) -> bool:
+        return bool(self.pipeline and self.pipeline.vision_ready)
+
+    async def _download_attachment(self, attachment) -> bytes:
+        """Baixa um anexo, abortando assim que o limite de tamanho é ultrapassado"""
+        return await self.pipeline.download(attachment.url, self.http_session, attachment.size,
+                                            attachment.width, attachment.height, attachment.content_type)
+
     def setup_events(self):
         """Configura todos os eventos do bot"""
         
         @self.bot.event
         async def on_ready():
-            print(f'{self.bot.user} está online!')
+            shard_ids = getattr(self.bot, 'shard_ids', None)
+            shards = f" (shards {', '.join(map(str, shard_ids))})" if shard_ids else ""
+            print(f'{self.bot.user} está online!{shards}')
             status_text = "Digite !ajuda"
             await self.bot.change_presence(activity=discord.Game(name=status_text))
+            if OCR_AVAILABLE and self._warm_up_task is None:
+                self._warm_up_task = asyncio.create_task(self._warm_up())
+        
+        @self.bot.before_invoke
+        async def start_command_timer(ctx):
+            ctx.started_at = time.perf_counter()
+            # Os logs do comando (e dos jobs que ele cria) levam o id da mensagem
+            REQUEST_ID.set(str(ctx.message.id))
+            if OCR_AVAILABLE:
+                COMMANDS_INFLIGHT.labels(command=ctx.command.name).inc()
+        
+        @self.bot.after_invoke
+        async def stop_command_timer(ctx):
+            # Chamado mesmo quando o comando falha
+            if OCR_AVAILABLE and hasattr(ctx, 'started_at'):
+                COMMANDS_INFLIGHT.labels(command=ctx.command.name).dec()
+                elapsed = time.perf_counter() - ctx.started_at
+                COMMAND_SECONDS.labels(command=ctx.command.name).observe(elapsed)
+                logger.info("Command %s took %.0f ms", ctx.command.name, elapsed * 1000,
+                            extra={'command': ctx.command.name, 'seconds': elapsed, 'sample': True})
         
         
         @self.bot.event
@@ -138,8 +323,9 @@ class ApoiadorBot:
         """Configura comandos relacionados ao OCR"""
         
         @self.bot.command(name='ocr')
-        async def ocr_command(ctx):
-            """Extrai texto de uma imagem anexada ou URL"""
+        async def ocr_command(ctx, modo: str = 'auto'):
+            """Extrai texto de todas as imagens anexadas"""
+            await self._load_ocr()
             if not self.ocr:
                 embed = discord.Embed(
                     title=" ❌ Serviço de OCR Indisponivel",
@@ -149,12 +335,16 @@ class ApoiadorBot:
                 await ctx.send(embed=embed)
                 return
             
+            mode = await self._detection_mode(ctx, modo)
+            if not mode:
+                return
+            
             # Verificar se há anexos na mensagem
             if ctx.message.attachments:
-                attachment = ctx.message.attachments[0]
+                images = [attachment for attachment in ctx.message.attachments if self._is_image(attachment)]
                 
-                # Verificar se é uma imagem
-                if not any(attachment.filename.lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp']):
+                # Verificar se há ao menos uma imagem
+                if not images:
                     embed = discord.Embed(
                         title="❌ Formato Inválido",
                         description="Por favor, envie uma imagem válida (PNG, JPG, JPEG, GIF, BMP, WEBP).",
@@ -166,99 +356,22 @@ class ApoiadorBot:
                 # Mostrar que está processando
                 processing_embed = discord.Embed(
                     title="🔄 Processando...",
+                    description=f"Extraindo texto de {len(images)} imagens..." if len(images) > 1 else None,
                     color=0xffff00
                 )
-                processing_msg = await ctx.send(embed=processing_embed)
+                reply = self.responder.reply(ctx.channel, processing_embed)
                 
-                try:
-                    # Baixar a imagem
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(attachment.url) as resp:
-                            if resp.status == 200:
-                                image_data = await resp.read()
-                            else:
-                                raise Exception("Erro ao baixar a imagem")
-                            
-                    #Processar Imagem pra diminuir o tempo
-                    def preprocess_image(image_bytes):
-                        # Convert bytes to numpy array
-                        nparr = np.frombuffer(image_bytes, np.uint8)
-                        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-                        # Convert to grayscale
-                        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-                        # Sharpen the image
-                        blurred = cv2.GaussianBlur(gray, (0, 0), 3)
-                        sharpened = cv2.addWeighted(gray, 1.5, blurred, -0.5, 0)
-
-                        # Adaptive threshold for better text separation
-                        thresh = cv2.adaptiveThreshold(
-                            sharpened, 255,
-                            cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                            cv2.THRESH_BINARY,
-                            11, 2
-                        )
-
-                        # Resize if necessary
-                        max_height = 1024
-                        height, width = thresh.shape
-                        if height > max_height:
-                            scale = max_height / height
-                            thresh = cv2.resize(thresh, (int(width * scale), max_height))
-
-                        # Encode to bytes
-                        is_success, buffer = cv2.imencode(".jpg", thresh)
-                        if is_success:
-                            return buffer.tobytes()
-                    
-                    image_data = preprocess_image(image_data)
-                    
-                    # Processar OCR
-                    texts = self.ocr.perform_ocr(image_data)
-                    
-                    if texts and len(texts) > 0:
-                        extracted_text = texts[0].description
-                        
-                        # Limitar tamanho do texto para Discord
-                        if len(extracted_text) > 1900:
-                            extracted_text = extracted_text[:1900] + "..."
-                        
-                        embed = discord.Embed(
-                            title="📝 Texto Extraído",
-                            description=f"```\n{extracted_text}\n```",
-                            color=0x00ff00
-                        )
-                        embed.add_field(
-                            name="📊 Estatísticas",
-                            value=f"**Caracteres:** {len(texts[0].description)}\n**Palavras:** {len(texts[0].description.split())}\n**Elementos detectados:** {len(texts)}",
-                            inline=False
-                        )
-                        embed.set_footer(text=f"Solicitado por {ctx.author.display_name}")
-                        
-                        await processing_msg.edit(embed=embed)
-                        
-                        # Se o texto for muito longo, enviar como arquivo
-                        if len(texts[0].description) > 1900:
-                            text_file = io.StringIO(texts[0].description)
-                            file = discord.File(text_file, filename="texto_extraido.txt")
-                            await ctx.send("📎 Texto completo:", file=file)
-                    
-                    else:
-                        embed = discord.Embed(
-                            title="❌ Nenhum Texto Encontrado",
-                            description="Não foi possível detectar texto na imagem.",
-                            color=0xff9900
-                        )
-                        await processing_msg.edit(embed=embed)
+                # Com a fila ativa, um worker processa o pedido e a resposta chega pelo loop de entrega
+                if self.jobs:
+                    await self._enqueue(ctx, 'ocr', reply, [self._job_attachment(attachment) for attachment in images],
+                                        mode=mode)
+                    return
                 
-                except Exception as e:
-                    embed = discord.Embed(
-                        title="❌ Erro no Processamento",
-                        description=f"Ocorreu um erro ao processar a imagem: {str(e)}",
-                        color=0xff0000
-                    )
-                    await processing_msg.edit(embed=embed)
+                # Baixar e processar todas as imagens em paralelo
+                admit = self._admission(ctx, 'ocr', reply)
+                results = await self.pipeline.process_all(images, lambda attachment: self._ocr_attachment(attachment, admit, mode))
+                await self._send_ocr_results(reply, ctx.author.display_name,
+                                             [attachment.filename for attachment in images], results)
             
             else:
                 embed = discord.Embed(
@@ -268,7 +381,12 @@ class ApoiadorBot:
                 )
                 embed.add_field(
                     name="📤 Anexar Imagem",
-                    value="Envie o comando `!ocr` junto com uma imagem anexada",
+                    value="Envie o comando `!ocr` junto com uma ou mais imagens anexadas",
+                    inline=False
+                )
+                embed.add_field(
+                    name="🧾 Modo de Detecção",
+                    value="`!ocr texto` para prints e textos esparsos, `!ocr documento` para páginas densas; sem modo, o bot escolhe pela densidade do texto",
                     inline=False
                 )
                 embed.add_field(
@@ -284,9 +402,10 @@ class ApoiadorBot:
                 await ctx.send(embed=embed)
 
         @self.bot.command(name='ocr_quality')
-        async def ocr_command(ctx):
+        async def ocr_command(ctx, modo: str = 'auto'):
             """Extrai texto de uma imagem anexada ou URL"""
-            if not self.ocr:
+            await self._load_ocr()
+            if not self.vision_ready:
                 embed = discord.Embed(
                     title="❌ OCR Indisponível",
                     description="O serviço de OCR não está configurado. Verifique as credenciais do Google Cloud.",
@@ -295,12 +414,16 @@ class ApoiadorBot:
                 await ctx.send(embed=embed)
                 return
             
+            mode = await self._detection_mode(ctx, modo)
+            if not mode:
+                return
+            
             # Verificar se há anexos na mensagem
             if ctx.message.attachments:
                 attachment = ctx.message.attachments[0]
                 
                 # Verificar se é uma imagem
-                if not any(attachment.filename.lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp']):
+                if not self._is_image(attachment):
                     embed = discord.Embed(
                         title="❌ Formato Inválido",
                         description="Por favor, envie uma imagem válida (PNG, JPG, JPEG, GIF, BMP, WEBP).",
@@ -315,62 +438,27 @@ class ApoiadorBot:
                     description="Extraindo texto da imagem, aguarde...",
                     color=0xffff00
                 )
-                processing_msg = await ctx.send(embed=processing_embed)
+                reply = self.responder.reply(ctx.channel, processing_embed)
+                
+                if self.jobs:
+                    await self._enqueue(ctx, 'ocr_quality', reply, [self._job_attachment(attachment)], mode=mode)
+                    return
                 
                 try:
-                    # Baixar a imagem
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(attachment.url) as resp:
-                            if resp.status == 200:
-                                image_data = await resp.read()
-                            else:
-                                raise Exception("Erro ao baixar a imagem")
+                    # Baixar a imagem pela sessão compartilhada
+                    image_data = await self._download_attachment(attachment)
                     
-                    # Processar OCR
-                    texts = self.ocr.perform_ocr(image_data)
-                    
-                    if texts and len(texts) > 0:
-                        extracted_text = texts[0].description
-                        
-                        # Limitar tamanho do texto para Discord
-                        if len(extracted_text) > 1900:
-                            extracted_text = extracted_text[:1900] + "..."
-                        
-                        embed = discord.Embed(
-                            title="📝 Texto Extraído",
-                            description=f"```\n{extracted_text}\n```",
-                            color=0x00ff00
-                        )
-                        embed.add_field(
-                            name="📊 Estatísticas",
-                            value=f"**Caracteres:** {len(texts[0].description)}\n**Palavras:** {len(texts[0].description.split())}\n**Elementos detectados:** {len(texts)}",
-                            inline=False
-                        )
-                        embed.set_footer(text=f"Solicitado por {ctx.author.display_name}")
-                        
-                        await processing_msg.edit(embed=embed)
-                        
-                        # Se o texto for muito longo, enviar como arquivo
-                        if len(texts[0].description) > 1900:
-                            text_file = io.StringIO(texts[0].description)
-                            file = discord.File(text_file, filename="texto_extraido.txt")
-                            await ctx.send("📎 Texto completo:", file=file)
-                    
-                    else:
-                        embed = discord.Embed(
-                            title="❌ Nenhum Texto Encontrado",
-                            description="Não foi possível detectar texto na imagem.",
-                            color=0xff9900
-                        )
-                        await processing_msg.edit(embed=embed)
-                
-                except Exception as e:
-                    embed = discord.Embed(
-                        title="❌ Erro no Processamento",
-                        description=f"Ocorreu um erro ao processar a imagem: {str(e)}",
-                        color=0xff0000
+                    # Processar OCR (resultados repetidos vêm do cache)
+                    result = await self.pipeline.ocr_quality(
+                        image_data,
+                        admit=self._admission(ctx, 'ocr_quality', reply),
+                        mode=mode
                     )
-                    await processing_msg.edit(embed=embed)
+                except Exception as e:
+                    result = e
+                
+                await self._send_ocr_results(reply, ctx.author.display_name,
+                                             [attachment.filename], [result])
             
             else:
                 embed = discord.Embed(
@@ -398,7 +486,8 @@ class ApoiadorBot:
         @self.bot.command(name='ocr_url')
         async def ocr_url_command(ctx, url: str = None):
             """Extrai texto de uma imagem via URL"""
-            if not self.ocr:
+            await self._load_ocr()
+            if not self.vision_ready:
                 embed = discord.Embed(
                     title="❌ OCR Indisponível",
                     description="O serviço de OCR não está configurado.",
@@ -422,60 +511,28 @@ class ApoiadorBot:
                 description="Baixando e processando imagem da URL...",
                 color=0xffff00
             )
-            processing_msg = await ctx.send(embed=processing_embed)
+            reply = self.responder.reply(ctx.channel, processing_embed)
             
-            try:
-                # Usar o método process_image_url da classe OCR
-                result = self.ocr.process_image_url(url, output_format='structured')
-                
-                if result and result.get('text'):
-                    extracted_text = result['text']
-                    
-                    # Limitar tamanho do texto para Discord
-                    display_text = extracted_text
-                    if len(extracted_text) > 1900:
-                        display_text = extracted_text[:1900] + "..."
-                    
-                    embed = discord.Embed(
-                        title="📝 Texto Extraído da URL",
-                        description=f"```\n{display_text}\n```",
-                        color=0x00ff00
-                    )
-                    embed.add_field(
-                        name="📊 Estatísticas",
-                        value=f"**Caracteres:** {len(extracted_text)}\n**Palavras:** {result.get('word_count', 0)}\n**Confiança:** {result.get('confidence', 0):.2f}",
-                        inline=False
-                    )
-                    embed.set_footer(text=f"Solicitado por {ctx.author.display_name}")
-                    
-                    await processing_msg.edit(embed=embed)
-                    
-                    # Se o texto for muito longo, enviar como arquivo
-                    if len(extracted_text) > 1900:
-                        text_file = io.StringIO(extracted_text)
-                        file = discord.File(text_file, filename="texto_extraido_url.txt")
-                        await ctx.send("📎 Texto completo:", file=file)
-                
-                else:
-                    embed = discord.Embed(
-                        title="❌ Nenhum Texto Encontrado",
-                        description="Não foi possível detectar texto na imagem da URL.",
-                        color=0xff9900
-                    )
-                    await processing_msg.edit(embed=embed)
+            # Com a fila ativa, a Vision só é chamada pelos workers, que dividem a cota entre si
+            if self.jobs:
+                filename = os.path.basename(url.split('?')[0]) or url
+                await self._enqueue(ctx, 'ocr_url', reply, [{'url': url, 'filename': filename}])
+                return
             
+            try:
+                # Baixar passando pela admissão (cabeçalho, tamanho) e extrair o texto sem pré-processamento
+                image_data = await self.pipeline.download(url, self.http_session)
+                result = await self.pipeline.ocr_quality(image_data, admit=self._admission(ctx, 'ocr_url', reply))
             except Exception as e:
-                embed = discord.Embed(
-                    title="❌ Erro no Processamento",
-                    description=f"Erro ao processar imagem da URL: {str(e)}",
-                    color=0xff0000
-                )
-                await processing_msg.edit(embed=embed)
+                result = e
+            
+            await self._send_url_result(reply, ctx.author.display_name, result)
         
         @self.bot.command(name='apoiador')
         async def apoiador_command(ctx):
             """Check if in the image there is an instance of 'codigo de apoiador' and their respective code"""
 
+            await self._load_ocr()
             if not self.ocr:
                 embed = discord.Embed(
                     title="❌ Serviço de Apoiador Automático Indisponível",
@@ -487,10 +544,10 @@ class ApoiadorBot:
             
             # Verificar se há anexos na mensagem
             if ctx.message.attachments:
-                attachment = ctx.message.attachments[0]
+                images = [attachment for attachment in ctx.message.attachments if self._is_image(attachment)]
                 
-                # Verificar se é uma imagem
-                if not any(attachment.filename.lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp']):
+                # Verificar se há ao menos uma imagem
+                if not images:
                     embed = discord.Embed(
                         title="❌ Formato Inválido",
                         description="Por favor, envie uma imagem válida (PNG, JPG, JPEG, GIF, BMP, WEBP).",
@@ -502,127 +559,22 @@ class ApoiadorBot:
                 # Mostrar que está processando
                 processing_embed = discord.Embed(
                     title="🔄 Processando...",
-                    description="Analisando a imagem em busca do código de apoiador...",
+                    description="Analisando a imagem em busca do código de apoiador..." if len(images) == 1
+                                else f"Analisando {len(images)} imagens em busca do código de apoiador...",
                     color=0xffff00
                 )
-                processing_msg = await ctx.send(embed=processing_embed)
+                reply = self.responder.reply(ctx.channel, processing_embed)
                 
-                try:
-                    # Baixar a imagem
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(attachment.url) as resp:
-                            if resp.status == 200:
-                                image_data = await resp.read()
-                            else:
-                                raise Exception("Erro ao baixar a imagem")
-                            
-                    #Processar Imagem pra diminuir o tempo
-                    def preprocess_image(image_bytes):
-                        # Convert bytes to numpy array
-                        nparr = np.frombuffer(image_bytes, np.uint8)
-                        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-                        # Convert to grayscale
-                        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-                        # Sharpen the image
-                        blurred = cv2.GaussianBlur(gray, (0, 0), 3)
-                        sharpened = cv2.addWeighted(gray, 1.5, blurred, -0.5, 0)
-
-                        # Adaptive threshold for better text separation
-                        thresh = cv2.adaptiveThreshold(
-                            sharpened, 255,
-                            cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                            cv2.THRESH_BINARY,
-                            11, 2
-                        )
-
-                        # Resize if necessary
-                        max_height = 1024
-                        height, width = thresh.shape
-                        if height > max_height:
-                            scale = max_height / height
-                            thresh = cv2.resize(thresh, (int(width * scale), max_height))
-
-                        # Encode to bytes
-                        is_success, buffer = cv2.imencode(".jpg", thresh)
-                        if is_success:
-                            return buffer.tobytes()
-                    
-                    image_data = preprocess_image(image_data)
-                    # Processar OCR
-                    texts = self.ocr.perform_ocr(image_data)
-                    
-                    if texts and len(texts) > 0:
-                        extracted_text = texts[0].description.lower()  # Converter para minúsculas para busca
-                        
-                        # Definir os códigos e textos a procurar
-
-                        target_code = 'Vascurado'
-                        target_phrases = [f"APOIE-UM-CRIADOR: {target_code}",f"Support-a-Creator: {target_code}",f"SUPPORT-A-CREATOR: {target_code}"]
-
-                        flag = False
-                        for phrase in target_phrases:
-                            if phrase.lower() in extracted_text or target_code.lower in extracted_text:
-                                flag = True
-                                break
-                        if flag:
-                            # Sucesso - encontrou ambos
-                            success_embed = discord.Embed(
-                                title="✅ Código de Apoiador Encontrado!",
-                                description=f"**Código detectado:** {target_code.upper()}",
-                                color=0x32CD32
-                            )
-                            success_embed.add_field(
-                                name="📋 Status", 
-                                value="Código de apoiador válido confirmado!", 
-                                inline=False
-                            )
-                            success_embed.set_footer(text=f"Verificado por {ctx.author.display_name}")
-                            await processing_msg.edit(embed=success_embed)
-                            
-                            
-                        else:
-                            # Não encontrou "codigo de apoiador"
-                            not_found_embed = discord.Embed(
-                                title="❌ Código de Apoiador Não Encontrado",
-                                description="Não foi possível encontrar o Código de Apoiador na imagem",
-                                color=0xff0000
-                            )
-                            not_found_embed.add_field(
-                                name="💡 Dica", 
-                                value="Certifique-se de que a imagem contém o texto 'Código de Apoiador' de forma legível.", 
-                                inline=False
-                            )
-                            await processing_msg.edit(embed=not_found_embed)
-                    
-                    else:
-                        # Nenhum texto foi detectado
-                        no_text_embed = discord.Embed(
-                            title="❌ Nenhum Texto Detectado",
-                            description="Não foi possível detectar texto na imagem.",
-                            color=0xff0000
-                        )
-                        no_text_embed.add_field(
-                            name="💡 Sugestões",
-                            value="• Verifique se a imagem está nítida\n• Certifique-se de que há texto visível\n• Tente uma imagem com melhor qualidade",
-                            inline=False
-                        )
-                        await processing_msg.edit(embed=no_text_embed)
-                        
-                except Exception as e:
-                    error_embed = discord.Embed(
-                        title="❌ Erro no Processamento",
-                        description=f"Ocorreu um erro ao processar a imagem.",
-                        color=0xff0000
-                    )
-                    error_embed.add_field(
-                        name="🔧 Detalhes do Erro", 
-                        value=f"```{str(e)}```", 
-                        inline=False
-                    )
-                    await processing_msg.edit(embed=error_embed)
-                    print(f"Erro no comando apoiador: {e}")  # Log para debug
+                if self.jobs:
+                    await self._enqueue(ctx, 'apoiador', reply, [self._job_attachment(attachment) for attachment in images])
+                    return
+                
+                # Verificar todas as imagens em paralelo
+                admit = self._admission(ctx, 'apoiador', reply)
+                guild_id = ctx.guild.id if ctx.guild else None
+                verdicts = await self.pipeline.process_all(images, lambda attachment: self._apoiador_attachment(attachment, admit, guild_id))
+                await self._send_apoiador_results(reply, ctx.author.display_name,
+                                                  [attachment.filename for attachment in images], verdicts)
                     
             else:
                 embed = discord.Embed(
@@ -632,12 +584,12 @@ class ApoiadorBot:
                 )
                 embed.add_field(
                     name="📤 Anexar Imagem",
-                    value="Envie o comando `!apoiador` junto com a foto anexada",
+                    value="Envie o comando `!apoiador` junto com uma ou mais fotos anexadas",
                     inline=False
                 )
                 embed.add_field(
                     name="🎯 O que procura",
-                    value="• Texto 'Código de Apoiador'\n• Código específico: 'Vascurado'",
+                    value="• Texto 'APOIE-UM-CRIADOR' ou 'SUPPORT-A-CREATOR'\n• Um dos códigos cadastrados no servidor (`!codigos`)",
                     inline=False
                 )
                 embed.add_field(
@@ -648,24 +600,523 @@ class ApoiadorBot:
                 await ctx.send(embed=embed)
                             
         
+        @self.bot.command(name='codigos')
+        async def list_codes(ctx):
+            """Lista os códigos de apoiador aceitos neste servidor"""
+            await self._load_ocr()
+            if not self.codes:
+                await ctx.send("❌ Serviço de Apoiador Automático Indisponível")
+                return
+
+            guild_id = ctx.guild.id if ctx.guild else None
+            codes = self.codes.codes(guild_id)
+            default = not codes
+            if default:
+                codes = self.codes.default.codes
+
+            shown = ", ".join(f"`{code}`" for code in codes[:50])
+            if len(codes) > 50:
+                shown += f" e mais {len(codes) - 50}"
+            embed = discord.Embed(
+                title=f"🎯 Códigos de Apoiador ({len(codes)})",
+                description=shown or "Nenhum código cadastrado.",
+                color=0x0099ff
+            )
+            if default:
+                embed.set_footer(text="Códigos padrão • use !codigo_add para cadastrar os do servidor")
+            await ctx.send(embed=embed)
+
+        @self.bot.command(name='codigo_add')
+        @commands.guild_only()
+        @commands.has_permissions(manage_guild=True)
+        async def add_codes(ctx, *codes: str):
+            """Cadastra um ou mais códigos de apoiador para este servidor"""
+            await self._load_ocr()
+            if not self.codes:
+                await ctx.send("❌ Serviço de Apoiador Automático Indisponível")
+                return
+            if not codes:
+                await ctx.send("Use: `!codigo_add <código> [outros códigos...]`")
+                return
+
+            added = await self.codes.add(ctx.guild.id, codes, added_by=ctx.author.id)
+            embed = discord.Embed(
+                title="✅ Códigos Cadastrados" if added else "ℹ️ Nada a cadastrar",
+                description=", ".join(f"`{code}`" for code in added) if added else "Os códigos já estavam cadastrados.",
+                color=0x00ff00 if added else 0xff9900
+            )
+            await ctx.send(embed=embed)
+
+        @self.bot.command(name='codigo_remover')
+        @commands.guild_only()
+        @commands.has_permissions(manage_guild=True)
+        async def remove_code(ctx, code: str = None):
+            """Remove um código de apoiador deste servidor"""
+            await self._load_ocr()
+            if not self.codes:
+                await ctx.send("❌ Serviço de Apoiador Automático Indisponível")
+                return
+            if not code:
+                await ctx.send("Use: `!codigo_remover <código>`")
+                return
+
+            if await self.codes.remove(ctx.guild.id, code):
+                await ctx.send(embed=discord.Embed(title="🗑️ Código Removido", description=f"`{code}`", color=0x00ff00))
+            else:
+                await ctx.send(embed=discord.Embed(title="❌ Código não encontrado", description=f"`{code}`", color=0xff0000))
+
         @self.bot.command(name='ocr_status')
         async def ocr_status(ctx):
             """Mostra o status do serviço OCR"""
+            await self._load_ocr()
             embed = discord.Embed(
                 title="🔍 Status do OCR",
                 color=0x0099ff
             )
             
             if self.ocr:
-                embed.add_field(name="✅ Status", value="OCR Configurado e Funcionando", inline=False)
-                embed.add_field(name="🔧 Serviço", value="Google Cloud Vision API", inline=True)
+                circuit = self.ocr.circuit
+                summary = stage_summary()
+                # Estado medido: circuito da Vision, latência e taxa de erro das chamadas
+                embed.add_field(name="📡 Status", value=self._vision_health(summary), inline=False)
+                services = ["Google Cloud Vision API"] if self.vision_ready else []
+                if self.local_ocr:
+                    services.append("Tesseract (local)")
+                embed.add_field(name="🔧 Serviço", value=" + ".join(services), inline=True)
                 embed.add_field(name="📋 Recursos", value="Detecção de texto, Análise de documentos", inline=True)
+                if self.vision_ready:
+                    circuit_labels = {
+                        circuit.CLOSED: "🟢 Fechado (operando normalmente)",
+                        circuit.HALF_OPEN: "🟡 Semiaberto (testando recuperação)",
+                        circuit.OPEN: f"🔴 Aberto (nova tentativa em {circuit.retry_in():.0f}s)",
+                    }
+                    embed.add_field(
+                        name="🔌 Circuito da Vision",
+                        value=f"{circuit_labels[circuit.state]}\n**Falhas recentes:** {circuit.failures} | "
+                              f"**Aberturas:** {circuit.stats['opened']} | **Recusados:** {circuit.stats['rejected']}",
+                        inline=False
+                    )
+                if self.local_ocr:
+                    stats = self.router.stats
+                    embed.add_field(
+                        name="🧭 Roteamento",
+                        value=f"**Local:** {stats['local']} | **Escalados para a Vision:** {stats['escalated']} | "
+                              f"**Direto na Vision:** {stats['remote']} | **Fallback local:** {stats['fallback']}",
+                        inline=False
+                    )
+                if self.scheduler:
+                    stats = self.scheduler.stats
+                    embed.add_field(
+                        name="🚦 Fila",
+                        value=f"**Aguardando:** {self.scheduler.depth} | **Admitidos:** {stats['admitted']} | "
+                              f"**Enfileirados:** {stats['queued']} | **Recusados:** {stats['rejected']}",
+                        inline=False
+                    )
+                if self.jobs:
+                    counts = await self.jobs.counts()
+                    embed.add_field(
+                        name="🏭 Workers",
+                        value=f"**Processos:** {self.ocr_workers} | **Na fila:** {counts['queued']} | "
+                              f"**Em andamento:** {counts['leased']} | **A entregar:** {counts['done'] + counts['failed']}",
+                        inline=False
+                    )
+                stats = self.pipeline.image_admission.stats
+                if stats['rejected'] or stats['downscaled']:
+                    embed.add_field(
+                        name="🛂 Admissão",
+                        value=f"**Recusadas antes do download:** {stats['rejected']} | **Reduzidas para a Vision:** {stats['downscaled']}",
+                        inline=False
+                    )
+                stats = self.responder.stats
+                embed.add_field(
+                    name="💬 Respostas",
+                    value=f"**Enviadas:** {stats['sent']} | **Editadas:** {stats['edited']} | "
+                          f"**Sem \"Processando\":** {stats['placeholders_skipped']} | **Agrupadas:** {stats['coalesced']}",
+                    inline=False
+                )
+                if self.ocr.cache:
+                    stats = self.ocr.cache.stats
+                    embed.add_field(
+                        name="🗄️ Cache",
+                        value=f"**Memória:** {stats['memory_hits']} | **Disco:** {stats['disk_hits']} | "
+                              f"**Compartilhados:** {stats['deduplicated']} | **Misses:** {stats['misses']}\n"
+                              f"**Taxa de acerto:** {self.ocr.cache.hit_rate:.0%}",
+                        inline=False
+                    )
+                if summary:
+                    lines = [
+                        f"**{stage}:** {p50 * 1000:.0f} / {p95 * 1000:.0f} / {p99 * 1000:.0f} ms ({count})"
+                        for stage, (count, (p50, p95, p99)) in sorted(summary.items())
+                    ]
+                    embed.add_field(name="⏱️ Latência (p50/p95/p99)", value="\n".join(lines), inline=False)
             else:
                 embed.add_field(name="❌ Status", value="OCR Não Disponível", inline=False)
                 embed.add_field(name="⚠️ Motivo", value="Credenciais não configuradas", inline=False)
             
             await ctx.send(embed=embed)
     
+    def _vision_health(self, summary) -> str:
+        """Resume a saúde da Vision a partir do circuit breaker e da latência medida"""
+        circuit = self.ocr.circuit
+        if not self.vision_ready:
+            return "⚠️ Somente OCR local (Vision sem credenciais)"
+        if circuit.state == circuit.OPEN:
+            return f"🔴 Vision fora do ar: circuito aberto, nova tentativa em {circuit.retry_in():.0f}s"
+        if circuit.state == circuit.HALF_OPEN:
+            return "🟡 Vision se recuperando: testando com poucas chamadas"
+
+        count, (_, p95, _) = summary.get('vision', (0, (0.0, 0.0, 0.0)))
+        if not count:
+            if self.jobs:
+                # As chamadas são feitas e medidas nos processos de worker
+                return "🟢 Vision pronta; as chamadas são feitas pelos workers"
+            return "🟢 Vision pronta, nenhuma chamada feita ainda"
+        error_rate = stage_errors().get('vision', 0) / count
+        detail = f"p95 de {p95 * 1000:.0f} ms em {count} chamadas, {error_rate:.0%} com erro"
+        if p95 > self.VISION_SLOW_P95 or error_rate > self.VISION_MAX_ERROR_RATE:
+            return f"🟡 Vision lenta ou instável: {detail}"
+        return f"🟢 Vision respondendo: {detail}"
+
+    def _admission(self, ctx, command: str, reply=None):
+        """Cria a etapa que reserva uma chamada à Vision para este pedido no agendador"""
+        notified = False
+
+        async def on_queued(position: int):
+            nonlocal notified
+            if reply and not notified:
+                notified = True
+                embed = discord.Embed(
+                    title="⏳ Aguardando na fila...",
+                    description=f"Seu pedido está na posição **{position}** da fila de OCR.",
+                    color=0xffff00
+                )
+                await reply.update(embed)
+
+        guild_id = ctx.guild.id if ctx.guild else None
+        return self.pipeline.admission(guild_id, ctx.author.id, command, on_queued=on_queued)
+
+    @staticmethod
+    def _is_image(attachment) -> bool:
+        # O tipo informado pelo Discord vale mais que a extensão; o conteúdo é conferido no download
+        if attachment.content_type:
+            return attachment.content_type.lower().startswith('image/')
+        return attachment.filename.lower().endswith(IMAGE_EXTENSIONS)
+
+    async def _detection_mode(self, ctx, modo: str):
+        """Traduz o modo pedido no comando; responde com os modos válidos quando não reconhece"""
+        mode = self.DETECTION_MODES.get(modo.lower())
+        if not mode:
+            embed = discord.Embed(
+                title="❌ Modo Inválido",
+                description="Use `auto`, `texto` ou `documento`.",
+                color=0xff0000
+            )
+            await ctx.send(embed=embed)
+        return mode
+
+    async def _ocr_attachment(self, attachment, admit=None, mode='auto'):
+        """Baixa, pré-processa e extrai o texto de um anexo"""
+        image_data = await self._download_attachment(attachment)
+        return await self.pipeline.ocr_image(image_data, admit, mode)
+
+    async def _apoiador_attachment(self, attachment, admit=None, guild_id=None) -> dict:
+        """Verifica se um anexo contém o código de apoiador"""
+        image_data = await self._download_attachment(attachment)
+        return await self.pipeline.apoiador_image(image_data, admit, guild_id)
+
+    @staticmethod
+    def _job_attachment(attachment) -> dict:
+        """Dados de um anexo do Discord que o worker usa para baixá-lo e admiti-lo"""
+        return {'url': attachment.url, 'filename': attachment.filename, 'size': attachment.size,
+                'width': attachment.width, 'height': attachment.height, 'content_type': attachment.content_type}
+
+    async def _enqueue(self, ctx, command: str, reply, attachments, **options):
+        """Grava o pedido na fila durável; um worker o processa e a resposta chega pelo loop de entrega"""
+        # O worker responde editando o "Processando...", que por isso precisa existir já
+        processing_msg = await reply.show()
+        await self.jobs.put(command, dict({
+            'channel_id': ctx.channel.id,
+            'message_id': processing_msg.id,
+            'guild_id': ctx.guild.id if ctx.guild else None,
+            'author_id': ctx.author.id,
+            'author_name': ctx.author.display_name,
+            'request_id': REQUEST_ID.get(),
+            'attachments': attachments,
+        }, **options), owner=self.job_owner)
+
+    async def _deliver_results(self):
+        """Edita as mensagens de "Processando..." com os resultados dos jobs concluídos pelos workers"""
+        await self.bot.wait_until_ready()
+        poll_interval = float(os.getenv('OCR_QUEUE_POLL_MS', '250')) / 1000
+        while not self.bot.is_closed():
+            try:
+                jobs = await self.jobs.finished(owner=self.job_owner)
+            except Exception as e:
+                print(f"Erro ao ler a fila de OCR: {e}")
+                jobs = []
+
+            delivered = 0
+            for job in jobs:
+                try:
+                    await self._deliver(job)
+                except (discord.NotFound, discord.Forbidden):
+                    pass  # Mensagem apagada ou canal inacessível: não há a quem responder
+                except Exception as e:
+                    try:
+                        attempts = await self.jobs.delivery_failed(job.id)
+                    except Exception as count_error:
+                        print(f"Erro ao registrar a falha de entrega do job {job.id}: {count_error}")
+                        continue
+                    if attempts < self.DELIVERY_ATTEMPTS:
+                        # Tenta de novo na próxima volta
+                        print(f"Erro ao entregar o job {job.id} (tentativa {attempts}): {e}")
+                        continue
+                    print(f"Desistindo do job {job.id} após {attempts} tentativas de entrega: {e}")
+
+                try:
+                    await self.jobs.acknowledge(job.id)
+                    delivered += 1
+                except Exception as e:
+                    print(f"Erro ao confirmar o job {job.id}: {e}")
+
+            self._supervise_workers()
+
+            # Sem nenhuma entrega, espera antes de tentar de novo em vez de girar em falso
+            if not delivered:
+                await asyncio.sleep(poll_interval)
+
+    async def _deliver(self, job):
+        payload = job.payload
+        channel = self.bot.get_channel(payload['channel_id']) or await self.bot.fetch_channel(payload['channel_id'])
+        reply = self.responder.existing(channel, channel.get_partial_message(payload['message_id']))
+        filenames = [attachment['filename'] for attachment in payload['attachments']]
+
+        if job.state == FAILED:
+            error = JobError(job.result['error'] if job.result else "Falha no processamento")
+            results = [error] * len(filenames)
+        else:
+            results = [decode_outcome(entry) for entry in job.result['results']]
+
+        if job.command == 'apoiador':
+            await self._send_apoiador_results(reply, payload['author_name'], filenames, results)
+        elif job.command == 'ocr_url':
+            await self._send_url_result(reply, payload['author_name'], results[0])
+        else:
+            await self._send_ocr_results(reply, payload['author_name'], filenames, results)
+
+    async def _send_ocr_results(self, reply, author_name, filenames, results):
+        """Responde com o texto extraído de uma imagem, ou com um resumo quando há várias"""
+        if len(filenames) > 1:
+            await self._send_ocr_summary(reply, author_name, filenames, results)
+            return
+
+        result = results[0]
+        if isinstance(result, Exception):
+            embed = discord.Embed(
+                title="❌ Erro no Processamento",
+                description=f"Ocorreu um erro ao processar a imagem: {str(result)}",
+                color=0xff0000
+            )
+            await reply.finish(embed)
+        
+        elif result:
+            extracted_text = result.text
+            
+            # Limitar tamanho do texto para Discord
+            if len(extracted_text) > 1900:
+                extracted_text = extracted_text[:1900] + "..."
+            
+            embed = discord.Embed(
+                title="📝 Texto Extraído",
+                description=f"```\n{extracted_text}\n```",
+                color=0x00ff00
+            )
+            embed.add_field(
+                name="📊 Estatísticas",
+                value=f"**Caracteres:** {len(result.text)}\n**Palavras:** {len(result.text.split())}\n**Elementos detectados:** {result.word_count}",
+                inline=False
+            )
+            embed.set_footer(text=f"Solicitado por {author_name}")
+            
+            # Se o texto for muito longo, o arquivo vai junto na mesma resposta
+            file = None
+            if len(result.text) > 1900:
+                file = discord.File(io.StringIO(result.text), filename="texto_extraido.txt")
+            await reply.finish(embed, file)
+        
+        else:
+            embed = discord.Embed(
+                title="❌ Nenhum Texto Encontrado",
+                description="Não foi possível detectar texto na imagem.",
+                color=0xff9900
+            )
+            await reply.finish(embed)
+
+    async def _send_ocr_summary(self, reply, author_name, filenames, results):
+        """Responde com um embed agregado e um arquivo com o texto de todas as imagens"""
+        embed = discord.Embed(
+            title=f"📝 Texto Extraído de {len(filenames)} Imagens",
+            color=0x00ff00
+        )
+        sections = []
+        for filename, result in zip(filenames, results):
+            if isinstance(result, Exception):
+                summary = f"❌ Erro: {str(result)[:200]}"
+            elif result:
+                full_text = result.text
+                preview = full_text[:200] + ("..." if len(full_text) > 200 else "")
+                summary = f"```\n{preview}\n```**Caracteres:** {len(full_text)} | **Palavras:** {len(full_text.split())}"
+                sections.append(f"===== {filename} =====\n{full_text}\n")
+            else:
+                summary = "Nenhum texto encontrado."
+            embed.add_field(name=f"🖼️ {filename}", value=summary, inline=False)
+        embed.set_footer(text=f"Solicitado por {author_name}")
+
+        file = None
+        if sections:
+            file = discord.File(io.StringIO("\n".join(sections)), filename="texto_extraido.txt")
+        await reply.finish(embed, file)
+
+    async def _send_url_result(self, reply, author_name, result):
+        """Responde ao !ocr_url com o texto extraído da imagem da URL"""
+        if isinstance(result, Exception):
+            embed = discord.Embed(
+                title="❌ Erro no Processamento",
+                description=f"Erro ao processar imagem da URL: {str(result)}",
+                color=0xff0000
+            )
+            await reply.finish(embed)
+            return
+        
+        result = result.to_dict() if result else None
+        if result and result.get('text'):
+            extracted_text = result['text']
+            
+            # Limitar tamanho do texto para Discord
+            display_text = extracted_text
+            if len(extracted_text) > 1900:
+                display_text = extracted_text[:1900] + "..."
+            
+            embed = discord.Embed(
+                title="📝 Texto Extraído da URL",
+                description=f"```\n{display_text}\n```",
+                color=0x00ff00
+            )
+            embed.add_field(
+                name="📊 Estatísticas",
+                value=f"**Caracteres:** {len(extracted_text)}\n**Palavras:** {result.get('word_count', 0)}\n**Confiança:** {result.get('confidence', 0):.2f}",
+                inline=False
+            )
+            embed.set_footer(text=f"Solicitado por {author_name}")
+            
+            # Se o texto for muito longo, o arquivo vai junto na mesma resposta
+            file = None
+            if len(extracted_text) > 1900:
+                file = discord.File(io.StringIO(extracted_text), filename="texto_extraido_url.txt")
+            await reply.finish(embed, file)
+        
+        else:
+            embed = discord.Embed(
+                title="❌ Nenhum Texto Encontrado",
+                description="Não foi possível detectar texto na imagem da URL.",
+                color=0xff9900
+            )
+            await reply.finish(embed)
+
+    async def _send_apoiador_results(self, reply, author_name, filenames, verdicts):
+        """Responde com o veredito de uma imagem, ou com um resumo quando há várias"""
+        if len(filenames) > 1:
+            await self._send_apoiador_summary(reply, author_name, filenames, verdicts)
+            return
+
+        verdict = verdicts[0]
+        if isinstance(verdict, Exception):
+            error_embed = discord.Embed(
+                title="❌ Erro no Processamento",
+                description=f"Ocorreu um erro ao processar a imagem.",
+                color=0xff0000
+            )
+            error_embed.add_field(
+                name="🔧 Detalhes do Erro", 
+                value=f"```{str(verdict)}```", 
+                inline=False
+            )
+            await reply.finish(error_embed)
+            print(f"Erro no comando apoiador: {verdict}")  # Log para debug
+
+        elif verdict['found']:
+            # Sucesso - encontrou ambos
+            success_embed = discord.Embed(
+                title="✅ Código de Apoiador Encontrado!",
+                description=f"**Código detectado:** {verdict['code'].upper()}",
+                color=0x32CD32
+            )
+            success_embed.add_field(
+                name="📋 Status", 
+                value=f"Código de apoiador válido confirmado! (confiança: {verdict['confidence']:.0%})", 
+                inline=False
+            )
+            footer = f"Verificado por {author_name}"
+            if verdict.get('reused'):
+                footer += " • imagem já verificada anteriormente"
+            success_embed.set_footer(text=footer)
+            await reply.finish(success_embed)
+            
+        elif verdict['text']:
+            # Não encontrou "codigo de apoiador"
+            not_found_embed = discord.Embed(
+                title="❌ Código de Apoiador Não Encontrado",
+                description="Não foi possível encontrar o Código de Apoiador na imagem",
+                color=0xff0000
+            )
+            not_found_embed.add_field(
+                name="💡 Dica", 
+                value="Certifique-se de que a imagem contém o texto 'Código de Apoiador' de forma legível.", 
+                inline=False
+            )
+            if verdict.get('code'):
+                not_found_embed.add_field(
+                    name="🔍 Mais parecido",
+                    value=f"{verdict['code'].upper()} (confiança: {verdict['confidence']:.0%})",
+                    inline=False
+                )
+            await reply.finish(not_found_embed)
+        
+        else:
+            # Nenhum texto foi detectado
+            no_text_embed = discord.Embed(
+                title="❌ Nenhum Texto Detectado",
+                description="Não foi possível detectar texto na imagem.",
+                color=0xff0000
+            )
+            no_text_embed.add_field(
+                name="💡 Sugestões",
+                value="• Verifique se a imagem está nítida\n• Certifique-se de que há texto visível\n• Tente uma imagem com melhor qualidade",
+                inline=False
+            )
+            await reply.finish(no_text_embed)
+
+    async def _send_apoiador_summary(self, reply, author_name, filenames, verdicts):
+        """Responde com um único embed contendo o veredito de cada imagem"""
+        found = sum(1 for verdict in verdicts if isinstance(verdict, dict) and verdict['found'])
+        embed = discord.Embed(
+            title=f"🔎 Código de Apoiador: {found}/{len(filenames)} imagens",
+            color=0x32CD32 if found == len(filenames) else 0xff9900 if found else 0xff0000
+        )
+        for filename, verdict in zip(filenames, verdicts):
+            if isinstance(verdict, Exception):
+                summary = f"⚠️ Erro: {str(verdict)[:200]}"
+            elif verdict['found']:
+                summary = f"✅ Código detectado: **{verdict['code'].upper()}** ({verdict['confidence']:.0%})"
+            elif verdict['text']:
+                summary = "❌ Código de apoiador não encontrado"
+            else:
+                summary = "❌ Nenhum texto detectado"
+            embed.add_field(name=f"🖼️ {filename}", value=summary, inline=False)
+        embed.set_footer(text=f"Verificado por {author_name}")
+
+        await reply.finish(embed)
+
     def setup_help_command(self):
         """Atualiza o comando de ajuda para incluir OCR"""
         
@@ -689,12 +1140,17 @@ class ApoiadorBot:
                 embed.add_field(name=command, value=description, inline=False)
             
             # Comandos OCR (se disponível)
-            if self.ocr:
+            if OCR_AVAILABLE:
                 embed.add_field(name="📝 **COMANDOS OCR**", value="Extração de texto de imagens", inline=False)
                 ocr_commands = [
-                    ("!ocr", "Extrai texto de imagem anexada"),
+                    ("!ocr [auto|texto|documento]", "Extrai texto de imagem anexada"),
+                    ("!ocr_quality [auto|texto|documento]", "Extrai texto sem pré-processamento"),
                     ("!ocr_url <link>", "Extrai texto de imagem via URL"),
-                    ("!ocr_status", "Status do serviço OCR")
+                    ("!ocr_status", "Status do serviço OCR"),
+                    ("!apoiador", "Verifica o código de apoiador na imagem anexada"),
+                    ("!codigos", "Lista os códigos de apoiador do servidor"),
+                    ("!codigo_add <códigos...>", "Cadastra códigos de apoiador (admin)"),
+                    ("!codigo_remover <código>", "Remove um código de apoiador (admin)")
                 ]
                 
                 for command, description in ocr_commands:
@@ -704,6 +1160,29 @@ class ApoiadorBot:
             embed.set_footer(text="Use ! antes de cada comando")
             await ctx.send(embed=embed)
     
+    def _start_workers(self):
+        """Inicia os processos de OCR que atendem a fila durável, cada um com uma fração da cota da Vision"""
+        if not self.jobs or not self.spawn_workers:
+            return
+        from controllers import worker as ocr_worker
+        self.worker_processes = ocr_worker.start_workers(self.ocr_workers)
+        print(f"🏭 {self.ocr_workers} worker(s) de OCR iniciados")
+
+    def _supervise_workers(self):
+        """Reinicia os workers que terminaram, para a fila não ficar parada"""
+        if not self.worker_processes:
+            return
+        from controllers import worker as ocr_worker
+        ocr_worker.supervise(self.worker_processes, lambda index: ocr_worker.start_worker(index, self.ocr_workers),
+                             self._worker_restarts, self.WORKER_RESTART_DELAY)
+
+    def _stop_workers(self):
+        """Pede aos workers que terminem os jobs em andamento e aguarda o encerramento"""
+        if self.worker_processes:
+            from controllers import worker as ocr_worker
+            ocr_worker.stop_workers(self.worker_processes)
+        self.worker_processes = []
+
     def run(self):
         """Inicia o bot"""
         # Configurar comando de ajuda atualizado
@@ -712,7 +1191,17 @@ class ApoiadorBot:
         token = os.getenv('DISCORD_TOKEN')
         if token:
             print("🚀 Iniciando o bot...")
-            self.bot.run(token)
+            setup_logging()
+            self._start_workers()
+            try:
+                # Os logs do discord.py passam pela mesma fila em vez do handler próprio da biblioteca
+                self.bot.run(token, log_handler=None)
+            finally:
+                self._stop_workers()
+                if self.pipeline:
+                    self.pipeline.close()
+                if self.jobs:
+                    self.jobs.close()
         else:
             print("❌ ERRO: Token do Discord não encontrado!")
             print("Crie um arquivo .env com:")
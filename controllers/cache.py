@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class _Inflight:
+    """A computation shared by every caller asking for the same key, and how many of them still wait."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class OCRCache:
+    """Content-addressed OCR result cache.
+
+    Results are keyed by a hash of the original image bytes plus the
+    preprocessing profile. Lookups go through a bounded in-memory LRU, then an
+    SQLite file with TTL and size-based eviction. Concurrent requests for the
+    same key share a single computation, which runs in a task of its own: one
+    caller being cancelled does not cancel it for the others, and it is only
+    cancelled once nobody waits for it anymore.
+    """
+
+    def __init__(self, path: str, dumps: Callable[[Any], bytes], loads: Callable[[bytes], Any],
+                 max_memory_items: int = 512, ttl: float = 7 * 24 * 3600,
+                 max_disk_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.dumps = dumps
+        self.loads = loads
+        self.max_memory_items = max_memory_items
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory: 'OrderedDict[str, Any]' = OrderedDict()
+        self._inflight: Dict[str, _Inflight] = {}
+        # SQLite is only ever touched from this single thread
+        self._disk_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ocr-cache')
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disk_bytes = 0
+
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'deduplicated': 0}
+
+    @staticmethod
+    def make_key(image_bytes: bytes, profile: str) -> str:
+        digest = hashlib.sha256(profile.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(image_bytes)
+        return digest.hexdigest()
+
+    @property
+    def hit_rate(self) -> float:
+        hits = self.stats['memory_hits'] + self.stats['disk_hits'] + self.stats['deduplicated']
+        total = hits + self.stats['misses']
+        return hits / total if total else 0.0
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        value = self._memory_get(key)
+        if value is not None:
+            self.stats['memory_hits'] += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats['deduplicated'] += 1
+        else:
+            inflight = self._inflight[key] = _Inflight(asyncio.ensure_future(self._fill(key, compute)))
+            inflight.task.add_done_callback(lambda _: self._forget(key, inflight))
+
+        inflight.waiters += 1
+        try:
+            return await asyncio.shield(inflight.task)
+        finally:
+            inflight.waiters -= 1
+            if not inflight.waiters and not inflight.task.done():
+                # Every caller gave up: stop the work, and let the next caller start afresh
+                self._forget(key, inflight)
+                inflight.task.cancel()
+
+    def _forget(self, key: str, inflight: _Inflight):
+        if self._inflight.get(key) is inflight:
+            del self._inflight[key]
+
+    async def _fill(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        value = await loop.run_in_executor(self._disk_executor, self._disk_get, key)
+        if value is not None:
+            self.stats['disk_hits'] += 1
+        else:
+            self.stats['misses'] += 1
+            value = await compute()
+            if value is not None:
+                await loop.run_in_executor(self._disk_executor, self._disk_put, key, value)
+
+        if value is not None:
+            self._memory_put(key, value)
+        return value
+
+    def _memory_get(self, key: str) -> Any:
+        value = self._memory.get(key)
+        if value is not None:
+            self._memory.move_to_end(key)
+        return value
+
+    def _memory_put(self, key: str, value: Any):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS ocr_cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ocr_cache_accessed ON ocr_cache(accessed)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ocr_cache_created ON ocr_cache(created)")
+            self._conn.execute("DELETE FROM ocr_cache WHERE created < ?", (time.time() - self.ttl,))
+            self._conn.commit()
+            self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()[0]
+        return self._conn
+
+    def _disk_get(self, key: str) -> Any:
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value FROM ocr_cache WHERE key = ? AND created >= ?", (key, now - self.ttl)
+        ).fetchone()
+        if row is None:
+            return None
+
+        conn.execute("UPDATE ocr_cache SET accessed = ? WHERE key = ?", (now, key))
+        conn.commit()
+        return self.loads(row[0])
+
+    def _disk_put(self, key: str, value: Any):
+        conn = self._connect()
+        data = self.dumps(value)
+        now = time.time()
+
+        previous = conn.execute("SELECT size FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+        if previous:
+            self._disk_bytes -= previous[0]
+
+        conn.execute(
+            "INSERT OR REPLACE INTO ocr_cache (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+            (key, data, len(data), now, now)
+        )
+        self._disk_bytes += len(data)
+        self._evict(conn, now)
+        conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        expired = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM ocr_cache WHERE created < ?", (now - self.ttl,)
+        ).fetchone()[0]
+        if expired:
+            conn.execute("DELETE FROM ocr_cache WHERE created < ?", (now - self.ttl,))
+            self._disk_bytes -= expired
+
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+
+        # Drop least recently accessed entries until the file fits the budget again
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM ocr_cache ORDER BY accessed"):
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            victims.append((key,))
+            self._disk_bytes -= size
+        conn.executemany("DELETE FROM ocr_cache WHERE key = ?", victims)
+
+    def close(self):
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+        self._disk_executor.submit(_close)
+        self._disk_executor.shutdown(wait=True)
@@ -0,0 +1,125 @@
+import logging
+from typing import Callable, Optional
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+from controllers.admission import HEADER_BYTES, VISION_MAX_IMAGE_BYTES
+
+CHUNK_SIZE = 64 * 1024
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+class _Buffer:
+    """Single growable buffer, preallocated from Content-Length when it is known."""
+
+    def __init__(self, expected_size: Optional[int], max_bytes: int):
+        self.max_bytes = max_bytes
+        self._data = bytearray(expected_size) if expected_size else bytearray()
+        self._size = 0
+
+    def write(self, chunk: bytes):
+        end = self._size + len(chunk)
+        if end > self.max_bytes:
+            raise ImageTooLarge(f"Image exceeds the {self.max_bytes // (1024 * 1024)} MB limit")
+
+        if end <= len(self._data):
+            self._data[self._size:end] = chunk
+        else:
+            # Content-Length was missing or wrong: keep growing the same buffer
+            del self._data[self._size:]
+            self._data += chunk
+        self._size = end
+
+    def __len__(self) -> int:
+        return self._size
+
+    def peek(self) -> bytes:
+        return bytes(memoryview(self._data)[:self._size])
+
+    def getvalue(self) -> bytes:
+        if self._size == len(self._data):
+            return bytes(self._data)
+        return bytes(memoryview(self._data)[:self._size])
+
+
+class ImageDownloader:
+    """Streaming image downloader over pooled connections, with a hard size cap.
+
+    `inspect`, when given, is called once with the first `inspect_bytes` bytes
+    (or the whole body, if shorter); raising from it aborts the download.
+    """
+
+    def __init__(self, max_bytes: int = VISION_MAX_IMAGE_BYTES, pool_size: int = 32,
+                 logger: Optional[logging.Logger] = None):
+        self.max_bytes = max_bytes
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _expected_size(self, headers, max_bytes: int) -> Optional[int]:
+        content_type = headers.get('content-type', '').lower()
+        if content_type and 'image' not in content_type:
+            self.logger.warning("Content type '%s' may not be an image", content_type)
+
+        # A compressed transfer says nothing about the decoded size
+        if headers.get('content-encoding'):
+            return None
+
+        try:
+            content_length = int(headers.get('content-length', ''))
+        except ValueError:
+            return None
+
+        if content_length > max_bytes:
+            raise ImageTooLarge(f"Image size ({content_length} bytes) exceeds the {max_bytes // (1024 * 1024)} MB limit")
+        return content_length
+
+    def fetch(self, url: str, timeout: int = 30, max_bytes: Optional[int] = None,
+              inspect: Optional[Callable[[bytes], object]] = None, inspect_bytes: int = HEADER_BYTES) -> bytes:
+        max_bytes = max_bytes or self.max_bytes
+        with self.session.get(url, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            buffer = _Buffer(self._expected_size(response.headers, max_bytes), max_bytes)
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                if chunk:
+                    buffer.write(chunk)
+                    if inspect and len(buffer) >= inspect_bytes:
+                        inspect(buffer.peek())
+                        inspect = None
+
+        if inspect:
+            inspect(buffer.peek())
+        return buffer.getvalue()
+
+    async def fetch_async(self, url: str, session: aiohttp.ClientSession, timeout: int = 30,
+                          max_bytes: Optional[int] = None, inspect: Optional[Callable[[bytes], object]] = None,
+                          inspect_bytes: int = HEADER_BYTES) -> bytes:
+        max_bytes = max_bytes or self.max_bytes
+        async with session.get(url, headers=DEFAULT_HEADERS, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            response.raise_for_status()
+            buffer = _Buffer(self._expected_size(response.headers, max_bytes), max_bytes)
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                buffer.write(chunk)
+                if inspect and len(buffer) >= inspect_bytes:
+                    inspect(buffer.peek())
+                    inspect = None
+
+        if inspect:
+            inspect(buffer.peek())
+        return buffer.getvalue()
+
+    def close(self):
+        self.session.close()
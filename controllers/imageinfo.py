@@ -0,0 +1,89 @@
+import struct
+from typing import NamedTuple, Optional
+
+
+class ImageInfo(NamedTuple):
+    format: str
+    width: int
+    height: int
+
+
+# JPEG start-of-frame markers (everything in C0-CF except DHT, JPG and DAC)
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def sniff_format(header: bytes) -> Optional[str]:
+    """Identifies the image format from its magic bytes."""
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if header.startswith(b'BM'):
+        return 'bmp'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def sniff(header: bytes) -> Optional[ImageInfo]:
+    """Reads format and dimensions from the first bytes of an image, without decoding it.
+
+    Returns None when the format is unknown or the dimensions are not within `header`.
+    """
+    image_format = sniff_format(header)
+    try:
+        if image_format == 'png' and header[12:16] == b'IHDR':
+            width, height = struct.unpack('>II', header[16:24])
+        elif image_format == 'gif':
+            width, height = struct.unpack('<HH', header[6:10])
+        elif image_format == 'bmp':
+            width, height = struct.unpack('<ii', header[18:26])
+        elif image_format == 'webp':
+            width, height = _webp_size(header)
+        elif image_format == 'jpeg':
+            width, height = _jpeg_size(header)
+        else:
+            return None
+    except (struct.error, ValueError):
+        return None
+
+    return ImageInfo(image_format, abs(width), abs(height))
+
+
+def _webp_size(header: bytes):
+    chunk = header[12:16]
+    if chunk == b'VP8 ':
+        if header[23:26] != b'\x9d\x01\x2a':
+            raise ValueError("Invalid VP8 frame header")
+        width, height = struct.unpack('<HH', header[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L':
+        if header[20] != 0x2F:
+            raise ValueError("Invalid VP8L signature")
+        bits = struct.unpack('<I', header[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X':
+        width = int.from_bytes(header[24:27], 'little') + 1
+        height = int.from_bytes(header[27:30], 'little') + 1
+        return width, height
+    raise ValueError("Unknown WebP chunk")
+
+
+def _jpeg_size(header: bytes):
+    offset = 2
+    while offset + 9 <= len(header):
+        if header[offset] != 0xFF:
+            raise ValueError("Invalid JPEG marker")
+        marker = header[offset + 1]
+        if marker == 0xFF:
+            # Fill byte
+            offset += 1
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>HH', header[offset + 5:offset + 9])
+            return width, height
+        segment_length = struct.unpack('>H', header[offset + 2:offset + 4])[0]
+        offset += 2 + segment_length
+    raise ValueError("JPEG frame header not within the sniffed bytes")
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from controllers.scheduler import PRIORITIES
+
+QUEUED = 'queued'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobError(Exception):
+    """An error raised in a worker, as seen by the process that delivers the result."""
+
+
+class Job(NamedTuple):
+    id: int
+    command: str
+    payload: dict
+    attempts: int
+    state: str = LEASED
+    result: Optional[Any] = None
+
+
+def encode_outcome(value: Any) -> dict:
+    """JSON form of one attachment's outcome: an OCRResult, a supporter verdict or an exception."""
+    from controllers.result import OCRResult  # NumPy is only needed once there are results
+
+    if isinstance(value, BaseException):
+        return {'error': str(value)}
+    if isinstance(value, OCRResult):
+        return {'text': value.text, 'words': list(value.words), 'confidence': value.confidence}
+    if isinstance(value, dict):
+        # The words are only needed by the perceptual index, which the worker already updated
+        return {'verdict': {key: item for key, item in value.items() if key != 'words'}}
+    return {}
+
+
+def decode_outcome(entry: dict) -> Any:
+    if 'error' in entry:
+        return JobError(entry['error'])
+    if 'verdict' in entry:
+        return entry['verdict']
+    if 'text' in entry:
+        from controllers.result import OCRResult
+        return OCRResult(entry['text'], entry['words'], confidence=entry['confidence'])
+    return None
+
+
+class JobQueue:
+    """Durable OCR job queue in an SQLite file, shared by the bot and the worker processes.
+
+    A worker leases the next job for `visibility_timeout` seconds and extends
+    the lease while it works. When a lease expires because the worker crashed
+    or was restarted, the job goes to another worker, up to `max_attempts`
+    times. Finished jobs keep their result until the bot has delivered it;
+    with several bot processes, each delivers only the jobs it put with its
+    own `owner`. A result the bot fails to deliver is retried on its next
+    pass; `delivery_failed` counts those failures so it can give up.
+    """
+
+    def __init__(self, path: str, visibility_timeout: float = 120.0, max_attempts: int = 3):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='job-queue')
+        # Autocommit, so leasing can take the write lock up front; other processes wait for it
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ocr_jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, command TEXT NOT NULL, priority INTEGER NOT NULL, "
+            "payload TEXT NOT NULL, state TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "worker TEXT, lease_until REAL, result TEXT, created REAL NOT NULL, updated REAL NOT NULL, owner TEXT)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(ocr_jobs)")}
+        if 'owner' not in columns:
+            self._conn.execute("ALTER TABLE ocr_jobs ADD COLUMN owner TEXT")
+        if 'deliveries' not in columns:
+            self._conn.execute("ALTER TABLE ocr_jobs ADD COLUMN deliveries INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ocr_jobs_state ON ocr_jobs(state, priority, id)")
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def put(self, command: str, payload: dict, owner: Optional[str] = None) -> int:
+        return await self._run(self._put, command, payload, owner)
+
+    async def lease(self, worker: str) -> Optional[Job]:
+        """Takes the next queued job, or one whose lease expired, most urgent command first."""
+        return await self._run(self._lease, worker)
+
+    async def extend(self, job_id: int, worker: str) -> bool:
+        """Renews a lease; False when the job was handed to another worker in the meantime."""
+        return await self._run(self._extend, job_id, worker)
+
+    async def complete(self, job_id: int, worker: str, result: dict) -> bool:
+        return await self._run(self._finish, job_id, worker, DONE, result)
+
+    async def fail(self, job_id: int, worker: str, error: str, retry: bool = True) -> bool:
+        """Records a failed attempt; the job is queued again while it has attempts left."""
+        return await self._run(self._fail, job_id, worker, error, retry)
+
+    async def finished(self, limit: int = 20, owner: Optional[str] = None) -> List[Job]:
+        """Done or failed jobs of `owner` whose result has not been delivered yet."""
+        return await self._run(self._finished, limit, owner)
+
+    async def acknowledge(self, job_id: int):
+        """Forgets a job once its result was delivered."""
+        await self._run(self._acknowledge, job_id)
+
+    async def delivery_failed(self, job_id: int) -> int:
+        """Counts a failed attempt to deliver a finished job's result; returns the attempts so far."""
+        return await self._run(self._delivery_failed, job_id)
+
+    async def counts(self) -> Dict[str, int]:
+        return await self._run(self._counts)
+
+    def _put(self, command: str, payload: dict, owner: Optional[str]) -> int:
+        now = time.time()
+        cursor = self._conn.execute(
+            "INSERT INTO ocr_jobs (command, priority, payload, state, created, updated, owner) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (command, PRIORITIES.get(command, max(PRIORITIES.values())), json.dumps(payload), QUEUED, now, now, owner)
+        )
+        return cursor.lastrowid
+
+    def _lease(self, worker: str) -> Optional[Job]:
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                row = self._conn.execute(
+                    "SELECT id, command, payload, attempts FROM ocr_jobs "
+                    "WHERE state = ? OR (state = ? AND lease_until < ?) ORDER BY priority, id LIMIT 1",
+                    (QUEUED, LEASED, now)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+
+                job_id, command, payload, attempts = row
+                if attempts >= self.max_attempts:
+                    # Every worker that took it stopped before finishing
+                    self._conn.execute(
+                        "UPDATE ocr_jobs SET state = ?, result = ?, worker = NULL, lease_until = NULL, updated = ? WHERE id = ?",
+                        (FAILED, json.dumps({'error': f"Job abandoned after {attempts} attempts"}), now, job_id)
+                    )
+                    continue
+
+                self._conn.execute(
+                    "UPDATE ocr_jobs SET state = ?, attempts = attempts + 1, worker = ?, lease_until = ?, updated = ? "
+                    "WHERE id = ?",
+                    (LEASED, worker, now + self.visibility_timeout, now, job_id)
+                )
+                self._conn.execute("COMMIT")
+                return Job(job_id, command, json.loads(payload), attempts + 1)
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _extend(self, job_id: int, worker: str) -> bool:
+        now = time.time()
+        cursor = self._conn.execute(
+            "UPDATE ocr_jobs SET lease_until = ?, updated = ? WHERE id = ? AND worker = ? AND state = ?",
+            (now + self.visibility_timeout, now, job_id, worker, LEASED)
+        )
+        return cursor.rowcount == 1
+
+    def _finish(self, job_id: int, worker: str, state: str, result: dict) -> bool:
+        # Only the current lease holder may finish a job
+        cursor = self._conn.execute(
+            "UPDATE ocr_jobs SET state = ?, result = ?, lease_until = NULL, updated = ? "
+            "WHERE id = ? AND worker = ? AND state = ?",
+            (state, json.dumps(result), time.time(), job_id, worker, LEASED)
+        )
+        return cursor.rowcount == 1
+
+    def _fail(self, job_id: int, worker: str, error: str, retry: bool) -> bool:
+        cursor = self._conn.execute(
+            "UPDATE ocr_jobs SET state = CASE WHEN ? AND attempts < ? THEN ? ELSE ? END, result = ?, "
+            "worker = NULL, lease_until = NULL, updated = ? WHERE id = ? AND worker = ? AND state = ?",
+            (retry, self.max_attempts, QUEUED, FAILED, json.dumps({'error': error}), time.time(),
+             job_id, worker, LEASED)
+        )
+        return cursor.rowcount == 1
+
+    def _finished(self, limit: int, owner: Optional[str]) -> List[Job]:
+        rows = self._conn.execute(
+            "SELECT id, command, payload, attempts, state, result FROM ocr_jobs "
+            "WHERE state IN (?, ?) AND owner IS ? ORDER BY id LIMIT ?",
+            (DONE, FAILED, owner, limit)
+        ).fetchall()
+        return [Job(job_id, command, json.loads(payload), attempts, state, json.loads(result) if result else None)
+                for job_id, command, payload, attempts, state, result in rows]
+
+    def _acknowledge(self, job_id: int):
+        self._conn.execute("DELETE FROM ocr_jobs WHERE id = ?", (job_id,))
+
+    def _delivery_failed(self, job_id: int) -> int:
+        self._conn.execute("UPDATE ocr_jobs SET deliveries = deliveries + 1, updated = ? WHERE id = ?",
+                           (time.time(), job_id))
+        row = self._conn.execute("SELECT deliveries FROM ocr_jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else 0
+
+    def _counts(self) -> Dict[str, int]:
+        counts = {QUEUED: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update(self._conn.execute("SELECT state, COUNT(*) FROM ocr_jobs GROUP BY state").fetchall())
+        return counts
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._conn.close()
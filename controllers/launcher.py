@@ -0,0 +1,110 @@
+"""Runs the bot as several processes, each connected to a range of gateway shards.
+
+Every process has its own event loop and interpreter, so gateway traffic and
+command handling scale past one GIL. The processes share the SQLite caches,
+code store and job queue, and split the Vision quota by their number of shards.
+With OCR_WORKERS > 0 the launcher starts the OCR workers once for all of them;
+every Vision call then goes through the job queue, so the workers split the
+whole quota among themselves. Bot and worker processes that exit are restarted.
+"""
+import asyncio
+import multiprocessing
+import os
+import signal
+import time
+from functools import partial
+from typing import Dict, List, Optional
+
+import aiohttp
+from dotenv import load_dotenv
+
+GATEWAY_URL = 'https://discord.com/api/v10/gateway/bot'
+
+
+async def _recommended_shards(token: str) -> int:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(GATEWAY_URL, headers={'Authorization': f'Bot {token}'}) as response:
+            response.raise_for_status()
+            return (await response.json())['shards']
+
+
+def recommended_shards(token: str) -> int:
+    """The shard count Discord recommends for this bot's guild count."""
+    return asyncio.run(_recommended_shards(token))
+
+
+def shard_ranges(shard_count: int, processes: int) -> List[List[int]]:
+    """Splits shards 0..shard_count-1 into at most `processes` contiguous, near-equal ranges."""
+    processes = max(1, min(processes, shard_count))
+    base, extra = divmod(shard_count, processes)
+    ranges, start = [], 0
+    for i in range(processes):
+        size = base + (1 if i < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+
+def _run_shards(shard_count: int, shard_ids: List[int], index: int, processes: int):
+    # SIGTERM from the launcher shuts the bot down like Ctrl+C, closing its pools and stores
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    # Each process gets its own metrics port and a share of the CPUs for its pools
+    metrics_port = int(os.getenv('METRICS_PORT', '9108'))
+    if metrics_port > 0:
+        os.environ['METRICS_PORT'] = str(metrics_port + index)
+    cpu_share = str(max(1, (os.cpu_count() or 1) // processes))
+    os.environ.setdefault('OCR_PREPROCESS_WORKERS', cpu_share)
+    os.environ.setdefault('OCR_LOCAL_WORKERS', cpu_share)
+
+    from controllers.bot import ApoiadorBot
+    bot = ApoiadorBot(sharded=True, shard_count=shard_count, shard_ids=shard_ids, spawn_workers=False)
+    try:
+        bot.run()
+    except KeyboardInterrupt:
+        pass
+
+
+def run_sharded(shard_count: Optional[int] = None, processes: int = 2, restart_delay: float = 5.0):
+    """Starts one bot process per shard range and the OCR workers, restarting any that exits until interrupted."""
+    load_dotenv(dotenv_path="./config/.env")
+    token = os.getenv('DISCORD_TOKEN')
+    if not token:
+        raise SystemExit("❌ ERRO: Token do Discord não encontrado!")
+
+    if not shard_count:
+        shard_count = recommended_shards(token)
+    ranges = shard_ranges(shard_count, processes)
+    print(f"🧩 {shard_count} shards em {len(ranges)} processos")
+
+    from controllers import worker as ocr_worker
+    ocr_workers = int(os.getenv('OCR_WORKERS', '0'))
+    workers = ocr_worker.start_workers(ocr_workers) if ocr_workers > 0 else []
+    start_worker = partial(ocr_worker.start_worker, count=ocr_workers)
+
+    context = multiprocessing.get_context('spawn')
+
+    def start(index: int):
+        process = context.Process(
+            target=_run_shards,
+            args=(shard_count, ranges[index], index, len(ranges)),
+            name=f'bot-shards-{ranges[index][0]}-{ranges[index][-1]}'
+        )
+        process.start()
+        return process
+
+    bots = [start(i) for i in range(len(ranges))]
+    # Restarts are scheduled, not slept through, so one crash does not stop the others being watched
+    bot_restarts: Dict[int, float] = {}
+    worker_restarts: Dict[int, float] = {}
+    try:
+        while True:
+            time.sleep(1)
+            ocr_worker.supervise(bots, start, bot_restarts, restart_delay)
+            ocr_worker.supervise(workers, start_worker, worker_restarts, restart_delay)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # The bots go first so no new jobs are queued while the workers drain
+        ocr_worker.stop_workers(bots)
+        ocr_worker.stop_workers(workers)
@@ -0,0 +1,135 @@
+"""Logging for the bot, the workers and batch runs, kept off the hot path.
+
+Loggers only put records on an in-memory queue (`QueueHandler`); a listener
+thread formats them and writes them to a rotating JSON-lines file and to the
+console. Records carry the id of the request being handled (`request_id`) and
+any structured fields passed in `extra`, such as a stage and its duration.
+High-volume messages logged with `extra={'sample': True}` are kept one in
+LOG_SAMPLE_EVERY.
+"""
+import atexit
+import contextvars
+import copy
+import itertools
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Id of the command or job being handled; copied into every record logged while it runs
+REQUEST_ID: 'contextvars.ContextVar[Optional[str]]' = contextvars.ContextVar('request_id', default=None)
+
+# Attributes of every LogRecord; anything else came from `extra` and goes into the JSON record
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'request_id', 'sample'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+@contextmanager
+def request_context(request_id):
+    """Tags the records logged inside the block (and the tasks it starts) with `request_id`."""
+    token = REQUEST_ID.set(str(request_id))
+    try:
+        yield
+    finally:
+        REQUEST_ID.reset(token)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request id and the `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'process': record.processName,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps one in `every` records marked with `extra={'sample': True}`, counted per message template."""
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = every
+        self._counters: Dict[tuple, itertools.count] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.every <= 1 or not getattr(record, 'sample', False):
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None:
+                counter = self._counters[key] = itertools.count()
+        if next(counter) % self.every:
+            return False
+        # Weight of the kept record, so counts can be scaled back up
+        record.sampled = self.every
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records as they are: the message is formatted in the listener thread, not by the caller."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.request_id = REQUEST_ID.get()
+        return record
+
+
+def setup_logging(path: Optional[str] = None, level: Optional[str] = None) -> logging.handlers.QueueListener:
+    """Routes the root logger through a queue to a rotating JSON file and the console; safe to call again.
+
+    The file defaults to LOG_PATH (ocr_script.log), rotated at LOG_MAX_MB into LOG_BACKUPS files.
+    Child processes (workers, shard processes) write to their own file, e.g.
+    ocr_script.ocr-worker-0.log, since rotation is not safe across processes.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    if path is None:
+        path = os.getenv('LOG_PATH', 'ocr_script.log')
+        if multiprocessing.parent_process() is not None:
+            base, extension = os.path.splitext(path)
+            path = f"{base}.{multiprocessing.current_process().name}{extension}"
+    file_handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=int(float(os.getenv('LOG_MAX_MB', '10')) * 1024 * 1024),
+        backupCount=int(os.getenv('LOG_BACKUPS', '5')), encoding='utf-8', delay=True
+    )
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter('%(asctime)s - %(processName)s - %(levelname)s - %(message)s'))
+
+    records = queue.SimpleQueue()
+    queue_handler = _QueueHandler(records)
+    queue_handler.addFilter(SamplingFilter(int(os.getenv('LOG_SAMPLE_EVERY', '100'))))
+
+    root = logging.getLogger()
+    root.setLevel(level or os.getenv('LOG_LEVEL', 'INFO').upper())
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(records, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+    # Writes whatever is still queued before the process exits
+    atexit.register(_listener.stop)
+    return _listener
@@ -0,0 +1,354 @@
+import asyncio
+import bisect
+import sqlite3
+import time
+import unicodedata
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+# Characters OCR commonly reads in place of each other collapse to one symbol
+_CONFUSIONS = str.maketrans({'0': 'o', '1': 'i', 'l': 'i', '|': 'i', '5': 's', '8': 'b', '2': 'z'})
+
+# Labels that precede the creator code in the item shop, in every language we see
+LABELS = ("APOIE-UM-CRIADOR", "SUPPORT-A-CREATOR", "CODIGO DE APOIADOR", "CÓDIGO DE CRIADOR")
+
+# Codes found without a label nearby are accepted with this confidence; codes short enough to
+# need an exact match (see max_distance) are too likely to be ordinary words to count unlabeled
+UNLABELED_CONFIDENCE = 0.9
+# How many tokens after a label may hold the code (OCR splits codes on '.', '-' and '_')
+MAX_CODE_TOKENS = 3
+MAX_EDIT_DISTANCE = 2
+
+
+def normalize(text: str) -> str:
+    """Lowercase, accent-free alphanumerics with OCR confusions folded."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = text.translate(_CONFUSIONS)
+    return ''.join(char for char in text if char.isalnum() and not unicodedata.combining(char))
+
+
+def max_distance(length: int) -> int:
+    """Edits tolerated for a code of this length; short codes must be exact."""
+    if length < 4:
+        return 0
+    return 1 if length < 8 else MAX_EDIT_DISTANCE
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance, or limit + 1 once it exceeds `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def _deletions(term: str, distance: int) -> Set[str]:
+    results = {term}
+    frontier = {term}
+    for _ in range(distance):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+        results |= frontier
+    return results
+
+
+class Match(NamedTuple):
+    code: str
+    confidence: float
+    distance: int
+    labeled: bool
+
+
+class CodeMatcher:
+    """Finds which of many creator codes appears in OCR output.
+
+    Exact matches come from an Aho-Corasick automaton over the normalized
+    tokens; codes misread by OCR are looked up in a SymSpell-style deletion
+    dictionary, but only in the tokens right after a label. Both structures
+    are updated in place when codes are added or removed.
+    """
+
+    def __init__(self, codes: Iterable[str] = ()):
+        # Aho-Corasick trie: transitions, outputs and failure links per node
+        self._goto: List[Dict[str, int]] = [{}]
+        self._output: List[Set[str]] = [set()]
+        self._fail: List[int] = [0]
+        self._dirty = False
+
+        self._codes: Dict[str, str] = {}
+        self._deletes: Dict[str, Set[str]] = {}
+        self._labels = {normalize(label) for label in LABELS}
+        for label in self._labels:
+            self._insert(label)
+
+        for code in codes:
+            self.add(code)
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def __contains__(self, code: str) -> bool:
+        return normalize(code) in self._codes
+
+    @property
+    def codes(self) -> List[str]:
+        return list(self._codes.values())
+
+    def _insert(self, pattern: str):
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._output.append(set())
+                self._fail.append(0)
+            node = next_node
+        self._output[node].add(pattern)
+        self._dirty = True
+
+    def _node(self, pattern: str) -> Optional[int]:
+        node = 0
+        for char in pattern:
+            node = self._goto[node].get(char)
+            if node is None:
+                return None
+        return node
+
+    def _build_links(self):
+        """Recomputes the failure links after insertions; the trie itself is never rebuilt."""
+        queue = deque()
+        for node in self._goto[0].values():
+            self._fail[node] = 0
+            queue.append(node)
+
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                queue.append(child)
+        self._dirty = False
+
+    def add(self, code: str) -> bool:
+        key = normalize(code)
+        if not key or key in self._codes:
+            return False
+
+        self._codes[key] = code
+        self._insert(key)
+        for deletion in _deletions(key, max_distance(len(key))):
+            self._deletes.setdefault(deletion, set()).add(key)
+        return True
+
+    def remove(self, code: str) -> bool:
+        key = normalize(code)
+        if self._codes.pop(key, None) is None:
+            return False
+
+        # Trie nodes stay; only the output goes, so no link needs recomputing
+        node = self._node(key)
+        if node is not None and key not in self._labels:
+            self._output[node].discard(key)
+        for deletion in _deletions(key, max_distance(len(key))):
+            keys = self._deletes.get(deletion)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._deletes[deletion]
+        return True
+
+    def _search(self, text: str):
+        """Yields (start, pattern) for every pattern occurrence in `text`."""
+        if self._dirty:
+            self._build_links()
+
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+
+            state = node
+            while state:
+                for pattern in self._output[state]:
+                    yield i + 1 - len(pattern), pattern
+                state = self._fail[state]
+
+    def lookup(self, term: str) -> Optional[Match]:
+        """Closest code within its edit-distance budget (SymSpell lookup)."""
+        best = None
+        candidates = set()
+        for deletion in _deletions(term, MAX_EDIT_DISTANCE):
+            candidates |= self._deletes.get(deletion, set())
+
+        for key in candidates:
+            limit = max_distance(len(key))
+            distance = edit_distance(term, key, limit)
+            if distance > limit:
+                continue
+            confidence = 1 - distance / max(len(key), len(term))
+            if best is None or confidence > best.confidence:
+                best = Match(self._codes[key], confidence, distance, True)
+        return best
+
+    def match(self, words: List[str]) -> Optional[Match]:
+        """Best code match in a sequence of OCR words (e.g. the word-level text_annotations)."""
+        tokens = [token for token in (normalize(word) for word in words) if token]
+        if not tokens or not self._codes:
+            return None
+
+        # Concatenated tokens, remembering where each token starts
+        offsets = []
+        position = 0
+        for token in tokens:
+            offsets.append(position)
+            position += len(token)
+        boundaries = set(offsets) | {position}
+        compact = ''.join(tokens)
+
+        def token_at(position: int) -> int:
+            return bisect.bisect_right(offsets, position) - 1
+
+        label_ends = []
+        best = None
+        for start, pattern in self._search(compact):
+            end = start + len(pattern)
+            if pattern in self._labels:
+                label_ends.append(end)
+                continue
+            # Codes must cover whole tokens: "ana" is not a match inside "banana"
+            if start not in boundaries or end not in boundaries:
+                continue
+            labeled = any(label_end <= start and token_at(start) - token_at(label_end) < MAX_CODE_TOKENS
+                          for label_end in label_ends)
+            if not labeled and max_distance(len(pattern)) == 0:
+                continue
+            candidate = Match(self._codes[pattern], 1.0 if labeled else UNLABELED_CONFIDENCE, 0, labeled)
+            if best is None or candidate.confidence > best.confidence:
+                best = candidate
+
+        if best and best.labeled:
+            return best
+
+        # Misread codes: what follows a label, one, two or three tokens at a time
+        for label_end in label_ends:
+            if label_end >= len(compact):
+                continue
+            # The label may end mid-token, e.g. "criador:vascurado" read as one word
+            index = token_at(label_end)
+            term = compact[label_end:offsets[index] + len(tokens[index])]
+            for count in range(MAX_CODE_TOKENS):
+                if count:
+                    if index + count >= len(tokens):
+                        break
+                    term += tokens[index + count]
+                candidate = self.lookup(term[:64])
+                if candidate and (best is None or candidate.confidence > best.confidence):
+                    best = candidate
+        return best
+
+
+class CodeStore:
+    """Creator codes registered per guild, persisted in SQLite, each guild with its own matcher.
+
+    Guilds without registered codes (and direct messages) use `default_codes`.
+    """
+
+    def __init__(self, path: str, default_codes: Iterable[str] = ('Vascurado',), max_codes_per_guild: int = 10000):
+        self.path = path
+        self.max_codes_per_guild = max_codes_per_guild
+        self.default = CodeMatcher(default_codes)
+        self._matchers: Dict[int, CodeMatcher] = {}
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='creator-codes')
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS creator_codes ("
+            "guild_id INTEGER NOT NULL, code TEXT NOT NULL, added_by INTEGER, created REAL NOT NULL, "
+            "PRIMARY KEY (guild_id, code))"
+        )
+        self._conn.commit()
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        self._load()
+
+    def _load(self):
+        codes: Dict[int, List[str]] = {}
+        for guild_id, code in self._conn.execute("SELECT guild_id, code FROM creator_codes ORDER BY created"):
+            codes.setdefault(guild_id, []).append(code)
+        self._matchers = {guild_id: CodeMatcher(guild_codes) for guild_id, guild_codes in codes.items()}
+
+    def refresh(self) -> bool:
+        """Reloads every guild's codes if another process changed the file since the last check."""
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return False
+        self._data_version = version
+        self._load()
+        return True
+
+    def matcher(self, guild_id: Optional[int]) -> CodeMatcher:
+        matcher = self._matchers.get(guild_id)
+        return matcher if matcher is not None and len(matcher) else self.default
+
+    def codes(self, guild_id: Optional[int]) -> List[str]:
+        matcher = self._matchers.get(guild_id)
+        return matcher.codes if matcher is not None else []
+
+    async def add(self, guild_id: int, codes: Iterable[str], added_by: Optional[int] = None) -> List[str]:
+        """Registers codes for a guild; returns the ones that were not registered yet."""
+        matcher = self._matchers.setdefault(guild_id, CodeMatcher())
+        added = []
+        for code in codes:
+            if len(matcher) >= self.max_codes_per_guild:
+                break
+            if matcher.add(code):
+                added.append(code)
+
+        if added:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self._persist_add, guild_id, added, added_by)
+        return added
+
+    async def remove(self, guild_id: int, code: str) -> bool:
+        matcher = self._matchers.get(guild_id)
+        if matcher is None or code not in matcher:
+            return False
+
+        stored = next(stored for stored in matcher.codes if normalize(stored) == normalize(code))
+        matcher.remove(code)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._persist_remove, guild_id, stored)
+        return True
+
+    def _persist_add(self, guild_id: int, codes: List[str], added_by: Optional[int]):
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO creator_codes (guild_id, code, added_by, created) VALUES (?, ?, ?, ?)",
+            [(guild_id, code, added_by, now) for code in codes]
+        )
+        self._conn.commit()
+
+    def _persist_remove(self, guild_id: int, code: str):
+        self._conn.execute("DELETE FROM creator_codes WHERE guild_id = ? AND code = ?", (guild_id, code))
+        self._conn.commit()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._conn.close()
@@ -0,0 +1,227 @@
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Log-linear (HDR-style) histogram with constant relative error.
+
+    Each power of two above `lowest` is split into `sub_buckets` linear buckets,
+    so quantiles are accurate to about 1/sub_buckets with fixed memory.
+    """
+
+    def __init__(self, sub_buckets: int = 32, lowest: float = 1e-6):
+        self.sub_buckets = sub_buckets
+        self.lowest = lowest
+        self.count = 0
+        self.sum = 0.0
+        self._counts: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def _index(self, value: float) -> int:
+        if value <= self.lowest:
+            return 0
+        mantissa, exponent = math.frexp(value / self.lowest)  # mantissa in [0.5, 1)
+        return (exponent - 1) * self.sub_buckets + int((mantissa * 2 - 1) * self.sub_buckets) + 1
+
+    def _value(self, index: int) -> float:
+        if index == 0:
+            return self.lowest
+        exponent, sub = divmod(index - 1, self.sub_buckets)
+        return self.lowest * (2 ** exponent) * (1 + (sub + 0.5) / self.sub_buckets)
+
+    def observe(self, value: float):
+        index = self._index(value)
+        with self._lock:
+            self._counts[index] = self._counts.get(index, 0) + 1
+            self.count += 1
+            self.sum += value
+
+    def quantiles(self, qs: Sequence[float] = QUANTILES) -> List[float]:
+        with self._lock:
+            if not self.count:
+                return [0.0 for _ in qs]
+            items = sorted(self._counts.items())
+            count = self.count
+
+        results = []
+        for q in qs:
+            target = max(1, math.ceil(q * count))
+            cumulative = 0
+            for index, bucket_count in items:
+                cumulative += bucket_count
+                if cumulative >= target:
+                    results.append(self._value(index))
+                    break
+        return results
+
+
+class Counter:
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge(Counter):
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+
+class Family:
+    """A named metric with one child per combination of label values."""
+
+    def __init__(self, name: str, documentation: str, kind: str, factory, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._factory())
+        return child
+
+    def children(self):
+        return list(self._children.items())
+
+    def _label_text(self, key: Tuple[str, ...], extra: str = '') -> str:
+        pairs = [f'{name}="{value}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in self.children():
+            if isinstance(child, Histogram):
+                for q, value in zip(QUANTILES, child.quantiles()):
+                    quantile = f'quantile="{q}"'
+                    lines.append(f"{self.name}{self._label_text(key, quantile)} {value:.6g}")
+                lines.append(f"{self.name}_sum{self._label_text(key)} {child.sum:.6g}")
+                lines.append(f"{self.name}_count{self._label_text(key)} {child.count}")
+            else:
+                lines.append(f"{self.name}{self._label_text(key)} {child.value:.6g}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self.families: List[Family] = []
+
+    def _register(self, family: Family) -> Family:
+        self.families.append(family)
+        return family
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Family:
+        return self._register(Family(name, documentation, 'summary', Histogram, labelnames))
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Family:
+        return self._register(Family(name, documentation, 'counter', Counter, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Family:
+        return self._register(Family(name, documentation, 'gauge', Gauge, labelnames))
+
+    def expose(self) -> str:
+        lines = []
+        for family in self.families:
+            lines.extend(family.expose())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram('ocr_stage_seconds', "Latency of each OCR pipeline stage", ['stage'])
+STAGE_INFLIGHT = registry.gauge('ocr_stage_inflight', "Operations currently running in each stage", ['stage'])
+STAGE_ERRORS = registry.counter('ocr_stage_errors_total', "Failed operations per stage and error type", ['stage', 'error'])
+COMMAND_SECONDS = registry.histogram('ocr_command_seconds', "End-to-end latency of bot commands", ['command'])
+COMMANDS_INFLIGHT = registry.gauge('ocr_commands_inflight', "Bot commands currently running", ['command'])
+VISION_RETRIES = registry.counter('vision_retries_total', "Vision API retries by reason", ['reason'])
+VISION_UPLOAD_BYTES = registry.counter('vision_upload_bytes_total', "Image bytes sent to the Vision API")
+VISION_BATCH_SIZE = registry.histogram('vision_batch_size', "Images per batch_annotate_images call")
+VISION_REQUESTS = registry.counter('vision_requests_total', "Images sent to the Vision API by detection mode", ['mode'])
+DOWNLOAD_BYTES = registry.counter('ocr_download_bytes_total', "Image bytes downloaded")
+APOIADOR_ROI = registry.counter('apoiador_roi_total', "Supporter checks by region-of-interest outcome", ['outcome'])
+IMAGE_ADMISSION = registry.counter('ocr_image_admission_total', "Images rejected or downscaled before the pipeline", ['outcome'])
+
+
+@contextmanager
+def timed(stage: str):
+    """Times a pipeline stage, tracking in-flight operations and errors."""
+    inflight = STAGE_INFLIGHT.labels(stage=stage)
+    inflight.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        STAGE_ERRORS.labels(stage=stage, error=type(e).__name__).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage=stage).observe(elapsed)
+        inflight.dec()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Stage %s took %.1f ms", stage, elapsed * 1000,
+                         extra={'stage': stage, 'seconds': elapsed, 'sample': True})
+
+
+def stage_summary() -> Dict[str, Tuple[int, List[float]]]:
+    """Count and p50/p95/p99 latency of every stage seen so far."""
+    return {
+        key[0]: (histogram.count, histogram.quantiles())
+        for key, histogram in STAGE_SECONDS.children()
+        if histogram.count
+    }
+
+
+def stage_errors() -> Dict[str, int]:
+    """Failed operations of every stage seen so far, all error types together."""
+    errors: Dict[str, int] = {}
+    for (stage, _), counter in STAGE_ERRORS.children():
+        errors[stage] = errors.get(stage, 0) + int(counter.value)
+    return errors
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.expose().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """Serves the Prometheus text format at http://host:port/metrics from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
@@ -1,206 +1,569 @@
 import os
+import asyncio
 import logging
+import threading
+import aiohttp
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import vision
 from google.api_core import exceptions
 import time
-from typing import Optional, List
+from typing import Awaitable, Callable, Optional, List, Sequence, Tuple, Union
+from controllers.backends import OCRBackend
+from controllers.cache import OCRCache
+from controllers.download import ImageDownloader, ImageTooLarge
+from controllers.metrics import DOWNLOAD_BYTES, VISION_BATCH_SIZE, VISION_REQUESTS, VISION_RETRIES, VISION_UPLOAD_BYTES, timed
+from controllers.preprocess import Preprocessed, estimate_density
+from controllers.resilience import CircuitBreaker, RetryPolicy, vision_circuit
+from controllers.result import OCRResult
+
+# Vision accepts at most 16 images per batch_annotate_images call
+VISION_MAX_BATCH_SIZE = 16
+
+# 'text' returns the extracted text; 'structured' a dict with text, word_count and confidence
+OUTPUT_FORMATS = ('text', 'structured')
+
+# 'text' is TEXT_DETECTION (sparse text, e.g. screenshots), 'document' is DOCUMENT_TEXT_DETECTION
+# (dense pages) and 'auto' picks one from the text density of the image
+DETECTION_MODES = ('auto', 'text', 'document')
+_FEATURES = {
+    'text': vision.Feature.Type.TEXT_DETECTION,
+    'document': vision.Feature.Type.DOCUMENT_TEXT_DETECTION,
+}
+# Text density (see preprocess.gray_density) above which an image is treated as a document;
+# calibrated on benchmarks/corpus/ and the synthetic screenshots, which stay under 0.036
+# while printed pages start around 0.05
+DOCUMENT_DENSITY = 0.045
+
+# Only the word annotations and errors are read; this leaves out full_text_annotation,
+# the page/block/paragraph/symbol tree that makes document responses large
+RESPONSE_FIELDS = (('x-goog-fieldmask', 'responses.text_annotations,responses.error'),)
+
+
+class OCRBatcher:
+    """Coalesces concurrent OCR requests into batch_annotate_images calls.
+
+    Images are held for at most `window` seconds, or until `max_batch_size`
+    images (or `max_batch_bytes`) are pending, then sent as one request.
+    Each caller gets back only its own annotations or its own error.
+    """
+
+    def __init__(self, ocr: 'GoogleOCR', window: float = 0.05,
+                 max_batch_size: int = VISION_MAX_BATCH_SIZE,
+                 max_batch_bytes: int = 8 * 1024 * 1024):
+        self.ocr = ocr
+        self.window = window
+        self.max_batch_size = max(1, min(max_batch_size, VISION_MAX_BATCH_SIZE))
+        self.max_batch_bytes = max_batch_bytes
+        self._pending: List[Tuple[bytes, str, asyncio.Future]] = []
+        self._pending_bytes = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._dispatches = set()
+
+    async def submit(self, image_bytes: bytes, mode: str = 'text') -> List:
+        loop = asyncio.get_running_loop()
+
+        if self._pending and self._pending_bytes + len(image_bytes) > self.max_batch_bytes:
+            self._flush()
+
+        future = loop.create_future()
+        self._pending.append((image_bytes, mode, future))
+        self._pending_bytes += len(image_bytes)
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending, self._pending_bytes = self._pending, [], 0
+        if not batch:
+            return
+
+        task = asyncio.ensure_future(self._dispatch(batch))
+        self._dispatches.add(task)
+        task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch: List[Tuple[bytes, str, asyncio.Future]]):
+        loop = asyncio.get_running_loop()
+        images = [(image_bytes, mode) for image_bytes, mode, _ in batch]
+        self.ocr.logger.info("Sending batch of %d images to Vision API", len(images),
+                             extra={'batch_size': len(images), 'sample': True})
+
+        try:
+            results = await loop.run_in_executor(self.ocr._executor, self.ocr._batch_text_detection, images)
+        except Exception as e:
+            # The whole RPC failed: every caller sees the error and applies its own retry policy
+            results = [e] * len(batch)
+
+        if len(results) != len(batch):
+            error = exceptions.GoogleAPIError(f"Vision API returned {len(results)} responses for {len(batch)} images")
+            results = [error] * len(batch)
+
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
 
 
-class GoogleOCR:
+class GoogleOCR(OCRBackend):
+
+    name = 'vision'
     
-    def __init__(self, credentials_path: str):
-        self._setup_logging()
-        self.client = None
+    def __init__(self, credentials_path: str, max_workers: int = 32,
+                 batch_window: float = 0.0, max_batch_size: int = VISION_MAX_BATCH_SIZE,
+                 cache: Optional[OCRCache] = None, retry_policy: Optional[RetryPolicy] = None,
+                 circuit: Optional[CircuitBreaker] = None, language_hints: Sequence[str] = ('pt', 'en'),
+                 document_density: float = DOCUMENT_DENSITY):
+        self.logger = logging.getLogger(__name__)
+        self.credentials_path = None
+        self._client = None
+        self._client_lock = threading.Lock()
+        # Blocking Vision/HTTP calls made from coroutines run here, off the event loop
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='vision')
+        # Micro-batching is only enabled with a positive window
+        self.batcher = OCRBatcher(self, batch_window, max_batch_size) if batch_window > 0 else None
+        self.cache = cache
+        self.downloader = ImageDownloader(logger=self.logger)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit = circuit or vision_circuit
+        self.image_context = vision.ImageContext(language_hints=list(language_hints)) if language_hints else None
+        self.document_density = document_density
         
         if credentials_path:
             self.setup_credentials(credentials_path)
 
-    def _setup_logging(self):
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('ocr_script.log'),
-                logging.StreamHandler()
-            ]
-        )
-        self.logger = logging.getLogger(__name__)
-
     def setup_credentials(self, credentials_path: str):
         if not os.path.exists(credentials_path):
-            self.logger.error(f"Credentials file not found: {credentials_path}")
+            self.logger.error("Credentials file not found: %s", credentials_path)
             raise FileNotFoundError(f"Google Cloud credentials file not found: {credentials_path}")
 
         os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials_path
-        
-        try:
-            self.client = vision.ImageAnnotatorClient()
-            self.logger.info("Google Cloud credentials configured successfully.")
-        except Exception as e:
-            self.logger.error(f"Failed to initialize Vision API client: {e}")
-            raise
+        self.credentials_path = credentials_path
+        self._client = None
+        self.logger.info("Google Cloud credentials configured successfully.")
+
+    @property
+    def configured(self) -> bool:
+        """Whether Vision can be called, without creating the client."""
+        return self._client is not None or bool(self.credentials_path)
+
+    @property
+    def client(self):
+        """The Vision client, created on first use: loading the credentials and the gRPC channel is slow."""
+        if self._client is None and self.credentials_path:
+            with self._client_lock:
+                if self._client is None:
+                    try:
+                        self._client = vision.ImageAnnotatorClient()
+                    except Exception as e:
+                        self.logger.error("Failed to initialize Vision API client: %s", e)
+                        raise
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    async def warm_up(self):
+        """Creates the Vision client off the event loop, so the first request does not pay for it."""
+        if self.configured:
+            await asyncio.get_running_loop().run_in_executor(self._executor, lambda: self.client)
 
     def download_image(self, url: str, timeout: int = 30) -> bytes:
         try:
-            self.logger.info(f"Downloading image")
-
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
 
-            response = requests.get(url, headers=headers, timeout=timeout, stream=True)
-            response.raise_for_status()
-
-            image_content = b''
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    image_content += chunk
+            with timed('download'):
+                image_content = self.downloader.fetch(url, timeout=timeout)
+            DOWNLOAD_BYTES.labels().inc(len(image_content))
 
             if not image_content:
                 self.logger.error("Downloaded image is empty.")
                 raise ValueError("Downloaded image is empty.")
 
-            content_type = response.headers.get('content-type', '').lower()
-            if content_type and 'image' not in content_type:
-                self.logger.warning(f"Content type '{content_type}' may not be an image")
-
-            if len(image_content) > 20 * 1024 * 1024:
-                self.logger.warning(f"Image size ({len(image_content)} bytes) may exceed Vision API limits")
-
-            self.logger.info(f"Image downloaded successfully. Size: {len(image_content)} bytes")
+            self.logger.info("Image downloaded successfully. Size: %d bytes", len(image_content),
+                             extra={'bytes': len(image_content), 'sample': True})
             return image_content
 
+        except ImageTooLarge as e:
+            self.logger.error("Download aborted for URL %s: %s", url, e)
+            raise
         except requests.exceptions.Timeout:
-            self.logger.error(f"Request timed out after {timeout} seconds for URL: {url}")
+            self.logger.error("Request timed out after %s seconds for URL: %s", timeout, url)
             raise
         except requests.exceptions.ConnectionError as e:
-            self.logger.error(f"Connection error for URL: {url} - {e}")
+            self.logger.error("Connection error for URL: %s - %s", url, e)
             raise
         except requests.exceptions.HTTPError as e:
-            self.logger.error(f"HTTP error {e.response.status_code} for URL: {url}")
+            self.logger.error("HTTP error %d for URL: %s", e.response.status_code, url)
             if e.response.status_code == 404:
                 self.logger.error("Image not found (404) - URL may be incorrect or expired.")
             raise
         except requests.exceptions.RequestException as e:
-            self.logger.error(f"Request failed for URL {url}: {e}")
+            self.logger.error("Request failed for URL %s: %s", url, e)
             raise
 
-    def perform_ocr(self, image_bytes: bytes, max_retries: int = 3) -> Optional[List]:
-        if not self.client:
+    async def download_image_async(self, url: str, session: Optional[aiohttp.ClientSession] = None,
+                                   timeout: int = 30, max_bytes: Optional[int] = None,
+                                   inspect: Optional[Callable[[bytes], object]] = None) -> bytes:
+        """Downloads an image; `inspect` sees the first bytes and may abort the download by raising."""
+        if session is None:
+            async with aiohttp.ClientSession() as own_session:
+                return await self.download_image_async(url, own_session, timeout, max_bytes, inspect)
+
+        try:
+
+            with timed('download'):
+                image_content = await self.downloader.fetch_async(url, session, timeout=timeout, max_bytes=max_bytes,
+                                                                  inspect=inspect)
+            DOWNLOAD_BYTES.labels().inc(len(image_content))
+
+            if not image_content:
+                self.logger.error("Downloaded image is empty.")
+                raise ValueError("Downloaded image is empty.")
+
+            self.logger.info("Image downloaded successfully. Size: %d bytes", len(image_content),
+                             extra={'bytes': len(image_content), 'sample': True})
+            return image_content
+
+        except ImageTooLarge as e:
+            self.logger.error("Download aborted for URL %s: %s", url, e)
+            raise
+        except asyncio.TimeoutError:
+            self.logger.error("Request timed out after %s seconds for URL: %s", timeout, url)
+            raise
+        except aiohttp.ClientResponseError as e:
+            self.logger.error("HTTP error %d for URL: %s", e.status, url)
+            if e.status == 404:
+                self.logger.error("Image not found (404) - URL may be incorrect or expired.")
+            raise
+        except aiohttp.ClientError as e:
+            self.logger.error("Request failed for URL %s: %s", url, e)
+            raise
+
+    def _require_client(self):
+        if not self.configured:
             self.logger.error("Vision API client not initialized. Call setup_credentials first.")
             raise RuntimeError("Vision API client not initialized. Ensure credentials are set up.")
 
-        image = vision.Image(content=image_bytes)
+    def _response_error(self, response) -> Optional[Exception]:
+        if not response.error.message:
+            return None
+
+        error_msg = response.error.message
+        self.logger.error("Vision API error: %s", error_msg)
+        
+        if any(phrase in error_msg.lower() for phrase in ["bad image", "invalid image", "unsupported"]):
+            return exceptions.InvalidArgument(f"Invalid image data: {error_msg}")
+        
+        return exceptions.GoogleAPIError(f"Vision API error: {error_msg}")
+
+    @staticmethod
+    def _check_mode(mode: str):
+        if mode not in DETECTION_MODES:
+            raise ValueError(f"Unknown detection mode {mode!r}, expected one of {', '.join(DETECTION_MODES)}")
+
+    def select_mode(self, image_bytes: bytes) -> str:
+        """'document' for dense pages, 'text' for sparse text such as game screenshots."""
+        try:
+            with timed('density'):
+                density = estimate_density(image_bytes)
+        except Exception as e:
+            self.logger.warning("Could not estimate text density, using text detection: %s", e)
+            return 'text'
+        return self.mode_for(density)
+
+    def mode_for(self, density: float) -> str:
+        """Detection mode for a text density already measured (e.g. during preprocessing)."""
+        mode = 'document' if density >= self.document_density else 'text'
+        self.logger.info("Text density %.3f, using %s detection", density, mode,
+                         extra={'density': density, 'mode': mode, 'sample': True})
+        return mode
+
+    def _request(self, image_bytes: bytes, mode: str) -> vision.AnnotateImageRequest:
+        return vision.AnnotateImageRequest(
+            image=vision.Image(content=image_bytes),
+            features=[vision.Feature(type_=_FEATURES[mode])],
+            image_context=self.image_context
+        )
+
+    def _text_detection(self, image_bytes: bytes, mode: str = 'text') -> List:
+        VISION_UPLOAD_BYTES.labels().inc(len(image_bytes))
+        VISION_REQUESTS.labels(mode=mode).inc()
+        detect = self.client.document_text_detection if mode == 'document' else self.client.text_detection
+        with timed('vision'):
+            response = detect(image=vision.Image(content=image_bytes), image_context=self.image_context,
+                              metadata=RESPONSE_FIELDS)
+
+        error = self._response_error(response)
+        if error:
+            raise error
+
+        return response.text_annotations
+
+    def _batch_text_detection(self, images: List[Tuple[bytes, str]]) -> List[Union[List, Exception]]:
+        batch_request = [self._request(image_bytes, mode) for image_bytes, mode in images]
+        VISION_UPLOAD_BYTES.labels().inc(sum(len(image_bytes) for image_bytes, _ in images))
+        VISION_BATCH_SIZE.labels().observe(len(images))
+        for _, mode in images:
+            VISION_REQUESTS.labels(mode=mode).inc()
+        with timed('vision'):
+            response = self.client.batch_annotate_images(requests=batch_request, metadata=RESPONSE_FIELDS)
+
+        results = []
+        for image_response in response.responses:
+            error = self._response_error(image_response)
+            results.append(error if error else image_response.text_annotations)
+        return results
+
+    def _backoff(self, error: Exception, attempt: int, max_retries: int, previous_delay: float) -> float:
+        """Returns how long to wait before retrying, or re-raises a non-retryable error."""
+        if isinstance(error, exceptions.ResourceExhausted):
+            self.logger.warning("Vision API quota exceeded: %s", error)
+            reason = "quota exceeded"
+            label = "quota"
+
+        elif isinstance(error, exceptions.ServiceUnavailable):
+            self.logger.warning("Vision API service unavailable: %s", error)
+            reason = "service unavailable"
+            label = "unavailable"
+
+        elif isinstance(error, exceptions.InvalidArgument):
+            self.logger.error("Invalid argument error: %s", error)
+            self.logger.error("This usually means the image is corrupted, invalid format, or too large.")
+            raise error
+
+        else:
+            self.logger.error("Google API error during OCR attempt %d: %s", attempt + 1, error)
+            
+            error_str = str(error).lower()
+            if any(phrase in error_str for phrase in ["customer care", "service client", "account"]):
+                self.logger.error("Non-retryable API error encountered.")
+                raise error
+            reason = "Google API"
+            label = "api_error"
+
+        if attempt >= max_retries - 1:
+            self.logger.error("Max retries reached for %s error.", reason)
+            raise error
+
+        if not self.retry_policy.acquire_retry():
+            self.logger.error("Retry budget exhausted, giving up on %s error.", reason)
+            raise error
+
+        VISION_RETRIES.labels(reason=label).inc()
+        wait_time = self.retry_policy.next_delay(previous_delay, error)
+        self.logger.info("Retrying in %.2f seconds...", wait_time)
+        return wait_time
+
+    def _record_failure(self, error: Exception):
+        # Client errors (bad image, quota, permissions) mean the backend itself is answering
+        if isinstance(error, exceptions.ClientError):
+            self.circuit.record_success()
+        else:
+            self.circuit.record_failure()
+
+    def perform_ocr(self, image_bytes: bytes, max_retries: int = 3, mode: str = 'text') -> Optional[List]:
+        self._check_mode(mode)
+        self._require_client()
+        if mode == 'auto':
+            mode = self.select_mode(image_bytes)
+        self.retry_policy.record_request()
+        delay = 0.0
 
         for attempt in range(max_retries):
+            self.circuit.check()
             try:
-                self.logger.info(f"Performing OCR (attempt {attempt + 1}/{max_retries})")
-                response = self.client.text_detection(image=image)
-
-                if response.error.message:
-                    error_msg = response.error.message
-                    self.logger.error(f"Vision API error: {error_msg}")
-                    
-                    if any(phrase in error_msg.lower() for phrase in ["bad image", "invalid image", "unsupported"]):
-                        raise exceptions.InvalidArgument(f"Invalid image data: {error_msg}")
-                    
-                    raise exceptions.GoogleAPIError(f"Vision API error: {error_msg}")
-
-                self.logger.info("OCR completed successfully")
-                return response.text_annotations
-
-            except exceptions.ResourceExhausted as e:
-                self.logger.warning(f"Vision API quota exceeded: {e}")
-                if attempt < max_retries - 1:
-                    wait_time = (2 ** attempt) + (time.time() % 1)
-                    self.logger.info(f"Retrying in {wait_time:.2f} seconds...")
-                    time.sleep(wait_time)
-                else:
-                    self.logger.error("Max retries reached for quota exceeded error.")
-                    raise
-
-            except exceptions.ServiceUnavailable as e:
-                self.logger.warning(f"Vision API service unavailable: {e}")
-                if attempt < max_retries - 1:
-                    wait_time = (2 ** attempt) + (time.time() % 1)
-                    self.logger.info(f"Retrying in {wait_time:.2f} seconds...")
-                    time.sleep(wait_time)
-                else:
-                    self.logger.error("Max retries reached for service unavailable error.")
-                    raise
+                self.logger.debug("Performing OCR (attempt %d/%d)", attempt + 1, max_retries)
+                texts = self._text_detection(image_bytes, mode)
+
+            except exceptions.GoogleAPIError as e:
+                self._record_failure(e)
+                delay = self._backoff(e, attempt, max_retries, delay)
+                time.sleep(delay)
 
-            except exceptions.InvalidArgument as e:
-                self.logger.error(f"Invalid argument error: {e}")
-                self.logger.error("This usually means the image is corrupted, invalid format, or too large.")
+            except BaseException:
+                self.circuit.release()
                 raise
 
-            except exceptions.GoogleAPIError as e:
-                self.logger.error(f"Google API error during OCR attempt {attempt + 1}: {e}")
-                
-                error_str = str(e).lower()
-                if any(phrase in error_str for phrase in ["customer care", "service client", "account"]):
-                    self.logger.error("Non-retryable API error encountered.")
-                    raise
-                
-                if attempt < max_retries - 1:
-                    wait_time = (2 ** attempt) + (time.time() % 1)
-                    self.logger.info(f"Retrying in {wait_time:.2f} seconds...")
-                    time.sleep(wait_time)
-                else:
-                    self.logger.error("Max retries reached for Google API error.")
-                    raise
+            else:
+                self.circuit.record_success()
+                self.logger.debug("OCR completed successfully")
+                return texts
 
         return None
 
-    def process_results(self, texts: Optional[List]) -> str:
-        if not texts:
-            self.logger.info("No text detected in the image")
-            print("No text detected.")
-            return ""
+    async def perform_ocr_async(self, image_bytes: bytes, max_retries: int = 3, mode: str = 'text',
+                                density: Optional[float] = None) -> Optional[List]:
+        """With mode 'auto', a known `density` picks the mode instead of decoding the image to measure it."""
+        self._check_mode(mode)
+        self._require_client()
+        loop = asyncio.get_running_loop()
+        if mode == 'auto':
+            if density is not None:
+                mode = self.mode_for(density)
+            else:
+                mode = await loop.run_in_executor(self._executor, self.select_mode, image_bytes)
+        self.retry_policy.record_request()
+        delay = 0.0
+
+        for attempt in range(max_retries):
+            self.circuit.check()
+            try:
+                self.logger.debug("Performing OCR (attempt %d/%d)", attempt + 1, max_retries)
+                if self.batcher:
+                    texts = await self.batcher.submit(image_bytes, mode)
+                else:
+                    texts = await loop.run_in_executor(self._executor, self._text_detection, image_bytes, mode)
+
+            except exceptions.GoogleAPIError as e:
+                self._record_failure(e)
+                delay = self._backoff(e, attempt, max_retries, delay)
+                await asyncio.sleep(delay)
 
-        self.logger.info(f"Found {len(texts)} text annotations")
+            except BaseException:
+                self.circuit.release()
+                raise
+
+            else:
+                self.circuit.record_success()
+                self.logger.debug("OCR completed successfully")
+                return texts
 
-        full_text = texts[0].description
-        self.logger.info(f"Extracted text length: {len(full_text)} characters")
+        return None
+
+    async def recognize(self, image_bytes: bytes, mode: str = 'text', density: Optional[float] = None) -> Optional[OCRResult]:
+        return OCRResult.from_annotations(await self.perform_ocr_async(image_bytes, mode=mode, density=density))
+
+    async def perform_ocr_cached_async(self, image_bytes: bytes, profile: str = 'raw',
+                                       preprocess: Optional[Callable[[bytes], Awaitable[Union[bytes, Preprocessed]]]] = None,
+                                       admit: Optional[Callable[[], Awaitable[None]]] = None,
+                                       mode: str = 'text') -> Optional[OCRResult]:
+        """OCR through the result cache, keyed by the original bytes, the preprocessing profile and the mode.
+
+        With mode 'auto' the density is estimated on the preprocessed image, or
+        taken from it when `preprocess` returns a Preprocessed that measured it.
+        `admit` is awaited on a cache miss, right before Vision is called.
+        """
+        self._check_mode(mode)
+
+        async def compute():
+            content, density = image_bytes, None
+            if preprocess:
+                content = await preprocess(image_bytes)
+                if isinstance(content, Preprocessed):
+                    content, density = content.content, content.density
+            if admit:
+                await admit()
+            return await self.recognize(content, mode, density)
+
+        if not self.cache:
+            return await compute()
+
+        return await self.cache.get_or_compute(OCRCache.make_key(image_bytes, f"{profile}/{mode}"), compute)
+
+    @staticmethod
+    def load_result(data: bytes) -> Optional[OCRResult]:
+        """Cache codec counterpart of OCRResult.to_bytes, also reading entries stored as Vision protobufs."""
+        if data.startswith(OCRResult.MAGIC):
+            return OCRResult.from_bytes(data)
+        return OCRResult.from_annotations(vision.AnnotateImageResponse.deserialize(data).text_annotations)
+
+    def process_results(self, result: Optional[OCRResult]) -> str:
+        if not result:
+            self.logger.info("No text detected in the image", extra={'sample': True})
+            return ""
 
-        print("=" * 50)
-        print("EXTRACTED TEXT:")
-        print("=" * 50)
-        print(full_text)
-        print("=" * 50)
+        full_text = result.text
+        self.logger.info("Found %d words, %d characters", result.word_count, len(full_text),
+                         extra={'word_count': result.word_count, 'characters': len(full_text), 'sample': True})
 
-        if len(texts) > 1:
+        # Skips the loop entirely unless DEBUG is on
+        if result.words and self.logger.isEnabledFor(logging.DEBUG):
             self.logger.debug("Individual text elements:")
-            for i, text in enumerate(texts[1:], 1):
-                self.logger.debug(f"Element {i}: '{text.description.strip()}'")
+            for i, word in enumerate(result.words, 1):
+                self.logger.debug("Element %d: '%s'", i, word.strip())
 
         return full_text
 
-    def process_image_url(self, image_url: str, credentials_path: Optional[str] = None) -> str:
+    def _output(self, result: Optional[OCRResult], output_format: str) -> Union[str, dict]:
+        extracted_text = self.process_results(result)
+        if output_format == 'structured':
+            return result.to_dict() if result else {'text': '', 'word_count': 0, 'confidence': 0.0}
+        return extracted_text
+
+    @staticmethod
+    def _check_output_format(output_format: str):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format {output_format!r}, expected one of {', '.join(OUTPUT_FORMATS)}")
+
+    def process_image_url(self, image_url: str, credentials_path: Optional[str] = None,
+                          output_format: str = 'text', mode: str = 'auto') -> Union[str, dict]:
+        self._check_output_format(output_format)
+        self._check_mode(mode)
         try:
-            self.logger.info(f"Starting OCR pipeline")
+            self.logger.debug("Starting OCR pipeline")
             
             if credentials_path:
                 self.setup_credentials(credentials_path)
             
-            if not self.client:
+            if not self.configured:
                 raise RuntimeError("Vision API client not initialized. Provide credentials_path or call setup_credentials().")
             
             image_bytes = self.download_image(image_url)
-            texts = self.perform_ocr(image_bytes)
-            extracted_text = self.process_results(texts)
+            result = OCRResult.from_annotations(self.perform_ocr(image_bytes, mode=mode))
+            output = self._output(result, output_format)
             
-            self.logger.info("OCR pipeline completed successfully")
-            return extracted_text
+            self.logger.debug("OCR pipeline completed successfully")
+            return output
             
         except Exception as e:
-            self.logger.error(f"OCR pipeline failed: {e}")
+            self.logger.error("OCR pipeline failed: %s", e)
             raise
 
-    def process_local_image(self, image_path: str) -> str:
+    async def process_image_async(self, image_url: str, credentials_path: Optional[str] = None,
+                                  session: Optional[aiohttp.ClientSession] = None,
+                                  admit: Optional[Callable[[], Awaitable[None]]] = None,
+                                  output_format: str = 'text', mode: str = 'auto') -> Union[str, dict]:
+        self._check_output_format(output_format)
+        self._check_mode(mode)
         try:
-            self.logger.info(f"Processing local image: {image_path}")
+            self.logger.debug("Starting OCR pipeline")
+            
+            if credentials_path:
+                self.setup_credentials(credentials_path)
+            
+            if not self.configured:
+                raise RuntimeError("Vision API client not initialized. Provide credentials_path or call setup_credentials().")
+            
+            image_bytes = await self.download_image_async(image_url, session)
+            if admit:
+                await admit()
+            result = await self.recognize(image_bytes, mode)
+            output = self._output(result, output_format)
+            
+            self.logger.debug("OCR pipeline completed successfully")
+            return output
+            
+        except Exception as e:
+            self.logger.error("OCR pipeline failed: %s", e)
+            raise
+
+    def process_local_image(self, image_path: str, output_format: str = 'text',
+                            mode: str = 'auto') -> Union[str, dict]:
+        self._check_output_format(output_format)
+        self._check_mode(mode)
+        try:
+            self.logger.info("Processing local image: %s", image_path)
             
             if not os.path.exists(image_path):
                 raise FileNotFoundError(f"Image file not found: {image_path}")
@@ -208,12 +571,18 @@ class GoogleOCR:
             with open(image_path, 'rb') as image_file:
                 image_bytes = image_file.read()
             
-            texts = self.perform_ocr(image_bytes)
-            extracted_text = self.process_results(texts)
+            result = OCRResult.from_annotations(self.perform_ocr(image_bytes, mode=mode))
+            output = self._output(result, output_format)
             
             self.logger.info("Local image processing completed successfully")
-            return extracted_text
+            return output
             
         except Exception as e:
-            self.logger.error(f"Local image processing failed: {e}")
-            raise
\ No newline at end of file
+            self.logger.error("Local image processing failed: %s", e)
+            raise
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.downloader.close()
+        if self.cache:
+            self.cache.close()
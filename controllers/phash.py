@@ -0,0 +1,148 @@
+import asyncio
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+HASH_BITS = 64
+# Multi-index hashing: the 64-bit hash is split into 4 chunks of 16 bits. Two hashes
+# within Hamming distance 3 always share at least one identical chunk (pigeonhole)
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+# The whole-image hash cannot tell creator codes apart (a different code moves it by 1-2 bits),
+# so a near-duplicate is only reused when a binarized print of the code line matches too.
+# Recompression changes under 1% of the pixels in any character-wide window; a single
+# different character changes 5% or more
+PRINT_HEIGHT = 24
+PRINT_MAX_DIFFERENCE = 0.02
+
+
+def dhash(gray: np.ndarray) -> int:
+    """64-bit difference hash of an already-decoded grayscale image."""
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = np.packbits((small[:, 1:] > small[:, :-1]).flatten())
+    return int.from_bytes(bits.tobytes(), 'big')
+
+
+def region_print(gray: np.ndarray, box: Tuple[int, int, int, int]) -> bytes:
+    """Binarized thumbnail of a region (e.g. the creator-code line), PRINT_HEIGHT pixels high, one bit per pixel."""
+    x, y, w, h = box
+    crop = gray[y:y + h, x:x + w]
+    width = max(1, min(0xFFFF, round(PRINT_HEIGHT * w / max(1, h))))
+    small = cv2.resize(crop, (width, PRINT_HEIGHT), interpolation=cv2.INTER_AREA)
+    _, binary = cv2.threshold(small, 0, 1, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    return width.to_bytes(2, 'big') + np.packbits(binary).tobytes()
+
+
+def print_difference(a: bytes, b: bytes) -> float:
+    """Largest share of differing pixels in any character-wide window of two prints (1.0 if their sizes differ)."""
+    width = int.from_bytes(a[:2], 'big')
+    if len(a) != len(b) or a[:2] != b[:2]:
+        return 1.0
+    count = PRINT_HEIGHT * width
+    differing = np.unpackbits(np.frombuffer(a[2:], np.uint8) ^ np.frombuffer(b[2:], np.uint8))[:count]
+    columns = differing.reshape(PRINT_HEIGHT, width).sum(axis=0)
+    window = min(width, PRINT_HEIGHT)
+    sums = np.convolve(columns, np.ones(window, dtype=np.int64), 'valid')
+    return float(sums.max()) / (window * PRINT_HEIGHT)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def _to_signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+class PerceptualIndex:
+    """Persistent near-duplicate index of image hashes and their verdicts."""
+
+    def __init__(self, path: str, max_distance: int = 3):
+        self.path = path
+        self.max_distance = min(max_distance, CHUNKS - 1)
+
+        self._hashes: List[int] = []
+        self._verdicts: List[dict] = []
+        self._positions: Dict[int, int] = {}
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(CHUNKS)]
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='phash-index')
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS phash_index ("
+            "hash INTEGER PRIMARY KEY, verdict TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+        for value, verdict in self._conn.execute("SELECT hash, verdict FROM phash_index"):
+            self._insert(_to_unsigned(value), json.loads(verdict))
+
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    @staticmethod
+    def _chunks(value: int):
+        for i in range(CHUNKS):
+            yield i, (value >> (i * CHUNK_BITS)) & CHUNK_MASK
+
+    def _insert(self, value: int, verdict: dict):
+        position = self._positions.get(value)
+        if position is not None:
+            self._verdicts[position] = verdict
+            return
+
+        position = len(self._hashes)
+        self._hashes.append(value)
+        self._verdicts.append(verdict)
+        self._positions[value] = position
+        for i, chunk in self._chunks(value):
+            self._tables[i].setdefault(chunk, []).append(position)
+
+    def lookup(self, value: int) -> Optional[Tuple[dict, int]]:
+        """Returns the verdict of the closest stored hash and its distance, if within range."""
+        best = None
+        seen = set()
+        for i, chunk in self._chunks(value):
+            for position in self._tables[i].get(chunk, ()):
+                if position in seen:
+                    continue
+                seen.add(position)
+                distance = hamming(value, self._hashes[position])
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (self._verdicts[position], distance)
+                    if distance == 0:
+                        break
+
+        self.stats['hits' if best else 'misses'] += 1
+        return best
+
+    async def add(self, value: int, verdict: dict):
+        self._insert(value, verdict)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._persist, value, verdict)
+
+    def _persist(self, value: int, verdict: dict):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO phash_index (hash, verdict, created) VALUES (?, ?, ?)",
+            (_to_signed(value), json.dumps(verdict), time.time())
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._conn.close()
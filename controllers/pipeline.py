@@ -0,0 +1,297 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, Iterable, List, Optional
+
+import aiohttp
+
+from controllers.admission import ImageAdmission
+from controllers.backends import OCRRouter
+from controllers.cache import OCRCache
+from controllers.imageinfo import sniff
+from controllers.matcher import CodeMatcher, CodeStore
+from controllers.metrics import APOIADOR_ROI, timed
+from controllers.ocr import DOCUMENT_DENSITY, GoogleOCR
+from controllers.phash import PRINT_MAX_DIFFERENCE, PerceptualIndex, print_difference
+from controllers.preprocess import Preprocessed, PreprocessPool
+from controllers.result import OCRResult
+from controllers.roi import LayoutPriors, locate_label, region_at
+from controllers.scheduler import VisionScheduler
+from controllers.tesseract import TesseractOCR
+
+Admit = Optional[Callable[[], Awaitable[None]]]
+
+
+def _env_list(name: str, default: str) -> List[str]:
+    return [item.strip() for item in os.getenv(name, default).split(',') if item.strip()]
+
+
+class OCRPipeline:
+    """Download, preprocessing, OCR and supporter-code verdicts for the bot commands.
+
+    Runs in the bot process or, with the job queue enabled, in each worker
+    process; both build it with `from_env` from the same configuration.
+    """
+
+    def __init__(self, ocr: GoogleOCR, preprocess_pool: PreprocessPool, router: OCRRouter,
+                 local_ocr: Optional[TesseractOCR] = None, scheduler: Optional[VisionScheduler] = None,
+                 apoiador_index: Optional[PerceptualIndex] = None, layout_priors: Optional[LayoutPriors] = None,
+                 codes: Optional[CodeStore] = None, max_download_bytes: int = 40 * 1024 * 1024,
+                 attachment_concurrency: int = 4, min_match_confidence: float = 0.8,
+                 image_admission: Optional[ImageAdmission] = None):
+        self.ocr = ocr
+        self.preprocess_pool = preprocess_pool
+        self.router = router
+        self.local_ocr = local_ocr
+        self.scheduler = scheduler
+        self.apoiador_index = apoiador_index
+        self.layout_priors = layout_priors
+        self.codes = codes
+        self.max_download_bytes = max_download_bytes
+        self.attachment_concurrency = attachment_concurrency
+        self.min_match_confidence = min_match_confidence
+        self.image_admission = image_admission or ImageAdmission(max_download_bytes)
+
+    @classmethod
+    def from_env(cls, quota_share: float = 1.0) -> Optional['OCRPipeline']:
+        """Builds the pipeline from the environment, or returns None when no OCR engine is available.
+
+        `quota_share` is the fraction of the Vision quota (VISION_QPS/VISION_QPM)
+        this process may use when several processes share the project.
+        """
+        credentials_path = os.getenv('GOOGLE_CREDENTIALS_PATH')
+        vision_configured = bool(credentials_path and os.path.exists(credentials_path))
+
+        local_ocr = None
+        if os.getenv('OCR_LOCAL_ENGINE', 'tesseract').lower() == 'tesseract' and TesseractOCR.available():
+            local_ocr = TesseractOCR(
+                lang=os.getenv('OCR_LOCAL_LANG', 'por+eng'),
+                max_workers=int(os.getenv('OCR_LOCAL_WORKERS', '0')) or None
+            )
+
+        # Without credentials GoogleOCR still provides downloads and the cache; Tesseract does the OCR
+        if not (vision_configured or local_ocr):
+            return None
+
+        ocr = GoogleOCR(
+            credentials_path if vision_configured else None,
+            batch_window=float(os.getenv('OCR_BATCH_WINDOW_MS', '50')) / 1000,
+            max_batch_size=int(os.getenv('OCR_MAX_BATCH_SIZE', '16')),
+            language_hints=_env_list('OCR_LANGUAGE_HINTS', 'pt,en'),
+            document_density=float(os.getenv('OCR_DOCUMENT_DENSITY', str(DOCUMENT_DENSITY))),
+            cache=OCRCache(
+                os.getenv('OCR_CACHE_PATH', 'ocr_cache.sqlite3'),
+                dumps=OCRResult.to_bytes,
+                loads=GoogleOCR.load_result,
+                max_memory_items=int(os.getenv('OCR_CACHE_MEMORY_ITEMS', '512')),
+                ttl=float(os.getenv('OCR_CACHE_TTL_HOURS', '168')) * 3600,
+                max_disk_bytes=int(os.getenv('OCR_CACHE_MAX_MB', '256')) * 1024 * 1024
+            )
+        )
+        max_download_bytes = int(os.getenv('OCR_MAX_DOWNLOAD_MB', '40')) * 1024 * 1024
+        return cls(
+            ocr=ocr,
+            preprocess_pool=PreprocessPool(
+                max_workers=int(os.getenv('OCR_PREPROCESS_WORKERS', '0')) or None,
+                max_pending=int(os.getenv('OCR_PREPROCESS_MAX_PENDING', '0')) or None
+            ),
+            router=OCRRouter(
+                local=local_ocr,
+                remote=ocr if ocr.configured else None,
+                min_confidence=float(os.getenv('OCR_LOCAL_MIN_CONFIDENCE', '0.8'))
+            ),
+            local_ocr=local_ocr,
+            scheduler=VisionScheduler(
+                qps=float(os.getenv('VISION_QPS', '10')) * quota_share,
+                qpm=float(os.getenv('VISION_QPM', '1800')) * quota_share,
+                guild_per_minute=float(os.getenv('OCR_GUILD_PER_MINUTE', '120')),
+                user_per_minute=float(os.getenv('OCR_USER_PER_MINUTE', '30')),
+                max_queue=int(os.getenv('OCR_MAX_QUEUE', '200'))
+            ),
+            apoiador_index=PerceptualIndex(
+                os.getenv('APOIADOR_PHASH_PATH', 'apoiador_phash.sqlite3'),
+                max_distance=int(os.getenv('APOIADOR_PHASH_DISTANCE', '3'))
+            ),
+            layout_priors=LayoutPriors(os.getenv('APOIADOR_LAYOUT_PATH', 'apoiador_layout.sqlite3')),
+            codes=CodeStore(
+                os.getenv('APOIADOR_CODES_PATH', 'apoiador_codes.sqlite3'),
+                default_codes=_env_list('APOIADOR_DEFAULT_CODES', 'Vascurado')
+            ),
+            max_download_bytes=max_download_bytes,
+            attachment_concurrency=int(os.getenv('OCR_ATTACHMENT_CONCURRENCY', '4')),
+            min_match_confidence=float(os.getenv('APOIADOR_MIN_CONFIDENCE', '0.8')),
+            image_admission=ImageAdmission(
+                max_download_bytes,
+                max_pixels=int(float(os.getenv('OCR_MAX_MEGAPIXELS', '100')) * 1_000_000)
+            )
+        )
+
+    @property
+    def vision_ready(self) -> bool:
+        return bool(self.ocr and self.ocr.configured)
+
+    def admission(self, guild_id: Optional[int], user_id: int, command: str,
+                  on_queued: Optional[Callable[[int], Awaitable[None]]] = None) -> Admit:
+        """The step that reserves a Vision call for this request in the scheduler."""
+        if not self.scheduler:
+            return None
+
+        async def admit():
+            with timed('admission'):
+                await self.scheduler.acquire(guild_id, user_id, command, on_queued=on_queued)
+
+        return admit
+
+    async def download(self, url: str, session: aiohttp.ClientSession, size: Optional[int] = None,
+                       width: Optional[int] = None, height: Optional[int] = None,
+                       content_type: Optional[str] = None) -> bytes:
+        """Downloads an image that passes admission, fitted to Vision's limits.
+
+        The attachment metadata is checked before the request and the header
+        bytes before the rest of the body, so refused images cost almost nothing.
+        """
+        self.image_admission.check_metadata(size, width, height, content_type)
+        image_data = await self.ocr.download_image_async(url, session=session, max_bytes=self.max_download_bytes,
+                                                         inspect=self.image_admission.check_header)
+        return await self.fit(image_data)
+
+    async def fit(self, image_data: bytes) -> bytes:
+        """Admits an image already in memory, downscaling it on the process pool when Vision would refuse it."""
+        info = self.image_admission.check_header(image_data[:64 * 1024])
+        if self.image_admission.needs_downscale(len(image_data), info):
+            image_data = await self.preprocess_pool.downscale(
+                image_data, self.image_admission.vision_max_pixels, self.image_admission.vision_max_bytes
+            )
+        return image_data
+
+    async def process_all(self, items: Iterable, worker: Callable[..., Awaitable]) -> list:
+        """Runs `worker` on every item concurrently, at most OCR_ATTACHMENT_CONCURRENCY at a time.
+
+        Results come back in item order, with failures as exceptions in the list.
+        """
+        semaphore = asyncio.Semaphore(self.attachment_concurrency)
+
+        async def run(item):
+            async with semaphore:
+                return await worker(item)
+
+        return await asyncio.gather(*[run(item) for item in items], return_exceptions=True)
+
+    async def preprocess(self, image_bytes: bytes, want_density: bool = False) -> Preprocessed:
+        return await self.preprocess_pool.run(image_bytes, want_density=want_density)
+
+    async def ocr_image(self, image_data: bytes, admit: Admit = None, mode: str = 'auto') -> Optional[OCRResult]:
+        """Preprocesses and reads an image (!ocr); repeated images come from the cache."""
+        async def preprocess(content: bytes) -> Preprocessed:
+            # Only 'auto' needs the text density
+            return await self.preprocess(content, want_density=mode == 'auto')
+
+        async def vision():
+            return await self.ocr.perform_ocr_cached_async(image_data, profile='fast', preprocess=preprocess,
+                                                           admit=admit, mode=mode)
+
+        # Vision answers; Tesseract covers missing credentials, exhausted quota or an open circuit
+        return await self.router.recognize(image_data, local_first=False, escalate=vision if self.vision_ready else None)
+
+    async def ocr_quality(self, image_data: bytes, admit: Admit = None, mode: str = 'auto') -> Optional[OCRResult]:
+        """Reads an image without preprocessing (!ocr_quality)."""
+        return await self.ocr.perform_ocr_cached_async(image_data, profile='raw', admit=admit, mode=mode)
+
+    async def apoiador_image(self, image_data: bytes, admit: Admit = None, guild_id: Optional[int] = None) -> dict:
+        """Checks whether an image shows one of the guild's creator codes (!apoiador)."""
+        # Areas where the label was found before on screens of the same shape
+        info = sniff(image_data[:64 * 1024])
+        layout = (info.width, info.height) if info and info.height else None
+        priors = self.layout_priors.get(*layout) if self.layout_priors and layout else None
+
+        # Preprocess on the process pool, cropping the candidate regions
+        processed = await self.preprocess_pool.run(image_data, priors=priors)
+
+        matcher = self.codes.matcher(guild_id)
+
+        # Reuse the words of a near-identical image checked before, re-judged with this guild's codes,
+        # once the code line itself is confirmed to be the same
+        match = self.apoiador_index.lookup(processed.image_hash) if self.apoiador_index is not None else None
+        if match and self.same_code_region(match[0], processed):
+            return dict(self.verdict(match[0]['words'], matcher), reused=True)
+
+        async def recognize(content: bytes, profile: str):
+            async def already_preprocessed(_):
+                return content
+
+            async def vision():
+                return await self.ocr.perform_ocr_cached_async(image_data, profile=profile, preprocess=already_preprocessed, admit=admit)
+
+            # Local Tesseract answers first; paid Vision only when its confidence is low
+            return await self.router.recognize(content, escalate=vision if self.vision_ready else None)
+
+        # Send only the crops of the candidate regions; the whole image is the fallback
+        result = None
+        # Only when the label line was read inside a prior area can the verdict be checked against it later
+        reusable = False
+        if processed.regions:
+            result = await recognize(processed.regions, 'fast:roi')
+            label = locate_label(result)
+            if label:
+                reusable = True
+                APOIADOR_ROI.labels(outcome='hit').inc()
+                region = region_at(processed.region_offsets, label[1])
+                if region:
+                    await self.layout_priors.record(layout, region, processed.size)
+            else:
+                APOIADOR_ROI.labels(outcome='fallback').inc()
+                result = None
+        else:
+            APOIADOR_ROI.labels(outcome='no_prior').inc()
+
+        if result is None:
+            result = await recognize(processed.content, 'fast')
+            # Learn where the label sits on this screen shape
+            label = locate_label(result)
+            if label and self.layout_priors and layout:
+                await self.layout_priors.record(layout, label, processed.size)
+
+        if not result:
+            return {'text': False, 'found': False, 'code': None, 'confidence': 0.0}
+
+        verdict = self.verdict(list(result.words) or result.text.split(), matcher)
+        if self.apoiador_index is not None and reusable:
+            prints = [[*prior, data.hex()] for prior, data in processed.prior_prints.items()]
+            await self.apoiador_index.add(processed.image_hash, dict(verdict, prints=prints))
+        return verdict
+
+    @staticmethod
+    def same_code_region(entry: dict, processed: Preprocessed) -> bool:
+        """Whether a stored near-duplicate shows the same code line as this image.
+
+        Every prior area both images were printed on must match; entries without
+        prints (older ones, or whose label was found outside the priors) never do.
+        """
+        if 'words' not in entry or not entry.get('prints'):
+            return False
+        shared = 0
+        for *prior, data in entry['prints']:
+            current = processed.prior_prints.get(tuple(prior))
+            if current is None:
+                continue
+            if print_difference(bytes.fromhex(data), current) > PRINT_MAX_DIFFERENCE:
+                return False
+            shared += 1
+        return shared > 0
+
+    def verdict(self, words: List[str], matcher: CodeMatcher) -> dict:
+        """Which of the registered codes appears in the extracted words."""
+        match = matcher.match(words)
+        return {
+            'text': True,
+            'found': bool(match and match.confidence >= self.min_match_confidence),
+            'code': match.code if match else None,
+            'confidence': match.confidence if match else 0.0,
+            'words': words,
+        }
+
+    def close(self):
+        self.ocr.close()
+        self.preprocess_pool.close()
+        for store in (self.apoiador_index, self.layout_priors, self.codes, self.local_ocr):
+            if store is not None:
+                store.close()
@@ -0,0 +1,315 @@
+import asyncio
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from controllers.imageinfo import sniff
+from controllers.metrics import timed
+from controllers.phash import dhash, region_print
+from controllers.roi import Box, NormBox, build_mosaic, detect_text_lines, prior_area, select_regions
+
+MAX_HEIGHT = 1024
+
+# Levels a pixel must differ from its local mean to count as ink when measuring text density;
+# above the grain of noisy game backgrounds, well below the contrast of rendered text
+DENSITY_CONTRAST = 20
+
+# Decode flags that let libjpeg scale down while decoding (DCT scaling)
+_REDUCED_GRAYSCALE = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+_REDUCED_COLOR = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+class Preprocessed(NamedTuple):
+    content: bytes
+    image_hash: int
+    # Size of `content`, and the mosaic of candidate regions with each region's offset in it
+    size: Tuple[int, int] = (0, 0)
+    regions: Optional[bytes] = None
+    region_offsets: List[Tuple[int, Box]] = []
+    # Binarized print of each prior area, to confirm a near-duplicate shows the same code
+    prior_prints: Dict[NormBox, bytes] = {}
+    # Text density of the original image (see gray_density), only measured when asked for
+    density: Optional[float] = None
+
+
+def preprocess_image(image_bytes: bytes, profile: str = 'fast',
+                     priors: Optional[List[NormBox]] = None, want_density: bool = False) -> Preprocessed:
+    """Preprocesses an image for OCR.
+
+    With `priors` (fast profile only), text lines inside those areas are also
+    cropped into a mosaic that can be sent instead of the whole image.
+    `want_density` also measures the text density that 'auto' detection needs;
+    it costs two more filter passes, so only callers that need it ask for it.
+    """
+    if profile == 'fast':
+        return _preprocess_fast(image_bytes, priors, want_density)
+    if profile == 'full':
+        return _preprocess_full(image_bytes, want_density)
+    raise ValueError(f"Unknown preprocessing profile: {profile}")
+
+
+def _reduction_for(height: int) -> int:
+    """Largest decode-time reduction that still leaves at least MAX_HEIGHT rows."""
+    for reduction in (8, 4, 2):
+        if height // reduction >= MAX_HEIGHT:
+            return reduction
+    return 1
+
+
+def _fit_height(gray: np.ndarray) -> np.ndarray:
+    """Shrinks an image taller than MAX_HEIGHT rows to MAX_HEIGHT rows.
+
+    Up to a 1.5x shrink, bilinear weighs in every source row and gives
+    nearly the same pixels as INTER_AREA at a fraction of its cost; closer
+    to 2x some rows get little weight and thin strokes break up.
+    """
+    height, width = gray.shape
+    if height <= MAX_HEIGHT:
+        return gray
+    interpolation = cv2.INTER_LINEAR if height < MAX_HEIGHT * 1.5 else cv2.INTER_AREA
+    return cv2.resize(gray, (int(width * MAX_HEIGHT / height), MAX_HEIGHT), interpolation=interpolation)
+
+
+def _odd(value: float, minimum: int = 3) -> int:
+    value = max(minimum, int(round(value)))
+    return value if value % 2 else value + 1
+
+
+def _preprocess_fast(image_bytes: bytes, priors: Optional[List[NormBox]] = None,
+                     want_density: bool = False) -> Preprocessed:
+    """Decodes straight to reduced grayscale and resizes before filtering.
+
+    Filter sizes are scaled with the resize so the output matches the full
+    pipeline, which filters at the original resolution and resizes last.
+    """
+    info = sniff(image_bytes[:64 * 1024])
+    reduction = _reduction_for(info.height) if info else 1
+
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    gray = cv2.imdecode(nparr, _REDUCED_GRAYSCALE[reduction])
+    if gray is None:
+        raise ValueError("Could not decode image data")
+
+    original_height = info.height if info else gray.shape[0]
+
+    # Perceptual hash for near-duplicate lookup
+    image_hash = dhash(gray)
+
+    gray = _fit_height(gray)
+    scale = min(1.0, gray.shape[0] / original_height)
+
+    # Same reduced image estimate_density decodes, so both paths pick the same mode
+    density = gray_density(gray) if want_density else None
+
+    # Sharpen the image
+    blurred = cv2.GaussianBlur(gray, (0, 0), max(0.5, 3 * scale))
+    sharpened = cv2.addWeighted(gray, 1.5, blurred, -0.5, 0)
+    del blurred
+
+    # Adaptive threshold for better text separation
+    thresh = cv2.adaptiveThreshold(
+        sharpened, 255,
+        cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        cv2.THRESH_BINARY,
+        _odd(11 * scale), 2
+    )
+
+    height, width = thresh.shape
+    regions, region_offsets, prior_prints = None, [], {}
+    if priors:
+        candidates = select_regions(detect_text_lines(sharpened), priors, width, height)
+        if candidates:
+            regions, region_offsets = build_mosaic(thresh, candidates)
+        prior_prints = {prior: region_print(gray, prior_area(prior, width, height)) for prior in priors}
+
+    is_success, buffer = cv2.imencode(".jpg", thresh)
+    if not is_success:
+        raise ValueError("Could not encode preprocessed image")
+
+    return Preprocessed(buffer.tobytes(), image_hash, (width, height), regions, region_offsets, prior_prints, density)
+
+
+def _preprocess_full(image_bytes: bytes, want_density: bool = False) -> Preprocessed:
+    """Original pipeline: filters at full resolution, resizes last."""
+    # Decode straight from the received buffer, without copying it
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image data")
+
+    # Convert to grayscale
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    del img
+
+    # Perceptual hash for near-duplicate lookup
+    image_hash = dhash(gray)
+
+    density = None
+    if want_density:
+        density = gray_density(_fit_height(gray))
+
+    # Sharpen the image
+    blurred = cv2.GaussianBlur(gray, (0, 0), 3)
+    sharpened = cv2.addWeighted(gray, 1.5, blurred, -0.5, 0)
+
+    # Adaptive threshold for better text separation
+    thresh = cv2.adaptiveThreshold(
+        sharpened, 255,
+        cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        cv2.THRESH_BINARY,
+        11, 2
+    )
+
+    # Resize if necessary
+    height, width = thresh.shape
+    if height > MAX_HEIGHT:
+        scale = MAX_HEIGHT / height
+        thresh = cv2.resize(thresh, (int(width * scale), MAX_HEIGHT))
+
+    # Encode to bytes
+    is_success, buffer = cv2.imencode(".jpg", thresh)
+    if not is_success:
+        raise ValueError("Could not encode preprocessed image")
+
+    return Preprocessed(buffer.tobytes(), image_hash, (thresh.shape[1], thresh.shape[0]), density=density)
+
+
+def text_density(binary: np.ndarray) -> float:
+    """Fraction of the pixels of a binarized image (ink black on white) that belong to glyph-sized components."""
+    height, width = binary.shape
+    _, _, stats, _ = cv2.connectedComponentsWithStats(cv2.bitwise_not(binary), connectivity=8)
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    # Specks, rules and filled UI blocks are not glyphs
+    glyphs = (heights >= 4) & (heights <= height * 0.1) & (widths <= height * 0.1)
+    # Ink pixels, not bounding boxes: boxes of neighbouring glyphs overlap
+    return float(stats[1:, cv2.CC_STAT_AREA][glyphs].sum()) / (width * height)
+
+
+def gray_density(gray: np.ndarray) -> float:
+    """Text density of a grayscale image of at most MAX_HEIGHT rows, for dark or light text.
+
+    Pixels DENSITY_CONTRAST levels darker (or lighter) than their neighbourhood
+    are ink; the polarity with more ink in glyph-sized components is the text.
+    """
+    dark = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, DENSITY_CONTRAST)
+    light = cv2.adaptiveThreshold(cv2.bitwise_not(gray), 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+                                  11, DENSITY_CONTRAST)
+    return max(text_density(dark), text_density(light))
+
+
+def estimate_density(image_bytes: bytes) -> float:
+    """Text density of an encoded image, preprocessed or not, at no more than MAX_HEIGHT rows."""
+    info = sniff(image_bytes[:64 * 1024])
+    reduction = _reduction_for(info.height) if info else 1
+
+    gray = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), _REDUCED_GRAYSCALE[reduction])
+    if gray is None:
+        raise ValueError("Could not decode image data")
+
+    return gray_density(_fit_height(gray))
+
+
+def downscale_image(image_bytes: bytes, max_pixels: int, max_bytes: int) -> bytes:
+    """Re-encodes an image as a JPEG of at most `max_pixels` and `max_bytes`, for images Vision would refuse."""
+    info = sniff(image_bytes[:64 * 1024])
+    reduction = 1
+    if info:
+        # Largest decode-time reduction that keeps the image at or above the pixel limit
+        for factor in (8, 4, 2):
+            if info.width * info.height // (factor * factor) >= max_pixels:
+                reduction = factor
+                break
+
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), _REDUCED_COLOR[reduction])
+    if image is None:
+        raise ValueError("Could not decode image data")
+
+    height, width = image.shape[:2]
+    scale = min(1.0, math.sqrt(max_pixels / (width * height)))
+    while True:
+        resized = image
+        if scale < 1.0:
+            size = (max(1, int(width * scale)), max(1, int(height * scale)))
+            resized = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        is_success, buffer = cv2.imencode(".jpg", resized, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        if not is_success:
+            raise ValueError("Could not encode downscaled image")
+        if buffer.nbytes <= max_bytes:
+            return buffer.tobytes()
+        # Still too large: shrink by the overshoot, at least 10% per side each pass
+        scale *= min(0.9, math.sqrt(max_bytes / buffer.nbytes))
+
+
+def _init_worker():
+    # Parallelism comes from the pool itself; keep each worker single-threaded
+    cv2.setNumThreads(1)
+
+
+def _warm_up() -> int:
+    return os.getpid()
+
+
+class PreprocessPool:
+    """Runs image preprocessing on a pool of worker processes.
+
+    At most `max_pending` images are queued or running at once; further
+    callers wait for a free slot instead of piling work onto the pool.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 4
+        # gRPC and the event loop own threads, so workers must not be forked
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker
+        )
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.pending = 0
+
+    async def warm_up(self):
+        """Starts every worker and imports OpenCV in it before the first real request."""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[
+            loop.run_in_executor(self._executor, _warm_up) for _ in range(self.max_workers)
+        ])
+
+    async def _submit(self, stage: str, fn, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        try:
+            async with self._slots:
+                with timed(stage):
+                    return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def run(self, image_bytes: bytes, profile: str = 'fast',
+                  priors: Optional[List[NormBox]] = None, want_density: bool = False) -> Preprocessed:
+        return await self._submit('preprocess', preprocess_image, image_bytes, profile, priors, want_density)
+
+    async def downscale(self, image_bytes: bytes, max_pixels: int, max_bytes: int) -> bytes:
+        return await self._submit('downscale', downscale_image, image_bytes, max_pixels, max_bytes)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,161 @@
+import random
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+
+class CircuitOpen(Exception):
+    def __init__(self, retry_in: float):
+        super().__init__(f"Vision API temporarily unavailable, try again in {retry_in:.0f}s")
+        self.retry_in = retry_in
+
+
+class RetryPolicy:
+    """Decorrelated-jitter backoff with a shared retry budget.
+
+    Every first attempt deposits `budget_ratio` tokens and every retry spends
+    one, so retries can never exceed that fraction of the traffic (plus a small
+    `min_retries_per_second` floor). Server retry hints are honored as a lower
+    bound for the delay.
+    """
+
+    def __init__(self, base: float = 0.5, cap: float = 20.0, budget_ratio: float = 0.2,
+                 min_retries_per_second: float = 1.0, max_budget: float = 20.0):
+        self.base = base
+        self.cap = cap
+        self.budget_ratio = budget_ratio
+        self.min_retries_per_second = min_retries_per_second
+        self.max_budget = max_budget
+
+        self._lock = threading.Lock()
+        self._budget = max_budget
+        self._updated = time.monotonic()
+
+    def _refill(self, deposit: float = 0.0):
+        now = time.monotonic()
+        refill = (now - self._updated) * self.min_retries_per_second
+        self._budget = min(self.max_budget, self._budget + refill + deposit)
+        self._updated = now
+
+    def record_request(self):
+        with self._lock:
+            self._refill(self.budget_ratio)
+
+    def acquire_retry(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self._budget < 1:
+                return False
+            self._budget -= 1
+            return True
+
+    def next_delay(self, previous: float, error: Optional[Exception] = None) -> float:
+        delay = min(self.cap, random.uniform(self.base, max(self.base, previous * 3)))
+        hint = retry_hint(error) if error is not None else None
+        return max(delay, hint) if hint else delay
+
+
+def retry_hint(error: Exception) -> Optional[float]:
+    """Extracts a server-provided retry delay (google.rpc.RetryInfo or Retry-After)."""
+    for detail in getattr(error, 'details', None) or ():
+        retry_delay = getattr(detail, 'retry_delay', None)
+        if retry_delay is not None:
+            return retry_delay.seconds + retry_delay.nanos / 1e9
+
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers:
+        try:
+            return float(headers.get('Retry-After', ''))
+        except ValueError:
+            pass
+    return None
+
+
+class CircuitBreaker:
+    """Process-wide circuit breaker around the Vision backend.
+
+    Opens when at least `min_calls` of the last `window` calls were recorded and
+    `failure_ratio` of them failed. After `reset_timeout` seconds a single probe
+    request is let through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, window: int = 20, min_calls: int = 5, failure_ratio: float = 0.5,
+                 reset_timeout: float = 30.0):
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+        self.state = self.CLOSED
+        self.stats = {'opened': 0, 'rejected': 0}
+
+    @property
+    def failures(self) -> int:
+        return sum(1 for ok in self._outcomes if not ok)
+
+    def retry_in(self) -> float:
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN and self.retry_in() <= 0:
+                self.state = self.HALF_OPEN
+                self._probing = False
+
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+
+            self.stats['rejected'] += 1
+            return False
+
+    def check(self):
+        if not self.allow():
+            raise CircuitOpen(self.retry_in())
+
+    def record_success(self):
+        with self._lock:
+            self._probing = False
+            if self.state == self.OPEN:
+                # A call started before the circuit opened; only the probe may close it
+                return
+            if self.state == self.HALF_OPEN:
+                self.state = self.CLOSED
+                self._outcomes.clear()
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            self._probing = False
+            if self.state == self.OPEN:
+                return
+
+            self._outcomes.append(False)
+            if self.state == self.HALF_OPEN or (
+                len(self._outcomes) >= self.min_calls and
+                self.failures / len(self._outcomes) >= self.failure_ratio
+            ):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self.stats['opened'] += 1
+
+    def release(self):
+        """Frees the half-open probe slot when the probe ended without an outcome."""
+        with self._lock:
+            self._probing = False
+
+
+# Shared by every GoogleOCR instance in the process
+vision_circuit = CircuitBreaker()
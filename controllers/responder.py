@@ -0,0 +1,162 @@
+import asyncio
+import itertools
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from controllers.metrics import timed
+from controllers.scheduler import TokenBucket
+
+# Discord allows about 5 messages per 5 seconds in a channel
+CHANNEL_RATE = 1.0
+CHANNEL_BURST = 5
+
+
+class _ChannelQueue:
+    """REST calls for one channel, paced by a token bucket; a newer edit of a message replaces a pending one."""
+
+    def __init__(self, rate: float, burst: float):
+        self.bucket = TokenBucket(rate, burst)
+        self.pending: 'OrderedDict[Any, list]' = OrderedDict()
+        self.task: Optional[asyncio.Task] = None
+
+
+class ResponseRenderer:
+    """Sends command responses with as few Discord REST calls as possible.
+
+    A reply's placeholder is only sent when the result is not ready within
+    `deadline` seconds (e.g. a cache hit answers directly with the result), and
+    the final embed and its file go out in a single send or edit. Every call
+    goes through a per-channel queue that stays within the channel's rate
+    limit and coalesces edits of the same message, so bursts of commands do
+    not end in 429s.
+    """
+
+    def __init__(self, deadline: float = 0.4, rate: float = CHANNEL_RATE, burst: float = CHANNEL_BURST):
+        self.deadline = deadline
+        self.rate = rate
+        self.burst = burst
+        self._channels: Dict[int, _ChannelQueue] = {}
+        self._seq = itertools.count()
+        self.stats = {'sent': 0, 'edited': 0, 'coalesced': 0, 'placeholders_skipped': 0}
+
+    def reply(self, channel, placeholder) -> 'Reply':
+        """Starts a response whose placeholder embed appears only if the result is late."""
+        return Reply(self, channel, placeholder, self.deadline)
+
+    def existing(self, channel, message) -> 'Reply':
+        """A response for a placeholder that was already sent (e.g. before a restart)."""
+        reply = Reply(self, channel, None, None)
+        reply.message = message
+        return reply
+
+    async def send(self, channel, **kwargs):
+        async def call():
+            self.stats['sent'] += 1
+            with timed('discord_send'):
+                return await channel.send(**kwargs)
+
+        return await self._submit(channel.id, ('send', next(self._seq)), call)
+
+    async def edit(self, channel, message, **kwargs):
+        async def call():
+            self.stats['edited'] += 1
+            with timed('discord_edit'):
+                return await message.edit(**kwargs)
+
+        return await self._submit(channel.id, ('edit', message.id), call)
+
+    async def _submit(self, channel_id: int, key, call: Callable[[], Awaitable]):
+        queue = self._channels.get(channel_id)
+        if queue is None:
+            queue = self._channels[channel_id] = _ChannelQueue(self.rate, self.burst)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = queue.pending.get(key)
+        if entry:
+            # Not sent yet: only the latest state of the message matters
+            self.stats['coalesced'] += 1
+            entry[0] = call
+            entry[1].append(future)
+        else:
+            queue.pending[key] = [call, [future]]
+
+        if queue.task is None or queue.task.done():
+            queue.task = asyncio.ensure_future(self._drain(channel_id, queue))
+        return await future
+
+    async def _drain(self, channel_id: int, queue: _ChannelQueue):
+        while queue.pending:
+            queue.bucket.refill(time.monotonic())
+            if not queue.bucket.available():
+                await asyncio.sleep(queue.bucket.wait_time())
+                continue
+            queue.bucket.take()
+
+            _, (call, futures) = queue.pending.popitem(last=False)
+            try:
+                result = await call()
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for future in futures:
+                    if not future.done():
+                        future.set_result(result)
+
+        # Idle channels keep no state
+        if self._channels.get(channel_id) is queue:
+            del self._channels[channel_id]
+
+
+class Reply:
+    """One command's response: an optional placeholder, progress updates, then the final message."""
+
+    def __init__(self, renderer: ResponseRenderer, channel, placeholder, deadline: Optional[float]):
+        self.renderer = renderer
+        self.channel = channel
+        self.placeholder = placeholder
+        self.message = None
+        self.finished = False
+        self._lock = asyncio.Lock()
+        self._timer = asyncio.ensure_future(self._show_later(deadline)) if deadline is not None else None
+
+    async def _show_later(self, deadline: float):
+        await asyncio.sleep(deadline)
+        try:
+            await self.show()
+        except Exception:
+            pass  # finish() sends the result as a new message instead
+
+    async def show(self):
+        """Sends the placeholder now, if it is not out yet, and returns its message."""
+        async with self._lock:
+            if self.message is None:
+                self.message = await self.renderer.send(self.channel, embed=self.placeholder)
+            return self.message
+
+    async def update(self, embed):
+        """Replaces the placeholder (e.g. with the queue position) and makes sure it is visible."""
+        if self.finished:
+            return
+        self.placeholder = embed
+        if self.message is None:
+            await self.show()
+        else:
+            await self.renderer.edit(self.channel, self.message, embed=embed)
+
+    async def finish(self, embed, file=None):
+        """Delivers the result: one send when no placeholder went out, otherwise one edit carrying the file."""
+        self.finished = True
+        async with self._lock:
+            if self._timer:
+                self._timer.cancel()
+            if self.message is None:
+                self.renderer.stats['placeholders_skipped'] += 1
+                kwargs = {'embed': embed, 'file': file} if file else {'embed': embed}
+                self.message = await self.renderer.send(self.channel, **kwargs)
+                return self.message
+
+        kwargs = {'embed': embed, 'attachments': [file]} if file else {'embed': embed}
+        return await self.renderer.edit(self.channel, self.message, **kwargs)
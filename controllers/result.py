@@ -0,0 +1,99 @@
+import struct
+from typing import Optional, Sequence
+
+import numpy as np
+
+# Separates words in the serialized form; OCR words never contain control characters
+_WORD_SEPARATOR = '\x1f'
+
+
+class OCRResult:
+    """Compact OCR result: the full text, then one word, box and confidence per detected word.
+
+    Built once from Vision annotations (or Tesseract output), after which the
+    protobuf messages can be dropped. Boxes are an (n, 4) int32 array of
+    (x, y, width, height) and confidences an (n,) float32 array, so a result
+    costs a few small buffers instead of one message per word.
+    """
+
+    __slots__ = ('text', 'words', 'boxes', 'confidences', 'confidence')
+
+    MAGIC = b'OCR1'
+    # magic, confidence, word count, text bytes, words bytes
+    _HEADER = struct.Struct('<4sfIII')
+
+    def __init__(self, text: str, words: Sequence[str] = (), boxes=None, confidences=None, confidence: float = 1.0):
+        self.text = text
+        self.words = tuple(words)
+        count = len(self.words)
+        if boxes is None:
+            boxes = np.zeros((count, 4), dtype=np.int32)
+        if confidences is None:
+            confidences = np.ones(count, dtype=np.float32)
+        self.boxes = np.asarray(boxes, dtype=np.int32).reshape(count, 4)
+        self.confidences = np.asarray(confidences, dtype=np.float32).reshape(count)
+        self.confidence = float(confidence)
+
+    def __repr__(self) -> str:
+        return f"OCRResult(words={self.word_count}, chars={len(self.text)}, confidence={self.confidence:.2f})"
+
+    @property
+    def word_count(self) -> int:
+        return len(self.words)
+
+    @classmethod
+    def from_annotations(cls, texts: Optional[Sequence]) -> Optional['OCRResult']:
+        """Converts Vision text_annotations (full text first, then each word); None when nothing was detected.
+
+        Vision leaves confidence unset for text detection, which counts as fully confident.
+        """
+        if not texts:
+            return None
+
+        annotations = texts[1:]
+        boxes = np.zeros((len(annotations), 4), dtype=np.int32)
+        confidences = np.ones(len(annotations), dtype=np.float32)
+        words = []
+        for i, annotation in enumerate(annotations):
+            words.append(annotation.description)
+            if annotation.confidence:
+                confidences[i] = annotation.confidence
+            vertices = annotation.bounding_poly.vertices
+            if vertices:
+                xs = [vertex.x for vertex in vertices]
+                ys = [vertex.y for vertex in vertices]
+                boxes[i] = (min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys))
+
+        return cls(texts[0].description, words, boxes, confidences, texts[0].confidence or 1.0)
+
+    def to_dict(self) -> dict:
+        """The 'structured' output format."""
+        return {'text': self.text, 'word_count': self.word_count, 'confidence': self.confidence}
+
+    def to_bytes(self) -> bytes:
+        text = self.text.encode('utf-8')
+        words = _WORD_SEPARATOR.join(self.words).encode('utf-8')
+        return b''.join((
+            self._HEADER.pack(self.MAGIC, self.confidence, self.word_count, len(text), len(words)),
+            text,
+            words,
+            self.boxes.astype('<i4', copy=False).tobytes(),
+            self.confidences.astype('<f4', copy=False).tobytes(),
+        ))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'OCRResult':
+        magic, confidence, count, text_size, words_size = cls._HEADER.unpack_from(data)
+        if magic != cls.MAGIC:
+            raise ValueError("Not a serialized OCRResult")
+
+        offset = cls._HEADER.size
+        text = data[offset:offset + text_size].decode('utf-8')
+        offset += text_size
+        words = data[offset:offset + words_size].decode('utf-8').split(_WORD_SEPARATOR) if count else []
+        offset += words_size
+        # Read-only views over `data`; results are never modified in place
+        boxes = np.frombuffer(data, dtype='<i4', count=count * 4, offset=offset)
+        offset += count * 16
+        confidences = np.frombuffer(data, dtype='<f4', count=count, offset=offset)
+        return cls(text, words, boxes, confidences, confidence)
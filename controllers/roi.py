@@ -0,0 +1,191 @@
+import asyncio
+import math
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from controllers.matcher import LABELS, normalize
+from controllers.result import OCRResult
+
+# (x, y, width, height) in pixels, or as fractions of the image size for priors
+Box = Tuple[int, int, int, int]
+NormBox = Tuple[float, float, float, float]
+
+# Priors are quantized to this fraction of the image so nearby matches reinforce each other
+PRIOR_STEP = 0.02
+PRIOR_MARGIN = 0.02
+MAX_REGIONS = 6
+MOSAIC_PADDING = 16
+
+# The last word of each matcher label is what tells it apart, and the part OCR keeps on one line
+LABEL_WORDS = tuple(sorted({normalize(label.replace('-', ' ').split()[-1]) for label in LABELS}))
+
+
+def layout_key(width: int, height: int) -> str:
+    """Screens with the same aspect ratio share a layout, whatever their resolution."""
+    return f"{width / height:.2f}"
+
+
+def detect_text_lines(gray: np.ndarray) -> List[Box]:
+    """Finds text-line boxes with a morphological gradient and a horizontal closing.
+
+    Characters light up in the gradient; closing with a wide, flat kernel merges
+    the characters of a line into one contour.
+    """
+    height, width = gray.shape
+    gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+    _, binary = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(9, width // 60), 1))
+    connected = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+    contours, _ = cv2.findContours(connected, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    boxes = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if h < 8 or h > height * 0.15 or w < 2 * h:
+            continue
+        # Text strokes fill part of the box; solid UI blocks and hairlines do not look like that
+        density = cv2.countNonZero(binary[y:y + h, x:x + w]) / (w * h)
+        if 0.1 <= density <= 0.9:
+            boxes.append((x, y, w, h))
+    return boxes
+
+
+def _intersects(a: Box, b: Box) -> bool:
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
+def prior_area(prior: NormBox, width: int, height: int) -> Box:
+    """A prior, with its margin, in pixels of an image of this size."""
+    px, py, pw, ph = prior
+    x0 = max(0, int((px - PRIOR_MARGIN) * width))
+    y0 = max(0, int((py - PRIOR_MARGIN) * height))
+    x1 = min(width, int((px + pw + PRIOR_MARGIN) * width))
+    y1 = min(height, int((py + ph + PRIOR_MARGIN) * height))
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def select_regions(lines: List[Box], priors: List[NormBox], width: int, height: int) -> List[Box]:
+    """Text lines inside the prior areas, or the prior areas themselves when no line was found there."""
+    regions = []
+    for prior in priors:
+        area = prior_area(prior, width, height)
+
+        inside = [line for line in lines if _intersects(line, area)]
+        for region in inside or [area]:
+            if region not in regions:
+                regions.append(region)
+    return regions[:MAX_REGIONS]
+
+
+def build_mosaic(image: np.ndarray, regions: List[Box]) -> Tuple[bytes, List[Tuple[int, Box]]]:
+    """Stacks the regions vertically into one image, so they cost a single OCR request.
+
+    Returns the encoded image and the vertical offset of every region in it.
+    """
+    width = max(w for _, _, w, _ in regions) + 2 * MOSAIC_PADDING
+    height = sum(h for _, _, _, h in regions) + MOSAIC_PADDING * (len(regions) + 1)
+    mosaic = np.full((height, width), 255, dtype=np.uint8)
+
+    offsets = []
+    y = MOSAIC_PADDING
+    for x0, y0, w, h in regions:
+        mosaic[y:y + h, MOSAIC_PADDING:MOSAIC_PADDING + w] = image[y0:y0 + h, x0:x0 + w]
+        offsets.append((y, (x0, y0, w, h)))
+        y += h + MOSAIC_PADDING
+
+    # Binarized crops compress far better losslessly
+    is_success, buffer = cv2.imencode('.png', mosaic)
+    if not is_success:
+        raise ValueError("Could not encode region mosaic")
+    return buffer.tobytes(), offsets
+
+
+def locate_label(result: Optional[OCRResult]) -> Optional[Box]:
+    """Box of the whole line holding the supporter-code label, from the word boxes of a result."""
+    if not result or not result.words:
+        return None
+
+    boxes = result.boxes
+    # Words without a bounding polygon have an empty box
+    located = boxes[:, 2:].any(axis=1)
+    labels = [i for i, word in enumerate(result.words)
+              if located[i] and any(label in normalize(word) for label in LABEL_WORDS)]
+    if not labels:
+        return None
+
+    _, ly, _, lh = boxes[labels[0]]
+    centers = boxes[:, 1] + boxes[:, 3] / 2
+    line = boxes[located & (centers >= ly) & (centers <= ly + lh)]
+    x0, y0 = line[:, 0].min(), line[:, 1].min()
+    x1, y1 = (line[:, 0] + line[:, 2]).max(), (line[:, 1] + line[:, 3]).max()
+    return int(x0), int(y0), int(x1 - x0), int(y1 - y0)
+
+
+def region_at(offsets: List[Tuple[int, Box]], y: int) -> Optional[Box]:
+    """Maps a vertical position in a mosaic back to the region it was cropped from."""
+    for offset, region in offsets:
+        if offset <= y < offset + region[3] + MOSAIC_PADDING:
+            return region
+    return None
+
+
+class LayoutPriors:
+    """Persistent record of where the supporter-code label was found, per screen layout."""
+
+    def __init__(self, path: str, max_per_layout: int = 3):
+        self.path = path
+        self.max_per_layout = max_per_layout
+        self._priors: Dict[str, Dict[NormBox, int]] = {}
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='layout-priors')
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS layout_priors ("
+            "layout TEXT NOT NULL, x REAL NOT NULL, y REAL NOT NULL, w REAL NOT NULL, h REAL NOT NULL, "
+            "hits INTEGER NOT NULL, updated REAL NOT NULL, PRIMARY KEY (layout, x, y, w, h))"
+        )
+        self._conn.commit()
+
+        for layout, x, y, w, h, hits in self._conn.execute("SELECT layout, x, y, w, h, hits FROM layout_priors"):
+            self._priors.setdefault(layout, {})[(x, y, w, h)] = hits
+
+    def get(self, width: int, height: int) -> List[NormBox]:
+        """Most frequently matched label areas for this layout, best first."""
+        priors = self._priors.get(layout_key(width, height), {})
+        return sorted(priors, key=priors.get, reverse=True)[:self.max_per_layout]
+
+    @staticmethod
+    def _quantize(box: Box, width: int, height: int) -> NormBox:
+        x, y, w, h = box
+        x0 = math.floor(x / width / PRIOR_STEP) * PRIOR_STEP
+        y0 = math.floor(y / height / PRIOR_STEP) * PRIOR_STEP
+        x1 = math.ceil(round((x + w) / width / PRIOR_STEP, 6)) * PRIOR_STEP
+        y1 = math.ceil(round((y + h) / height / PRIOR_STEP, 6)) * PRIOR_STEP
+        return round(x0, 4), round(y0, 4), round(x1 - x0, 4), round(y1 - y0, 4)
+
+    async def record(self, layout_size: Tuple[int, int], box: Box, image_size: Tuple[int, int]):
+        """Counts a match of `box`, in pixels of an image of `image_size`, for the layout of `layout_size`."""
+        layout = layout_key(*layout_size)
+        prior = self._quantize(box, *image_size)
+        priors = self._priors.setdefault(layout, {})
+        priors[prior] = hits = priors.get(prior, 0) + 1
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._persist, layout, prior, hits)
+
+    def _persist(self, layout: str, prior: NormBox, hits: int):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO layout_priors (layout, x, y, w, h, hits, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (layout, *prior, hits, time.time())
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._conn.close()
@@ -0,0 +1,201 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# Lower value goes first: supporter checks are cheap and time-sensitive
+PRIORITIES = {
+    'apoiador': 0,
+    'ocr': 1,
+    'ocr_url': 1,
+    'ocr_quality': 2,
+    # Offline runs (controllers/batch.py) only use what the bot leaves
+    'batch': 3,
+}
+
+
+class QueueFull(Exception):
+    def __init__(self, depth: int):
+        super().__init__(f"Fila de OCR cheia ({depth} pedidos aguardando). Tente novamente em alguns segundos.")
+        self.depth = depth
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self) -> bool:
+        return self.tokens >= 1
+
+    def wait_time(self) -> float:
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class _Ticket:
+    __slots__ = ('priority', 'seq', 'guild_id', 'user_id', 'future')
+
+    def __init__(self, priority: int, seq: int, guild_id: Optional[int], user_id: int, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.future = future
+
+    def __lt__(self, other: '_Ticket') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class VisionScheduler:
+    """Admission control in front of the Vision API.
+
+    Every Vision call needs a token from the global QPS and QPM buckets and from
+    the caller's guild and user buckets. Waiting requests are served by command
+    priority, then arrival order, skipping those whose guild or user is over its
+    share. Requests beyond `max_queue` are rejected with QueueFull right away.
+    """
+
+    def __init__(self, qps: float = 10, qpm: float = 1800,
+                 guild_per_minute: float = 120, guild_burst: float = 20,
+                 user_per_minute: float = 30, user_burst: float = 10,
+                 max_queue: int = 200):
+        self.global_buckets = [TokenBucket(qps, qps), TokenBucket(qpm / 60, qpm)]
+        self.guild_rate = (guild_per_minute / 60, guild_burst)
+        self.user_rate = (user_per_minute / 60, user_burst)
+        self.max_queue = max_queue
+
+        self._guild_buckets: Dict[Optional[int], TokenBucket] = {}
+        self._user_buckets: Dict[int, TokenBucket] = {}
+        self._queue: List[_Ticket] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+        self.stats = {'admitted': 0, 'queued': 0, 'rejected': 0}
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def _bucket(self, buckets: dict, key, rate) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(*rate)
+        return bucket
+
+    async def acquire(self, guild_id: Optional[int], user_id: int, command: str,
+                      on_queued: Optional[Callable[[int], Awaitable[None]]] = None):
+        """Waits until the request may call Vision.
+
+        `on_queued` is awaited with the 1-based queue position when the request
+        cannot be admitted immediately.
+        """
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+
+        if len(self._queue) >= self.max_queue:
+            self.stats['rejected'] += 1
+            raise QueueFull(len(self._queue))
+
+        future = asyncio.get_running_loop().create_future()
+        ticket = _Ticket(PRIORITIES.get(command, max(PRIORITIES.values())), next(self._seq), guild_id, user_id, future)
+        heapq.heappush(self._queue, ticket)
+        self._ensure_dispatcher()
+        self._wakeup.set()
+
+        try:
+            # Give the dispatcher a chance to admit the request before reporting a position
+            await asyncio.sleep(0)
+            if not future.done():
+                self.stats['queued'] += 1
+                if on_queued:
+                    await on_queued(self.position(ticket))
+
+            await future
+        except BaseException:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+            raise
+
+    def position(self, ticket: _Ticket) -> int:
+        return 1 + sum(1 for other in self._queue if other < ticket)
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+    async def _dispatch(self):
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            for bucket in self.global_buckets:
+                bucket.refill(now)
+
+            global_wait = max(bucket.wait_time() for bucket in self.global_buckets)
+            if global_wait > 0:
+                await self._sleep(global_wait)
+                continue
+
+            tenant_wait = None
+            for ticket in sorted(self._queue):
+                if ticket.future.done():
+                    self._queue.remove(ticket)
+                    continue
+
+                guild_bucket = self._bucket(self._guild_buckets, ticket.guild_id, self.guild_rate)
+                user_bucket = self._bucket(self._user_buckets, ticket.user_id, self.user_rate)
+                guild_bucket.refill(now)
+                user_bucket.refill(now)
+
+                if guild_bucket.available() and user_bucket.available():
+                    for bucket in (*self.global_buckets, guild_bucket, user_bucket):
+                        bucket.take()
+                    self._queue.remove(ticket)
+                    ticket.future.set_result(None)
+                    self.stats['admitted'] += 1
+                    tenant_wait = None
+                    break
+
+                wait = max(guild_bucket.wait_time(), user_bucket.wait_time())
+                tenant_wait = wait if tenant_wait is None else min(tenant_wait, wait)
+
+            heapq.heapify(self._queue)
+            self._prune()
+
+            if tenant_wait is not None:
+                await self._sleep(tenant_wait)
+
+    async def _sleep(self, timeout: float):
+        """Sleeps until `timeout` elapses or a new request arrives."""
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _prune(self):
+        # Full buckets carry no state, so idle guilds and users can be forgotten
+        for buckets in (self._guild_buckets, self._user_buckets):
+            if len(buckets) > 10000:
+                now = time.monotonic()
+                for key in list(buckets):
+                    bucket = buckets[key]
+                    bucket.refill(now)
+                    if bucket.tokens >= bucket.capacity:
+                        del buckets[key]
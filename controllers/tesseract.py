@@ -0,0 +1,91 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from controllers.backends import OCRBackend
+from controllers.metrics import timed
+from controllers.preprocess import _init_worker
+from controllers.result import OCRResult
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+# (text, confidence 0..1, (left, top, width, height), line key)
+Word = Tuple[str, float, Tuple[int, int, int, int], Tuple[int, int, int]]
+
+
+def _recognize(image_bytes: bytes, lang: str, config: str) -> List[Word]:
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError("Could not decode image")
+
+    data = pytesseract.image_to_data(image, lang=lang, config=config, output_type=pytesseract.Output.DICT)
+    words = []
+    for i, text in enumerate(data['text']):
+        conf = float(data['conf'][i])
+        if conf < 0 or not text.strip():
+            continue
+        box = (data['left'][i], data['top'][i], data['width'][i], data['height'][i])
+        line = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        words.append((text.strip(), conf / 100, box, line))
+    return words
+
+
+class TesseractOCR(OCRBackend):
+    """Local CPU OCR engine: Tesseract running on a pool of worker processes."""
+
+    name = 'tesseract'
+
+    def __init__(self, lang: str = 'por+eng', max_workers: Optional[int] = None, config: str = '--oem 1 --psm 11'):
+        if pytesseract is None:
+            raise RuntimeError("pytesseract is not installed")
+        self.lang = lang
+        self.config = config
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker
+        )
+
+    @staticmethod
+    def available() -> bool:
+        if pytesseract is None:
+            return False
+        try:
+            pytesseract.get_tesseract_version()
+        except Exception:
+            return False
+        return True
+
+    async def recognize(self, image_bytes: bytes) -> Optional[OCRResult]:
+        loop = asyncio.get_running_loop()
+        with timed('tesseract'):
+            words = await loop.run_in_executor(self._executor, _recognize, image_bytes, self.lang, self.config)
+        return self._result(words) if words else None
+
+    @staticmethod
+    def _result(words: List[Word]) -> OCRResult:
+        """Full text (one line per Tesseract line), each word and the mean confidence."""
+        lines = {}
+        for text, _, _, line in words:
+            lines.setdefault(line, []).append(text)
+
+        confidences = np.array([word[1] for word in words], dtype=np.float32)
+        return OCRResult(
+            "\n".join(" ".join(line) for line in lines.values()),
+            [word[0] for word in words],
+            np.array([word[2] for word in words], dtype=np.int32),
+            confidences,
+            float(confidences.mean())
+        )
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
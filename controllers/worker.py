@@ -0,0 +1,230 @@
+"""OCR worker process: leases jobs from the queue, runs the pipeline and stores each result for the bot.
+
+The bot starts OCR_WORKERS of these itself; more can run on their own,
+pointed at the same OCR_QUEUE_PATH:
+
+    python -m controllers.worker
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+import aiohttp
+from dotenv import load_dotenv
+
+from controllers.jobs import Job, JobQueue, encode_outcome
+from controllers.logs import request_context, setup_logging
+
+if TYPE_CHECKING:
+    from controllers.pipeline import OCRPipeline
+
+logger = logging.getLogger(__name__)
+
+
+class OCRWorker:
+    """Runs up to `concurrency` jobs at a time, keeping each lease alive while its job runs."""
+
+    # Longest wait between lease attempts while the queue keeps failing
+    MAX_BACKOFF = 30.0
+
+    def __init__(self, queue: JobQueue, pipeline: 'OCRPipeline', concurrency: int = 4,
+                 poll_interval: float = 0.5, grace_period: float = 30.0, name: Optional[str] = None):
+        self.queue = queue
+        self.pipeline = pipeline
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.grace_period = grace_period
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.stats = {'completed': 0, 'failed': 0}
+
+    async def run(self, stop: Optional[asyncio.Event] = None):
+        """Processes jobs until `stop` is set, then gives running jobs `grace_period` seconds to finish."""
+        stop = stop or asyncio.Event()
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+
+        def done(task):
+            tasks.discard(task)
+            slots.release()
+
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+            logger.info("Worker %s started", self.name)
+            failures = 0
+            while not stop.is_set():
+                await slots.acquire()
+                try:
+                    job = await self.queue.lease(self.name)
+                except Exception as e:
+                    # E.g. "database is locked": the queue is still there, try again later
+                    slots.release()
+                    failures += 1
+                    delay = min(self.poll_interval * 2 ** failures, self.MAX_BACKOFF)
+                    logger.warning("Worker %s could not lease a job (%s); retrying in %.1fs", self.name, e, delay)
+                    await self._wait(stop, delay)
+                    continue
+                failures = 0
+
+                if job is None:
+                    slots.release()
+                    await self._wait(stop, self.poll_interval)
+                    continue
+
+                task = asyncio.ensure_future(self._process(job, session))
+                tasks.add(task)
+                task.add_done_callback(done)
+
+            # Jobs cut short here are leased again by another worker once their lease expires
+            if tasks:
+                _, pending = await asyncio.wait(tasks, timeout=self.grace_period)
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+            logger.info("Worker %s stopped", self.name)
+
+    @staticmethod
+    async def _wait(stop: asyncio.Event, delay: float):
+        try:
+            await asyncio.wait_for(stop.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _process(self, job: Job, session: aiohttp.ClientSession):
+        # Records logged for this job carry the id of the command that queued it
+        with request_context(job.payload.get('request_id') or f"job-{job.id}"):
+            heartbeat = asyncio.ensure_future(self._heartbeat(job))
+            try:
+                result = await self.handle(job, session)
+            except Exception as e:
+                logger.exception("Job %d (%s) failed on attempt %d", job.id, job.command, job.attempts)
+                self.stats['failed'] += 1
+                await self.queue.fail(job.id, self.name, str(e))
+            else:
+                self.stats['completed'] += 1
+                if not await self.queue.complete(job.id, self.name, result):
+                    logger.warning("Job %d finished after its lease expired; result discarded", job.id)
+            finally:
+                heartbeat.cancel()
+
+    async def _heartbeat(self, job: Job):
+        while True:
+            await asyncio.sleep(self.queue.visibility_timeout / 3)
+            if not await self.queue.extend(job.id, self.name):
+                logger.warning("Lost the lease on job %d", job.id)
+                return
+
+    async def handle(self, job: Job, session: aiohttp.ClientSession) -> dict:
+        """Runs download -> preprocess -> OCR for every attachment of a job."""
+        payload = job.payload
+        guild_id = payload.get('guild_id')
+        admit = self.pipeline.admission(guild_id, payload['author_id'], job.command)
+        mode = payload.get('mode', 'auto')
+
+        if job.command == 'apoiador':
+            # Codes may have been changed through the bot since the last job
+            self.pipeline.codes.refresh()
+            run = lambda image_data: self.pipeline.apoiador_image(image_data, admit, guild_id)
+        elif job.command == 'ocr':
+            run = lambda image_data: self.pipeline.ocr_image(image_data, admit, mode)
+        elif job.command in ('ocr_quality', 'ocr_url'):
+            run = lambda image_data: self.pipeline.ocr_quality(image_data, admit, mode)
+        else:
+            raise ValueError(f"Unknown job command: {job.command}")
+
+        async def work(attachment: dict):
+            image_data = await self.pipeline.download(attachment['url'], session, attachment.get('size'),
+                                                      attachment.get('width'), attachment.get('height'),
+                                                      attachment.get('content_type'))
+            return await run(image_data)
+
+        outcomes = await self.pipeline.process_all(payload['attachments'], work)
+        return {'results': [encode_outcome(outcome) for outcome in outcomes]}
+
+
+def main(quota_share: float = 1.0):
+    # Imported here so the bot can start workers without loading the OCR stack itself
+    from controllers.pipeline import OCRPipeline
+
+    load_dotenv(dotenv_path="./config/.env")
+    setup_logging()
+    # Each worker is a single process; scale with more workers instead of nested pools
+    os.environ.setdefault('OCR_PREPROCESS_WORKERS', '1')
+    os.environ.setdefault('OCR_LOCAL_WORKERS', '1')
+
+    pipeline = OCRPipeline.from_env(quota_share)
+    if pipeline is None:
+        raise SystemExit("No OCR engine configured (GOOGLE_CREDENTIALS_PATH or Tesseract)")
+
+    queue = JobQueue(
+        os.getenv('OCR_QUEUE_PATH', 'ocr_jobs.sqlite3'),
+        visibility_timeout=float(os.getenv('OCR_JOB_LEASE_SECONDS', '120')),
+        max_attempts=int(os.getenv('OCR_JOB_MAX_ATTEMPTS', '3'))
+    )
+    worker = OCRWorker(queue, pipeline, concurrency=int(os.getenv('OCR_WORKER_CONCURRENCY', '4')))
+
+    async def serve():
+        stop = asyncio.Event()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        except (NotImplementedError, AttributeError):
+            pass  # Windows: the process is simply terminated
+        await worker.run(stop)
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.close()
+        queue.close()
+
+
+def start_worker(index: int, count: int) -> multiprocessing.Process:
+    """Starts worker `index` of `count`, with an equal share of the Vision quota."""
+    # Not daemonic: each worker has process pools of its own
+    process = multiprocessing.get_context('spawn').Process(target=main, args=(1 / count,), name=f'ocr-worker-{index}')
+    process.start()
+    return process
+
+
+def start_workers(count: int) -> List[multiprocessing.Process]:
+    """Starts `count` worker processes, each with an equal share of the Vision quota."""
+    return [start_worker(i, count) for i in range(count)]
+
+
+def supervise(processes: List[multiprocessing.Process], start: Callable[[int], multiprocessing.Process],
+              restarts: Dict[int, float], delay: float):
+    """Replaces every process in `processes` that exited with `start(index)`, `delay` seconds later.
+
+    Meant to be called periodically: it never waits, so a pending restart does
+    not hold up the others. `restarts` keeps the scheduled restart times
+    between calls.
+    """
+    now = time.monotonic()
+    for i, process in enumerate(processes):
+        if i in restarts:
+            if now >= restarts[i]:
+                del restarts[i]
+                processes[i] = start(i)
+        elif process.exitcode is not None:
+            logger.warning("%s exited with code %s; restarting in %.0fs", process.name, process.exitcode, delay)
+            restarts[i] = now + delay
+
+
+def stop_workers(processes: List[multiprocessing.Process], timeout: float = 60.0):
+    """Asks the workers to finish their running jobs (SIGTERM) and waits for them to exit."""
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join(timeout=timeout)
+        if process.is_alive():
+            process.kill()
+
+
+if __name__ == '__main__':
+    main()
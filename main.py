@@ -1,21 +1,37 @@
-from controllers.ocr import GoogleOCR
-from controllers.bot import ApoiadorBot
+import argparse
+import sys
+
+from controllers import batch
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Bot do Discord com OCR")
+    parser.add_argument('--shards', default=None,
+                        help="número de shards do gateway, ou 'auto' para usar a recomendação do Discord")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="processos entre os quais os shards são divididos (padrão: 1)")
+    subcommands = parser.add_subparsers(dest='command')
+    batch.add_arguments(subcommands.add_parser('batch', help="OCR em lote de diretórios, globs e listas de URLs"))
+    args = parser.parse_args()
+    if args.shards not in (None, 'auto') and not args.shards.isdigit():
+        parser.error("--shards deve ser um número ou 'auto'")
+    if args.processes < 1:
+        parser.error("--processes deve ser pelo menos 1")
+    return args
+
 
 if __name__ == "__main__":
-    credentials_path = r"googleAPI_key.json"
+    args = parse_args()
 
-    teste = "discord"  
+    if args.command == 'batch':
+        sys.exit(batch.run(args))
 
-    if teste == "googleOCR":
-        ocr_client = GoogleOCR(credentials_path)
-        try:
-            image_url = "https://cdn.discordapp.com/attachments/976244546902040596/1378516116124467251/image.png?ex=683ce2ad&is=683b912d&hm=ac895fe73d3d727e1d34e5a0aeaac3cd64d1a89795d00c8f2ec870783b06f0b2&"
-            ocr_client.process_image_url(image_url)  
-            
-        except Exception as e:
-            print(f"Error: {e}")
-    elif teste == "discord":
-        bot = ApoiadorBot()
+    shard_count = int(args.shards) if args.shards and args.shards != 'auto' else None
+    if args.processes > 1:
+        # Shards divididos entre vários processos, cada um com seu próprio interpretador
+        from controllers.launcher import run_sharded
+        run_sharded(shard_count, args.processes)
+    else:
+        from controllers.bot import ApoiadorBot
+        bot = ApoiadorBot(sharded=args.shards is not None, shard_count=shard_count)
         bot.run()
-
-    